@@ -0,0 +1,79 @@
+# affordability.py
+"""
+Affordability tiers for the price-to-income ratio (Demographia median
+multiple), defined once and shared by every page.
+
+Tiers are lower-bound inclusive:
+    Affordable               < 3.0
+    Moderately Unaffordable  3.0 – 3.9
+    Seriously Unaffordable   4.0 – 4.9
+    Severely Unaffordable    5.0 – 8.9
+    Impossibly Unaffordable  9.0 and over
+"""
+
+import numpy as np
+import pandas as pd
+
+# (name, lower bound) — the lower bound of the next tier is the upper bound
+AFFORDABILITY_TIERS = [
+    ("Affordable", None),
+    ("Moderately Unaffordable", 3.0),
+    ("Seriously Unaffordable", 4.0),
+    ("Severely Unaffordable", 5.0),
+    ("Impossibly Unaffordable", 9.0),
+]
+NA_TIER = "N/A"
+
+TIER_NAMES = [name for name, _ in AFFORDABILITY_TIERS]
+TIER_EDGES = np.array([lower for _, lower in AFFORDABILITY_TIERS[1:]], dtype=float)
+
+AFFORDABILITY_THRESHOLD = float(TIER_EDGES[0])
+
+# name → (lower, upper); None marks an open end
+AFFORDABILITY_CATEGORIES = {
+    name: (lower, AFFORDABILITY_TIERS[i + 1][1] if i + 1 < len(AFFORDABILITY_TIERS) else None)
+    for i, (name, lower) in enumerate(AFFORDABILITY_TIERS)
+}
+
+
+def _range_text(lower, upper) -> str:
+    if lower is None:
+        return f"<{upper:.1f}"
+    if upper is None:
+        return f"≥{lower:.1f}"
+    return f"{lower:.1f}-{upper - 0.1:.1f}"
+
+
+# name → "name (range)", e.g. "Seriously Unaffordable (4.0-4.9)"
+TIER_LABELS = {
+    name: f"{name} ({_range_text(lower, upper)})"
+    for name, (lower, upper) in AFFORDABILITY_CATEGORIES.items()
+}
+
+
+def classify_codes(ratios) -> np.ndarray:
+    """
+    Tier index per ratio (0 = Affordable … 4 = Impossibly Unaffordable,
+    len(TIER_NAMES) for missing values), via one searchsorted over the edges.
+    """
+    values = np.asarray(ratios, dtype=float)
+    codes = np.searchsorted(TIER_EDGES, values, side="right")
+    codes[np.isnan(values)] = len(TIER_NAMES)
+    return codes
+
+
+def classify_affordability(ratios, labels: bool = False):
+    """
+    Classify price-to-income ratios into affordability tiers.
+
+    Returns an ordered categorical (tier names, or "name (range)" labels
+    when labels=True, plus "N/A" for missing ratios). A Series input gives
+    a Series back on the same index.
+    """
+    names = [TIER_LABELS[n] for n in TIER_NAMES] if labels else list(TIER_NAMES)
+    cat = pd.Categorical.from_codes(
+        classify_codes(ratios), categories=names + [NA_TIER], ordered=True
+    )
+    if isinstance(ratios, pd.Series):
+        return pd.Series(cat, index=ratios.index, name=ratios.name)
+    return cat
@@ -6,12 +6,12 @@ import numpy as np
 import plotly.express as px
 import json
 import os
-import time 
 
 # --- RESTORED IMPORTS ---
-from zip_module import load_city_zip_data, get_zip_coordinates
-from dataprep import load_data, make_city_view_data, RATIO_COL, AFFORDABILITY_THRESHOLD, apply_income_filter, AFFORDABILITY_CATEGORIES, AFFORDABILITY_COLORS, classify_affordability, make_zip_view_data
-from ui_components import income_control_panel, render_manual_input_and_summary, persona_income_slider
+from zip_module import get_income_sweep_index, MAX_ZIP_RATIO_CLIP
+from dataprep import load_data, make_city_view_data, make_history_overview, make_income_required_curves, get_income_curve, affordable_share_at_income, income_for_share, RATIO_COL, AFFORDABILITY_THRESHOLD, apply_income_filter, AFFORDABILITY_CATEGORIES, AFFORDABILITY_COLORS, classify_affordability, make_zip_view_data
+from affordability import TIER_LABELS
+from ui_components import income_control_panel, render_manual_input_and_summary, persona_income_slider, render_income_required_curve, mortgage_settings
 
 
 # ---------- Global config ----------
@@ -29,11 +29,11 @@ st.markdown(
             <strong>Median Sale Price / Per Capita Income</strong>
     </span><br>
     <small>Lower ratios indicate better affordability. 
-    In this dashboard, cities with a ratio &le; 3.0 are classified as <strong>"Affordable"</strong>.
-    Those with a ratio between 3.1 to 4.0 inclusive are classified as <strong>"Moderately Unaffordable"</strong>.
-    Those with a ratio between 4.1 to 5.0 inclusive are classified as <strong>"Seriously Unaffordable"</strong>.
-    Those with a ratio between 5.1 to 8.9 inclusive are classified as <strong>"Severely Unaffordable"</strong>.
-    Those with a ratios &ge; are classified as <strong>"Impossibly Unaffordable"</strong></small>.
+    In this dashboard, cities with a ratio below 3.0 are classified as <strong>"Affordable"</strong>.
+    Those with a ratio from 3.0 to 3.9 are classified as <strong>"Moderately Unaffordable"</strong>.
+    Those with a ratio from 4.0 to 4.9 are classified as <strong>"Seriously Unaffordable"</strong>.
+    Those with a ratio from 5.0 to 8.9 are classified as <strong>"Severely Unaffordable"</strong>.
+    Those with a ratio of 9.0 or more are classified as <strong>"Impossibly Unaffordable"</strong></small>.
     </div>
     """,
     unsafe_allow_html=True
@@ -52,7 +52,6 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-MAX_ZIP_RATIO_CLIP = 15.0
 
 
 # ---------- Function Definitions ----------
@@ -81,53 +80,6 @@ def year_selector(df: pd.DataFrame, key: str):
 def get_data_cached():
     return load_data()
 
-@st.cache_data
-def calculate_median_ratio_history(dataframe):
-    years = sorted(dataframe["year"].unique())
-    history_data = []
-    for yr in years:
-        city_data_yr = make_city_view_data(dataframe, annual_income=0, year=yr, budget_pct=30)
-        if not city_data_yr.empty and RATIO_COL in city_data_yr.columns:
-            median_ratio = city_data_yr[RATIO_COL].median()
-            history_data.append({"year": yr, "median_ratio": median_ratio})
-    return pd.DataFrame(history_data)
-
-@st.cache_data
-def calculate_category_proportions_history(dataframe):
-    """Calculates the % composition of affordability tiers over time."""
-    years = sorted(dataframe["year"].unique())
-    history_data = []
-    
-    def classify_strict(ratio):
-        if ratio < 3.0: return "Affordable (<3.0)"
-        elif ratio <= 4.0: return "Moderately Unaffordable (3.1-4.0)"
-        elif ratio <= 5.0: return "Seriously Unaffordable (4.1-5.0)"
-        elif ratio <= 9.0: return "Severely Unaffordable (5.1-9.0)" 
-        else: return "Impossibly Unaffordable (>9.0)"
-
-    category_order = [
-        "Affordable (<3.0)", 
-        "Moderately Unaffordable (3.1-4.0)", 
-        "Seriously Unaffordable (4.1-5.0)", 
-        "Severely Unaffordable (5.1-9.0)", 
-        "Impossibly Unaffordable (>9.0)"
-    ]
-
-    for yr in years:
-        city_data_yr = make_city_view_data(dataframe, annual_income=0, year=yr, budget_pct=30)
-        if not city_data_yr.empty and RATIO_COL in city_data_yr.columns:
-            city_data_yr["cat"] = city_data_yr[RATIO_COL].apply(classify_strict)
-            counts = city_data_yr["cat"].value_counts(normalize=True) * 100
-            for cat in category_order:
-                history_data.append({
-                    "year": yr,
-                    "category": cat,
-                    "percentage": counts.get(cat, 0.0)
-                })
-
-    return pd.DataFrame(history_data)
-
-
 # ---------- Load data ----------
 df = get_data_cached()
 if df.empty:
@@ -151,8 +103,8 @@ max_affordable_price = AFFORDABILITY_THRESHOLD * final_income
 df_filtered_by_income = apply_income_filter(df, final_income)
 
 # Calculate Histories
-df_history = calculate_median_ratio_history(df)
-df_prop_history = calculate_category_proportions_history(df)
+df_history, df_prop_history = make_history_overview(df)
+income_curves = make_income_required_curves(df)
 
 
 # --- [FIX 1] CUSTOM DIVIDER TO REPLACE '---' (REMOVES WHITESPACE) ---
@@ -196,7 +148,7 @@ city_data = make_city_view_data(
 
 # 4. Apply Column Fixes
 if not city_data.empty:
-    city_data["affordability_rating"] = city_data[RATIO_COL].apply(classify_affordability)
+    city_data["affordability_rating"] = classify_affordability(city_data[RATIO_COL])
     gap = city_data[RATIO_COL] - AFFORDABILITY_THRESHOLD
     dist = gap.abs()
     city_data["gap_for_plot"] = np.where(city_data["affordable"], dist, -dist)
@@ -211,7 +163,36 @@ with main_col_left:
     profile_settings_container = st.container(border=True)
     with profile_settings_container:
         st.markdown("### Your Profile & Budget Settings")
-        render_manual_input_and_summary(final_income, persona, max_affordable_price)
+        with st.expander("🏦 Mortgage assumptions", expanded=False):
+            mortgage_scenario = mortgage_settings("d3_mortgage")
+        render_manual_input_and_summary(final_income, persona, max_affordable_price, mortgage_scenario)
+
+        with st.expander("📈 Income needed to afford each ZIP", expanded=False):
+            curve_metro_pairs = (
+                income_curves[income_curves["year"] == selected_year][["city_geojson_code", "city_full"]]
+                .drop_duplicates()
+                .sort_values("city_full")
+            )
+            if curve_metro_pairs.empty:
+                st.caption(f"No ZIP-level prices available for {selected_year}.")
+            else:
+                curve_metro_full = st.selectbox(
+                    "Metro area",
+                    options=curve_metro_pairs["city_full"].tolist(),
+                    key="income_curve_metro",
+                )
+                curve_code = curve_metro_pairs.loc[
+                    curve_metro_pairs["city_full"] == curve_metro_full, "city_geojson_code"
+                ].iloc[0]
+                curve = get_income_curve(income_curves, curve_code, selected_year)
+                render_income_required_curve(
+                    curve, final_income, curve_metro_full,
+                    affordable_share_at_income(curve, final_income),
+                )
+                st.caption(
+                    f"Income needed for half of the ZIPs: **${income_for_share(curve, 50):,.0f}** · "
+                    f"for 90%: **${income_for_share(curve, 90):,.0f}**"
+                )
 
     st.markdown("#### Metro Area Affordability Ranking")
 
@@ -350,89 +331,79 @@ with main_col_right:
                 f'</div>', 
                 unsafe_allow_html=True
             )
-            time.sleep(0.5) 
 
-        # Load Map Data
-        df_zip = load_city_zip_data(city_clicked, df_full=df_filtered_by_income, max_pci=final_income)
-        
-        if "year" in df_zip.columns:
-            df_zip = df_zip[df_zip["year"] == selected_year].copy() 
+        # Load Map Data: ZIPs of this metro/year with income <= the user's income
+        zip_index = get_income_sweep_index()
+        df_zip_map = zip_index.zips_within_income(city_clicked, selected_year, final_income).copy()
+        price_col = "median_sale_price"
+        income_col = "per_capita_income"
 
-        if df_zip.empty:
+        if df_zip_map.empty:
             if should_trigger_spinner: loading_message_placeholder.empty()
             st.error("No ZIP-level data available for this city/year.")
         else:
-            df_zip_map = get_zip_coordinates(df_zip) 
-            price_col = "median_sale_price"
-            income_col = "per_capita_income"
+            n_affordable, n_zips = zip_index.affordable_count(city_clicked, selected_year, max_affordable_price)
+            st.caption(
+                f"{n_affordable} of {n_zips} ZIP codes in this metro have a median sale price "
+                f"below your max affordable price (${max_affordable_price:,.0f})."
+            )
+
+            geojson_path = os.path.join(
+                os.path.dirname(__file__),
+                "city_geojson",
+                f"{city_clicked}.geojson", 
+            )
 
-            if df_zip_map.empty or price_col not in df_zip_map.columns:
+            if not os.path.exists(geojson_path):
                 if should_trigger_spinner: loading_message_placeholder.empty()
-                st.error("Map data processing failed.")
+                st.error(f"GeoJSON file not found for {city_clicked}. Expected path: {geojson_path}")
             else:
-                if RATIO_COL not in df_zip_map.columns:
-                    denom_zip = df_zip_map[income_col].replace(0, np.nan)
-                    df_zip_map[RATIO_COL] = df_zip_map[price_col] / denom_zip
-                
-                df_zip_map["affordability_rating"] = df_zip_map[RATIO_COL].apply(classify_affordability)
-                df_zip_map["ratio_for_map"] = df_zip_map[RATIO_COL].clip(0, MAX_ZIP_RATIO_CLIP)
-
-                geojson_path = os.path.join(
-                    os.path.dirname(__file__),
-                    "city_geojson",
-                    f"{city_clicked}.geojson", 
+                with open(geojson_path, "r") as f:
+                    zip_geojson = json.load(f)
+
+                # --- FIX START: FORCE STRING FORMAT WITH LEADING ZEROS ---
+                # Boston ZIPs are 02xxx. Integers (2xxx) won't match GeoJSON ("02xxx").
+                df_zip_map["zip_str_padded"] = df_zip_map["zip_code_int"].astype(str).str.zfill(5)
+                # --- FIX END --------------------------------------------
+
+                fig_map = px.choropleth_mapbox(
+                    df_zip_map,
+                    geojson=zip_geojson,
+                    locations="zip_str_padded", # UPDATED: Use the padded string column
+                    featureidkey="properties.ZCTA5CE10",
+                    color="ratio_for_map", 
+                    color_continuous_scale="RdYlGn_r",
+                    range_color=[0, MAX_ZIP_RATIO_CLIP],
+                    hover_name="zip_code_str",
+                    hover_data={
+                        price_col: ":,.0f",
+                        income_col: ":,.0f",
+                        RATIO_COL: ":.2f",
+                        "affordability_rating": True,
+                    },
+                    mapbox_style="carto-positron",
+                    center={
+                        "lat": df_zip_map["lat"].mean(),
+                        "lon": df_zip_map["lon"].mean(),
+                    },
+                    zoom=10,
+                    height=520,
                 )
 
-                if not os.path.exists(geojson_path):
-                    if should_trigger_spinner: loading_message_placeholder.empty()
-                    st.error(f"GeoJSON file not found for {city_clicked}. Expected path: {geojson_path}")
-                else:
-                    with open(geojson_path, "r") as f:
-                        zip_geojson = json.load(f)
-
-                    # --- FIX START: FORCE STRING FORMAT WITH LEADING ZEROS ---
-                    # Boston ZIPs are 02xxx. Integers (2xxx) won't match GeoJSON ("02xxx").
-                    df_zip_map["zip_str_padded"] = df_zip_map["zip_code_int"].astype(str).str.zfill(5)
-                    # --- FIX END --------------------------------------------
-
-                    fig_map = px.choropleth_mapbox(
-                        df_zip_map,
-                        geojson=zip_geojson,
-                        locations="zip_str_padded", # UPDATED: Use the padded string column
-                        featureidkey="properties.ZCTA5CE10",
-                        color="ratio_for_map", 
-                        color_continuous_scale="RdYlGn_r",
-                        range_color=[0, MAX_ZIP_RATIO_CLIP],
-                        hover_name="zip_code_str",
-                        hover_data={
-                            price_col: ":,.0f",
-                            income_col: ":,.0f",
-                            RATIO_COL: ":.2f",
-                            "affordability_rating": True,
-                        },
-                        mapbox_style="carto-positron",
-                        center={
-                            "lat": df_zip_map["lat"].mean(),
-                            "lon": df_zip_map["lon"].mean(),
-                        },
-                        zoom=10,
-                        height=520,
-                    )
-
-                    fig_map.update_layout(
-                        margin=dict(l=0, r=0, t=0, b=0),
-                        coloraxis_colorbar=dict(
-                            title="Price-to-income ratio",
-                            tickformat=".1f",
-                        ),
-                    )
-                    
-                    if should_trigger_spinner: loading_message_placeholder.empty() 
+                fig_map.update_layout(
+                    margin=dict(l=0, r=0, t=0, b=0),
+                    coloraxis_colorbar=dict(
+                        title="Price-to-income ratio",
+                        tickformat=".1f",
+                    ),
+                )
+                
+                if should_trigger_spinner: loading_message_placeholder.empty() 
 
-                    st.plotly_chart(fig_map, use_container_width=True, config={"scrollZoom": True})
-                    
-                    st.session_state.last_drawn_city = selected_map_metro_full 
-                    st.session_state.last_drawn_income = final_income
+                st.plotly_chart(fig_map, use_container_width=True, config={"scrollZoom": True})
+                
+                st.session_state.last_drawn_city = selected_map_metro_full 
+                st.session_state.last_drawn_income = final_income
 
         # --- CITY SNAPSHOT DETAILS ---
         st.markdown("")
@@ -556,11 +527,11 @@ with st.container(border=True):
         st.markdown("##### Distribution of Affordability Categories Over Time")
         
         custom_colors = {
-            "Affordable (<3.0)": "green",
-            "Moderately Unaffordable (3.1-4.0)": "#FFD700",
-            "Seriously Unaffordable (4.1-5.0)": "orange",
-            "Severely Unaffordable (5.1-9.0)": "red",
-            "Impossibly Unaffordable (>9.0)": "maroon"
+            TIER_LABELS["Affordable"]: "green",
+            TIER_LABELS["Moderately Unaffordable"]: "#FFD700",
+            TIER_LABELS["Seriously Unaffordable"]: "orange",
+            TIER_LABELS["Severely Unaffordable"]: "red",
+            TIER_LABELS["Impossibly Unaffordable"]: "maroon"
         }
 
         fig_prop = px.line(
@@ -8,23 +8,80 @@ import numpy as np
 import geopandas as gpd
 import plotly.express as px
 import streamlit.components.v1 as components
+from streamlit.errors import StreamlitAPIException
 
 from config_data import (
     get_global_theme_css,
     get_dynamic_css,
     get_colorscale,
     load_all_data,
-    compute_pti,
-    compute_rankings,
-    get_metro_yoy,
+    load_affordability_data,
     US_BOUNDS,
     US_CENTER_LAT,
     US_CENTER_LON,
     US_ZOOM_LEVEL,
 )
 from geo_utils import load_cbsa_shapes, load_zcta_shapes, get_zip_polygons_for_metro
-from charts import create_city_choropleth, create_zip_choropleth, create_history_chart
+from charts import (
+    create_city_choropleth,
+    create_zip_choropleth,
+    create_history_chart,
+    create_rank_history_chart,
+    apply_map_theme,
+    set_zip_highlight,
+)
+from figure_cache import get_figure_cache, frame_fingerprint
+from map_component import choropleth_map, geometry_version
+from prefetch import PREFETCH_METROS, likely_next, record_visit, session_prefetch
+from warmup import start_warmup
+from mortgage import DEFAULT_SCENARIO, MORTGAGE_METRIC, mortgage_metric
+from ui_components import mortgage_settings
+from panel import (
+    metric_short_name,
+    format_metric_value,
+    change_map_label,
+    get_year_pair_changes,
+    rate_scenario_table,
+    get_metro_yoy,
+    get_zip_detail_table,
+    get_zip_history,
+    attach_ranks,
+    get_rank_history,
+    top_k,
+    prepare_year_frames,
+)
+from projections import (
+    PROJECTION_MODELS,
+    PROJECTION_HORIZON,
+    DEFAULT_DAMPING,
+    get_projection,
+    get_zip_projection,
+)
+from trends import (
+    TREND_STATS,
+    get_trend_table,
+    get_trend_row,
+    trend_map_label,
+    with_trend_values,
+)
+from similarity import DEFAULT_NEIGHBORS, find_similar_zips
+from monthly import get_zip_monthly_history
+from clusters import (
+    cluster_map_label,
+    cluster_summary,
+    get_cluster_table,
+    metros_in_cluster,
+)
 from events import extract_city_from_event, extract_zip_from_event
+from spatial_index import (
+    build_hit_index,
+    load_zip_adjacency,
+    get_zip_centroid_index,
+    search_affordable_within_radius,
+)
+from affordability import AFFORDABILITY_THRESHOLD
+
+COVID_CHANGE_YEARS = (2020, 2021)
 
 # =========================================================================
 # 1. Page config
@@ -35,6 +92,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Loads shapes and tables concurrently on the process's first run; the
+# sections below wait only on what they use
+warmup = start_warmup()
+
 # =========================================================================
 # 2. Sidebar theme controls (must come before CSS + layout)
 # =========================================================================
@@ -118,83 +179,212 @@ def render_single_metro_trend(metro_name, ratio_agg, is_dark_mode, selected_year
     st.plotly_chart(fig, use_container_width=True)
 
 
-@st.cache_data(show_spinner="Loading required data...")
-def load_affordability_data():
-    df = pd.read_csv("data/house_ts_agg.csv")
-    df = df.fillna(0)
-
-    # Price to Income Data Preparation
-    df["Price_Income_Ratio"] = df["median_sale_price"] / df["per_capita_income"]
+def render_radius_search(df_city_map, selected_year):
+    """'What can I afford within N miles?' search across metro boundaries."""
+    with st.expander("📍 What Can I Afford Nearby?", expanded=False):
+        col_a, col_b, col_c = st.columns([2, 1, 1])
+        with col_a:
+            center_mode = st.radio(
+                "Center on", ["Metro", "ZIP code"], horizontal=True, key="radius_center_mode"
+            )
+            if center_mode == "Metro":
+                metro_options = df_city_map.sort_values("city_full")["city_full"].tolist()
+                center_metro = st.selectbox("Metro", metro_options, key="radius_metro")
+                center_row = df_city_map[df_city_map["city_full"] == center_metro].iloc[0]
+                center = (float(center_row["lon"]), float(center_row["lat"]))
+            else:
+                center_zip = st.text_input("ZIP code", max_chars=5, key="radius_zip")
+                center = None
+        with col_b:
+            radius_miles = st.slider("Radius (miles)", 1, 100, 20, key="radius_miles")
+        with col_c:
+            radius_income = st.number_input(
+                "Annual income ($)",
+                min_value=20000,
+                max_value=500000,
+                value=84000,
+                step=1000,
+                key="radius_income",
+            )
 
-    ratio_agg = (
-        df.groupby(["city_full", "year"], as_index=False).agg(
-            {
-                "Price_Income_Ratio": "median",
-                "median_sale_price": "median",
-                "per_capita_income": "median",
-            }
+        zip_index = get_zip_centroid_index()
+        if center is None:
+            center = zip_index.centroid_of(center_zip.strip().zfill(5)) if center_zip else None
+            if center is None:
+                st.caption("Enter a ZIP code in the dataset to search around it.")
+                return
+
+        results = search_affordable_within_radius(
+            zip_index,
+            center[0],
+            center[1],
+            radius_miles,
+            selected_year,
+            radius_income,
+            AFFORDABILITY_THRESHOLD,
         )
-    )
-
-    ratio_agg["Affordability"] = [""] * len(ratio_agg)
-    for i in range(len(ratio_agg)):
-        ratio = ratio_agg["Price_Income_Ratio"][i]
-        # Fix ChainedAssignmentError that comes up.
-        if 0.0 <= ratio < 3.0:
-            # ratio_agg["Affordability"][i] = "Affordable"
-            ratio_agg.loc[i, "Affordability"] = "Affordable"
-        elif 3.0 <= ratio < 4.0:
-            # ratio_agg["Affordability"][i] = "Moderately Unaffordable"
-            ratio_agg.loc[i, "Affordability"] = "Moderately Unaffordable"
-        elif 4.0 <= ratio < 5.0:
-            # ratio_agg["Affordability"][i] = "Seriously Unaffordable"
-            ratio_agg.loc[i, "Affordability"] = "Seriously Unaffordable"
-        elif 5.0 <= ratio < 9.0:
-            # ratio_agg["Affordability"][i] = "Severly Unaffordable"
-            ratio_agg.loc[i, "Affordability"] = "Severely Unaffordable"
-        elif ratio >= 9.0:
-            # ratio_agg["Affordability"][i] = "Impossibly Unaffordable"
-            ratio_agg.loc[i, "Affordability"] = "Impossibly Unaffordable"
-
-    city_order = sorted(df["city_full"].unique())
-
-    # COVID-19 Price Changes Data Preparation
-    prices_agg = (
-        df.groupby(["city_full", "year"], as_index=False).agg(
-            {"median_sale_price": "median"}
+        if results.empty:
+            st.info(f"No ZIPs with {selected_year} data within {radius_miles} miles.")
+            return
+
+        n_afford = int(results["affordable"].sum())
+        st.caption(
+            f"**{n_afford}** of {len(results)} ZIPs within {radius_miles} miles have a "
+            f"median sale price below {AFFORDABILITY_THRESHOLD:.0f}× your income "
+            f"(${AFFORDABILITY_THRESHOLD * radius_income:,.0f}) in {selected_year}."
         )
-    )
+        st.dataframe(
+            results[
+                ["zip_code_str", "city_full", "distance_mi", "median_sale_price", "PTI", "affordable"]
+            ].rename(
+                columns={
+                    "zip_code_str": "ZIP",
+                    "city_full": "Metro",
+                    "distance_mi": "Miles",
+                    "median_sale_price": "Median Price",
+                    "affordable": "Affordable",
+                }
+            ),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Median Price": st.column_config.NumberColumn(format="$%d"),
+                "PTI": st.column_config.NumberColumn(format="%.2fx"),
+            },
+        )
+
 
-    prices_year = pd.pivot(
-        prices_agg, index=["city_full"], columns="year", values="median_sale_price"
+@st.cache_resource(show_spinner=False, max_entries=32)
+def prepare_zip_frames(selected_city, selected_year, metric_type, _zcta_shapes):
+    """
+    ZIP rows (ranked within the metro) and ZIP polygons of one metro for
+    the year × metric. Cached so that a prefetched drill-down (see
+    prefetch_zip_view) is ready when the user opens the metro. Both frames
+    come back as returned by get_zip_polygons_for_metro when there is
+    nothing to draw.
+
+    Shared, not copied per hit (the polygons would be unpickled on every
+    fragment rerun): callers must treat both frames as read-only.
+    """
+    df_zip_metric = prepare_year_frames(selected_year, metric_type)[0]
+    zip_df_city, gdf_merge = get_zip_polygons_for_metro(
+        selected_city, _zcta_shapes, df_zip_metric
     )
-    prices_year = prices_year.reset_index()
-    prices_year.columns = prices_year.columns.astype(str)
+    if gdf_merge.empty or zip_df_city.empty:
+        return zip_df_city, gdf_merge
+
+    # Only keep ZIPs that have metric values
+    zip_df_city = zip_df_city[zip_df_city["metric_value"].notna()].copy()
+
+    # Only keep ZIPs that appear in the polygon GeoDataFrame
+    valid_zips = gdf_merge["zip_code_str"].unique()
+    zip_df_city = zip_df_city[zip_df_city["zip_code_str"].isin(valid_zips)].copy()
+
+    # Rankings at ZIP level (within this metro), precomputed per year
+    if not zip_df_city.empty:
+        zip_df_city = attach_ranks(zip_df_city, "zip", metric_type, selected_year)
+    gdf_merge["city"] = selected_city
+    return zip_df_city, gdf_merge
 
-    # 2020–2021 percent change
-    prices_year["2020_2021_Percent_Change"] = (
-        (prices_year["2021"] - prices_year["2020"]) / prices_year["2020"] * 100
+
+def render_cluster_summary(level, metric_type):
+    """Legend of the cluster map mode: size, growth and typical members."""
+    summary = cluster_summary(level, metric_type)
+    if summary.empty:
+        return
+    st.dataframe(
+        summary.rename(
+            columns={
+                "cluster": "Cluster",
+                "members": "Metros" if level == "metro" else "ZIPs",
+                "growth_pct": "Growth",
+                "examples": "Most typical",
+            }
+        ),
+        hide_index=True,
+        use_container_width=True,
+        column_config={"Growth": st.column_config.NumberColumn(format="%+.0f%%")},
+    )
+    st.caption(
+        "Clusters group areas by the shape of their yearly values (growth since the "
+        "first year), numbered from fastest to slowest overall growth."
     )
-    prices_year = prices_year.sort_values(
-        by="2020_2021_Percent_Change", ascending=False
+
+
+def _compare_metros(metros):
+    """Replace the multi-metro comparison selection (button callback)."""
+    st.session_state["compare_metros"] = metros
+
+
+def _compare_lassoed_metros(points, city_order):
+    """Compare the metros lassoed on the metro map (map callback)."""
+    picked = {p["customdata"][1] for p in points if p.get("customdata")}
+    metros = [c for c in city_order if c in picked]
+    if metros:
+        _compare_metros(metros)
+
+
+def _keep_lassoed_zips(points):
+    """Remember the ZIPs lassoed on the ZIP map (map callback)."""
+    st.session_state["zip_lasso"] = sorted(
+        {str(p["customdata"][0]) for p in points if p.get("customdata")}
     )
 
-    return ratio_agg, city_order, prices_year
 
+def render_affordability_controls(city_order, metric_type):
+    st.markdown("#### Select Metropolitan Areas")
 
-def render_affordability_sidebar(city_order):
-    st.header("Select Metropolitan Area")
+    # Shortcut: compare every metro of one trajectory cluster
+    summary = cluster_summary("metro", metric_type)
+    clusters = get_cluster_table("metro", metric_type)
+    if not summary.empty:
+        cluster_names = {
+            row.cluster: f"Cluster {row.cluster} · {row.members} metros · {row.growth_pct:+.0f}%"
+            for row in summary.itertuples()
+        }
+        cluster_pick = st.selectbox(
+            "Trajectory cluster",
+            list(cluster_names),
+            format_func=cluster_names.get,
+            help=f"Metros whose {metric_type} moved alike over the years",
+        )
+        members = clusters.loc[clusters["cluster"] == cluster_pick, "city_full"]
+        st.button(
+            "🧩 Compare metros in this cluster",
+            on_click=_compare_metros,
+            args=([c for c in city_order if c in set(members)],),
+            use_container_width=True,
+        )
+
+    st.session_state.setdefault("compare_metros", city_order[:5])
     selected_cities = st.multiselect(
         "Metropolitan Areas",
         options=city_order,
-        default=city_order[:5],
+        key="compare_metros",
     )
 
     show_legend = st.checkbox("Show Legend", value=True)
     return selected_cities, show_legend
 
 
-def render_affordability_dashboard(selected_cities, show_legend, ratio_agg, prices_year):
+@st.fragment
+def render_comparison_dashboard(
+    city_order, metric_type, ratio_agg, prices_year, change_years=COVID_CHANGE_YEARS
+):
+    """
+    Metro pickers and comparison charts in one fragment: changing the
+    selection reruns only this section, not the maps above it.
+    """
+    with st.expander("🏙️ Metros to compare", expanded=True):
+        selected_cities, show_legend = render_affordability_controls(city_order, metric_type)
+    render_affordability_dashboard(
+        selected_cities, show_legend, ratio_agg, prices_year, change_years
+    )
+
+
+def render_affordability_dashboard(
+    selected_cities, show_legend, ratio_agg, prices_year, change_years=COVID_CHANGE_YEARS
+):
     with st.expander("ℹ️ How to Interact with This Dashboard", expanded=False):
         st.markdown(
             """
@@ -218,7 +408,7 @@ def render_affordability_dashboard(selected_cities, show_legend, ratio_agg, pric
 
     st.info(
         "📈 **Multi-Metro Comparison** · "
-        "Hover for details · Select metros in left panel"
+        "Hover for details · Select metros above"
     )
 
     if len(selected_cities) == 0:
@@ -374,15 +564,25 @@ def render_affordability_dashboard(selected_cities, show_legend, ratio_agg, pric
     )
 
     # ====================================
-    # COVID-19 Price Changes Visualization
+    # Price Changes Between Two Years (COVID 2020–2021 by default)
     # ====================================
-    covid_changes = prices_year[prices_year["city_full"].isin(selected_cities)]
+    start_year, end_year = change_years
+    is_covid = (start_year, end_year) == COVID_CHANGE_YEARS
+    start_col, end_col = str(start_year), str(end_year)
+    covid_changes = prices_year[prices_year["city_full"].isin(selected_cities)].copy()
+    if start_col in covid_changes.columns and end_col in covid_changes.columns:
+        covid_changes["Percent_Change"] = (
+            (covid_changes[end_col] - covid_changes[start_col]) / covid_changes[start_col] * 100
+        )
+    else:
+        covid_changes["Percent_Change"] = np.nan
+    covid_changes = covid_changes.sort_values(by="Percent_Change", ascending=False)
 
     covid_change_fig = px.bar(
         covid_changes,
         y="city_full",
-        x="2020_2021_Percent_Change",
-        title="Covid Price Changes (2020-2021)",
+        x="Percent_Change",
+        title=f"Price Changes ({start_year}-{end_year})",
         orientation="h",
         color="city_full",
         color_discrete_map=color_map,
@@ -401,7 +601,7 @@ def render_affordability_dashboard(selected_cities, show_legend, ratio_agg, pric
         title={
             "text": (
                 "Selected Metro Areas:<br>Housing Price Percent Changes"
-                "<br>During Covid (2020-2021)"
+                + ("<br>During Covid (2020-2021)" if is_covid else f"<br>{start_year}-{end_year}")
             ),
             "font": {"size": 20},
         },
@@ -429,16 +629,538 @@ def render_affordability_dashboard(selected_cities, show_legend, ratio_agg, pric
             "Demographia-International-Housing-Affordability-2025-Edition.pdf)).*"
         )
     with col2:
-        st.write(
-            "During the COVID-19 pandemic, U.S. cities experienced sharp increases in housing prices. "
-            "The bar graph below illustrates the percent change in housing prices from 2020 to 2021 in selected cities."
-        )
+        if is_covid:
+            st.write(
+                "During the COVID-19 pandemic, U.S. cities experienced sharp increases in housing prices. "
+                "The bar graph below illustrates the percent change in housing prices from 2020 to 2021 in selected cities."
+            )
+        else:
+            st.write(
+                f"The bar graph below illustrates the percent change in housing prices "
+                f"from {start_year} to {end_year} in selected cities."
+            )
         st.plotly_chart(covid_change_fig, use_container_width=True)
 
 
+def _rerun_fragment():
+    """Rerun the running fragment (a full rerun if the whole script is running)."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+def similar_zip_matches(selected_city, selected_zip, metric_type, selected_year):
+    """Similar-trajectory ZIPs of the selected ZIP, and the ones inside its metro."""
+    similar_zips = pd.DataFrame()
+    if selected_zip:
+        similar_zips = find_similar_zips(
+            selected_city,
+            selected_zip,
+            metric_type,
+            selected_year,
+            st.session_state.get("similar_n", DEFAULT_NEIGHBORS),
+        )
+    similar_in_metro = (
+        similar_zips.loc[similar_zips["city"] == selected_city, "zip_code_str"].tolist()
+        if not similar_zips.empty
+        else []
+    )
+    return similar_zips, similar_in_metro
+
+
+def zip_map_figure(selected_city, selected_year, map_metric_label, gdf_map, zip_df_city, map_style):
+    """The metro's ZIP choropleth and its polygons, through the figure cache."""
+    return get_figure_cache().get_or_build(
+        (
+            "zip",
+            selected_city,
+            selected_year,
+            map_metric_label,
+            frame_fingerprint(gdf_map, ["zip_code_str", "metric_value", "rank"]),
+        ),
+        lambda: create_zip_choropleth(
+            gdf_map,
+            map_style,
+            None,
+            zip_df_city,
+            map_metric_label,
+        ),
+    )
+
+
+def prefetch_zip_view(selected_city, selected_year, metric_type, map_metric_label, map_style):
+    """
+    Prefetch steps of a metro's ZIP view: shapes, frames, detail table
+    and, when the map is colored by the selected year, the map figure and
+    its hit index. Run on the prefetch pool, so no st.* output here.
+    """
+    frames = {}
+
+    def load_frames():
+        frames["zip"], frames["gdf"] = prepare_zip_frames(
+            selected_city, selected_year, metric_type, load_zcta_shapes()
+        )
+
+    def load_detail():
+        if not frames["zip"].empty:
+            get_zip_detail_table(
+                selected_city, selected_year, metric_type, tuple(frames["zip"]["zip_code_str"])
+            )
+
+    def build_map():
+        if frames["zip"].empty or frames["gdf"].empty or map_metric_label != metric_type:
+            return
+        gdf_map = attach_ranks(frames["gdf"], "zip", metric_type, selected_year)
+        _, gdf_zip = zip_map_figure(
+            selected_city, selected_year, map_metric_label, gdf_map, frames["zip"], map_style
+        )
+        if gdf_zip is not None:
+            build_hit_index(
+                gdf_zip,
+                "zip_code_str",
+                geometry_version(f"zip_{selected_city}", gdf_zip, "zip_code_str"),
+            )
+
+    return [load_zcta_shapes, load_frames, load_detail, build_map]
+
+
+@st.fragment
+def render_zip_explorer(
+    selected_city,
+    selected_year,
+    metric_type,
+    metric_choice,
+    map_metric_label,
+    map_style,
+    is_dark_mode,
+    map_by_cluster,
+    gdf_map,
+    zip_df_city,
+    zip_detail,
+    zip_pti_year,
+    trend_start,
+    trend_end,
+    projection_model,
+    projection_damping,
+    mortgage_scenario,
+):
+    """
+    ZIP map and detail card of one metro. A fragment: ZIP clicks and the
+    lasso rerun only this (a cached figure plus a patch), not the data
+    preparation and metro summary around it.
+    """
+    if st.session_state.get("selected_zip") is None and not zip_df_city.empty:
+        st.session_state["selected_zip"] = zip_df_city["zip_code_str"].iloc[0]
+
+    # Similar trajectories of the selected ZIP, found before drawing the
+    # map so matches inside this metro can be outlined on it
+    _, similar_in_metro = similar_zip_matches(
+        selected_city, st.session_state.get("selected_zip"), metric_type, selected_year
+    )
+
+    col_map, col_detail = st.columns([2.2, 1])
+
+    with col_map:
+        figure_cache = get_figure_cache()
+        fig_zip, gdf_zip = zip_map_figure(
+            selected_city, selected_year, map_metric_label, gdf_map, zip_df_city, map_style
+        )
+        if fig_zip is not None and gdf_zip is not None:
+            zip_version = geometry_version(f"zip_{selected_city}", gdf_zip, "zip_code_str")
+            with figure_cache.checkout():
+                apply_map_theme(fig_zip, map_metric_label, is_dark_mode, "zip", map_style)
+                set_zip_highlight(fig_zip, gdf_zip, similar_in_metro)
+                event = choropleth_map(
+                    fig_zip,
+                    zip_version,
+                    key="zip_map",
+                    on_lasso=_keep_lassoed_zips,
+                )
+            zip_hit_index = build_hit_index(gdf_zip, "zip_code_str", zip_version)
+            if map_by_cluster:
+                render_cluster_summary("zip", metric_type)
+            lassoed = gdf_zip[
+                gdf_zip["zip_code_str"].isin(st.session_state.get("zip_lasso", []))
+            ]
+            if not lassoed.empty:
+                with st.expander(f"🪢 Lasso selection ({len(lassoed)} ZIPs)", expanded=True):
+                    st.dataframe(
+                        lassoed.sort_values("rank")[["zip_code_str", "metric_value", "rank"]]
+                        .rename(columns={
+                            "zip_code_str": "ZIP",
+                            "metric_value": map_metric_label,
+                            "rank": "Rank",
+                        }),
+                        hide_index=True,
+                        use_container_width=True,
+                    )
+                    if st.button("Clear lasso selection"):
+                        st.session_state["zip_lasso"] = []
+                        _rerun_fragment()
+            clicked_zip = extract_zip_from_event(event, zip_hit_index)
+            if clicked_zip and clicked_zip != st.session_state.get("selected_zip"):
+                st.session_state["selected_zip"] = clicked_zip
+                # Redraw the map (this fragment only) when the similar-ZIP
+                # outlines change with the new selection
+                _, new_outlines = similar_zip_matches(
+                    selected_city, clicked_zip, metric_type, selected_year
+                )
+                if new_outlines != similar_in_metro:
+                    _rerun_fragment()
+
+    with col_detail:
+        render_zip_detail(
+            selected_city,
+            selected_year,
+            metric_type,
+            metric_choice,
+            is_dark_mode,
+            zip_detail,
+            zip_df_city,
+            zip_pti_year,
+            trend_start,
+            trend_end,
+            projection_model,
+            projection_damping,
+            mortgage_scenario,
+        )
+        active_zip = st.session_state.get("selected_zip")
+        if active_zip and active_zip in zip_detail.index:
+            similar_zips, similar_in_metro = similar_zip_matches(
+                selected_city, active_zip, metric_type, selected_year
+            )
+            render_similar_zips(similar_zips, similar_in_metro, metric_type, selected_year)
+            render_zip_nearby(active_zip, zip_pti_year, zip_df_city, selected_city, selected_year)
+
+
+@st.fragment
+def render_zip_detail(
+    selected_city,
+    selected_year,
+    metric_type,
+    metric_choice,
+    is_dark_mode,
+    zip_detail,
+    zip_df_city,
+    zip_pti_year,
+    trend_start,
+    trend_end,
+    projection_model,
+    projection_damping,
+    mortgage_scenario,
+):
+    """
+    Detail card of the selected ZIP. A nested fragment: its own widgets
+    (monthly history, rate scenarios) rerun only the card.
+    """
+    st.subheader("📋 ZIP Details")
+    active_zip = st.session_state.get("selected_zip")
+    if not active_zip:
+        st.info("👈 Click any ZIP on the map")
+    else:
+        if active_zip not in zip_detail.index:
+            st.warning(f"⚠️ No data for ZIP {active_zip}")
+        else:
+            # Precomputed per metro → pure lookups per click
+            detail = zip_detail.loc[active_zip]
+            metric_val = float(detail["value"])
+            metro_avg_now = float(detail["metro_avg"])
+            pct_diff = float(detail["pct_diff"])
+            rank = int(detail["rank"])
+            rank_total = int(detail["rank_total"])
+            percentile = float(detail["percentile"])
+            metro_name = detail["city_full"]
+
+            st.markdown(f"### ZIP `{active_zip}`")
+            st.caption(metro_name)
+
+            # YoY for this ZIP
+            main_value = format_metric_value(metric_val, metric_type)
+            if pd.notna(detail["yoy_pct"]):
+                delta_text = f"{detail['yoy_pct']:+.1f}% YoY"
+            else:
+                delta_text = "No prior year"
+
+            rank_percentile = 100 - percentile
+            if pct_diff > 5:
+                diff_label = f"{pct_diff:+.1f}% above metro avg"
+            elif pct_diff < -5:
+                diff_label = f"{pct_diff:+.1f}% below metro avg"
+            else:
+                diff_label = f"{pct_diff:+.1f}% vs metro avg"
+
+            st.markdown(
+                f"""
+                <div class="metric-card">
+                    <div style="font-size: 0.8rem; text-transform: uppercase; color: #6b7280; margin-bottom: 0.25rem;">
+                        {'PTI Ratio' if 'PTI' in metric_type else 'Mortgage Payment / Income' if metric_choice == MORTGAGE_METRIC else 'Median Sale Price'}
+                    </div>
+                    <div style="font-size: 1.6rem; font-weight: 600; margin-bottom: 0.1rem;">
+                        {main_value}
+                    </div>
+                    <div style="font-size: 0.85rem; color: #6b7280; margin-bottom: 0.6rem;">
+                        {delta_text}
+                    </div>
+                    <div style="font-size: 0.9rem;">
+                        <b>Rank:</b> #{rank} of {rank_total} · Top {rank_percentile:.0f}% in this metro<br>
+                        <b>Relative to metro:</b> {diff_label}
+                    </div>
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
+
+            zip_trend = get_trend_row(
+                "zip", metric_type, trend_start, trend_end,
+                (selected_city, active_zip),
+            )
+            if zip_trend is not None and pd.notna(zip_trend["cagr"]):
+                st.caption(
+                    f"{trend_start}–{trend_end}: CAGR {zip_trend['cagr']:+.1f}%/yr · "
+                    + (
+                        f"Volatility {zip_trend['volatility']:.1f}% · "
+                        if pd.notna(zip_trend["volatility"])
+                        else ""
+                    )
+                    + f"Max drawdown {zip_trend['max_drawdown']:.1f}% · "
+                    f"Peak {zip_trend['peak_year']} · "
+                    f"CAGR rank #{zip_trend['cagr_rank']} in metro"
+                )
+
+            st.markdown("#### 📈 Trend")
+            zip_hist = get_zip_history(selected_city, active_zip, metric_type)
+            zip_monthly = get_zip_monthly_history(selected_city, active_zip, metric_type)
+            focus_year = None
+            if not zip_monthly.empty:
+                mcol1, mcol2 = st.columns(2)
+                with mcol1:
+                    show_monthly = st.checkbox("🗓️ Monthly detail", key="zip_monthly")
+                if show_monthly:
+                    with mcol2:
+                        focus_choice = st.selectbox(
+                            "Zoom to",
+                            ["All years"] + sorted(zip_hist["year"].tolist(), reverse=True),
+                            key="zip_focus_year",
+                            label_visibility="collapsed",
+                        )
+                    focus_year = None if focus_choice == "All years" else int(focus_choice)
+                else:
+                    zip_monthly = None
+            if not zip_hist.empty:
+                fig_hist = create_history_chart(
+                    zip_hist,
+                    metro_avg_now,
+                    metric_type,
+                    is_dark_mode,
+                    projection=get_zip_projection(
+                        selected_city,
+                        active_zip,
+                        metric_type,
+                        projection_model,
+                        projection_damping,
+                    ),
+                    monthly=zip_monthly,
+                    focus_year=focus_year,
+                )
+                if fig_hist:
+                    st.plotly_chart(
+                        fig_hist,
+                        width="stretch",
+                        config={"displayModeBar": False},
+                    )
+            else:
+                st.caption("No historical data for this ZIP.")
+
+            st.markdown("#### 🏅 Rank in Metro Over Time")
+            fig_rank = create_rank_history_chart(
+                get_rank_history("zip", metric_type, (selected_city, active_zip)),
+                is_dark_mode,
+            )
+            if fig_rank:
+                st.plotly_chart(
+                    fig_rank,
+                    width="stretch",
+                    config={"displayModeBar": False},
+                )
+
+            with st.expander("🏦 Mortgage Rate Scenarios", expanded=False):
+                rates_text = st.text_input(
+                    "Rates to compare (%)",
+                    value="3, 5, 7",
+                    key="rate_scenarios",
+                    help="Comma-separated annual rates",
+                )
+                try:
+                    scenario_rates = tuple(
+                        sorted({float(r) for r in rates_text.split(",") if r.strip()})
+                    )
+                except ValueError:
+                    scenario_rates = ()
+                    st.caption("Enter rates as numbers, e.g. 3, 5, 7")
+                if scenario_rates:
+                    rate_table = rate_scenario_table(
+                        "zip",
+                        (selected_city, active_zip),
+                        selected_year,
+                        scenario_rates,
+                        mortgage_scenario,
+                    )
+                    st.dataframe(
+                        rate_table.rename(
+                            columns={
+                                "rate_pct": "Rate",
+                                "monthly_payment": "Monthly Payment",
+                                "payment_to_income": "% of Income",
+                            }
+                        ),
+                        hide_index=True,
+                        use_container_width=True,
+                        column_config={
+                            "Rate": st.column_config.NumberColumn(format="%.2f%%"),
+                            "Monthly Payment": st.column_config.NumberColumn(format="$%.0f"),
+                            "% of Income": st.column_config.NumberColumn(format="%.1f%%"),
+                        },
+                    )
+                    st.caption(
+                        f"{mortgage_scenario.down_payment_pct:g}% down · "
+                        f"{mortgage_scenario.term_years}-year term · "
+                        f"{selected_year} median sale price"
+                    )
+
+
+def render_similar_zips(similar_zips, similar_in_metro, metric_type, selected_year):
+    """
+    Similar-trajectory matches of the selected ZIP. Rendered by the ZIP
+    explorer fragment rather than the card, since the number of matches
+    also sets the outlines on the map.
+    """
+    st.markdown("#### 🔁 Similar Trajectories Nationwide")
+    st.number_input(
+        "Matches",
+        min_value=3,
+        max_value=50,
+        value=DEFAULT_NEIGHBORS,
+        step=1,
+        key="similar_n",
+        help=(
+            f"ZIPs whose {metric_short_name(metric_type)} history has the "
+            "most similar shape (correlation of z-normalized yearly values)"
+        ),
+    )
+    if similar_zips.empty:
+        st.caption("Not enough history to compare this ZIP.")
+    else:
+        value_label = f"{metric_short_name(metric_type)} {selected_year}"
+        st.dataframe(
+            similar_zips.assign(
+                value=[
+                    format_metric_value(v, metric_type)
+                    for v in similar_zips["value"]
+                ]
+            )[["zip_code_str", "city_full", "similarity", "value"]].rename(
+                columns={
+                    "zip_code_str": "ZIP",
+                    "city_full": "Metro",
+                    "similarity": "Similarity",
+                    "value": value_label,
+                }
+            ),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Similarity": st.column_config.NumberColumn(format="%.3f")
+            },
+        )
+        if similar_in_metro:
+            st.caption(
+                f"{len(similar_in_metro)} of these are in this metro "
+                "(outlined on the map)."
+            )
+
+
+@st.fragment
+def render_zip_nearby(active_zip, zip_pti_year, zip_df_city, selected_city, selected_year):
+    """
+    Nearby affordable ZIPs and the metro's CSV download. A nested fragment
+    like the card: its widgets rerun only this section.
+    """
+    st.markdown("#### 🧭 Nearby Affordable ZIPs")
+    try:
+        zip_graph = load_zip_adjacency()
+    except Exception as e:
+        zip_graph = None
+        st.caption(f"Nearby search unavailable: {e}")
+
+    if zip_graph is not None:
+        nb_col1, nb_col2 = st.columns(2)
+        with nb_col1:
+            nearby_max_pti = st.number_input(
+                "PTI below",
+                min_value=1.0,
+                max_value=50.0,
+                value=5.0,
+                step=0.5,
+                key="nearby_max_pti",
+            )
+        with nb_col2:
+            nearby_order = st.radio(
+                "Nearest by",
+                ["Hops", "Distance"],
+                horizontal=True,
+                key="nearby_order",
+            )
+
+        nearby = zip_graph.nearby_matching(
+            active_zip,
+            zip_pti_year,
+            nearby_max_pti,
+            k=5,
+            order=nearby_order.lower(),
+        )
+        if nearby.empty:
+            st.caption(
+                f"No ZIPs with PTI below {nearby_max_pti:.1f}x nearby."
+            )
+        else:
+            st.dataframe(
+                nearby.rename(
+                    columns={
+                        "zip_code_str": "ZIP",
+                        "hops": "Hops",
+                        "distance_mi": "Miles",
+                        "value": "PTI",
+                    }
+                ),
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "PTI": st.column_config.NumberColumn(format="%.2fx")
+                },
+            )
+
+    st.markdown("---")
+    csv = zip_df_city[
+        ["zip_code_str", "year", "metric_value", "city_full", "rank"]
+    ].to_csv(index=False)
+    st.download_button(
+        label="📥 Download ZIP-level data (CSV)",
+        data=csv,
+        file_name=(
+            f"{selected_city.replace(',', '_')}_"
+            f"{selected_year}_zipdata.csv"
+        ),
+        mime="text/csv",
+        use_container_width=True,
+    )
+
+
 # =========================================================================
 # 5. Load metro/ZIP data
 # =========================================================================
+with st.spinner("📊 Loading housing data..."):
+    warmup.wait_for("all_data", "affordability")
+
 try:
     df_all = load_all_data()
 except Exception as e:
@@ -463,13 +1185,78 @@ with st.sidebar:
         selected_year = st.slider("Year", min_year, max_year, max_year)
         st.caption(f"Data range: {min_year} – {max_year}")
 
-        metric_type = st.radio(
+        metric_choice = st.radio(
             "Metric",
-            ["Median Sale Price", "Price-to-Income Ratio (PTI)"],
+            ["Median Sale Price", "Price-to-Income Ratio (PTI)", MORTGAGE_METRIC],
             index=0,
-            help="Price: median home sale price\nPTI: affordability (lower = more affordable)",
+            help=(
+                "Price: median home sale price\n"
+                "PTI: affordability (lower = more affordable)\n"
+                "Mortgage: monthly payment as % of per-capita income"
+            ),
         )
 
+        # Mortgage metrics are named after their scenario, so every panel,
+        # trend and projection lookup below is cached per scenario
+        mortgage_scenario = DEFAULT_SCENARIO
+        metric_type = metric_choice
+        if metric_choice == MORTGAGE_METRIC:
+            mortgage_scenario = mortgage_settings("home_mortgage")
+            metric_type = mortgage_metric(mortgage_scenario)
+
+        map_color_by = st.radio(
+            "Color map by",
+            ["Selected year", "Projected year", "Change between years"]
+            + list(TREND_STATS.values())
+            + ["Trajectory cluster"],
+            index=0,
+            help=(
+                "Selected year: the metric's value in the chosen year\n"
+                "Projected year: the metric's fitted trend, extended past the data\n"
+                "Change between years: the metric's change over the two years below\n"
+                "CAGR / Volatility / Max drawdown: the metric's trend over the window below\n"
+                "Trajectory cluster: groups of areas whose metric moved alike over all years"
+            ),
+        )
+        map_trend_stat = {label: stat for stat, label in TREND_STATS.items()}.get(map_color_by)
+        map_by_cluster = map_color_by == "Trajectory cluster"
+        map_by_change = map_color_by == "Change between years"
+        change_years = tuple(
+            min(max(y, min_year), max_year) for y in COVID_CHANGE_YEARS
+        )
+        change_kind = "percent"
+        if map_by_change:
+            change_years = st.slider("Change years", min_year, max_year, change_years)
+            change_kind = st.radio(
+                "Change as", ["Percent", "Absolute"], horizontal=True
+            ).lower()
+        trend_start, trend_end = st.slider(
+            "Trend window", min_year, max_year, (min_year, max_year)
+        )
+        if trend_end <= trend_start:
+            # One year has no trend (every CAGR would be NaN)
+            st.warning("The trend window needs at least two years; using the full range.")
+            trend_start, trend_end = min_year, max_year
+
+        projection_model = st.selectbox(
+            "Projection model",
+            PROJECTION_MODELS,
+            index=0,
+            help="log-linear: constant growth rate\nlinear: constant yearly change",
+        )
+        damp_projection = st.checkbox(
+            "Damp projected trend", value=True, help="Flatten the trend further out"
+        )
+        projection_damping = DEFAULT_DAMPING if damp_projection else 1.0
+        projected_year = None
+        if map_color_by == "Projected year":
+            projected_year = st.slider(
+                "Projected year",
+                max_year + 1,
+                max_year + PROJECTION_HORIZON,
+                max_year + 1,
+            )
+
         use_street_map = st.checkbox("🗺 Use Real Street Map (OSM)", value=False)
 
         # Override map style
@@ -490,6 +1277,7 @@ with st.sidebar:
                 st.rerun()
 
         # Metro search (for city view)
+        highlighted_city = None
         if st.session_state["view_mode"] == "city":
             st.markdown("---")
             st.markdown("### 🔍 Quick Metro Search")
@@ -516,22 +1304,27 @@ with st.sidebar:
                     else f"📍 {x}",
                 )
 
-                if selected_metro and st.button("➡️ View ZIP codes"):
-                    city_match = df_city_sidebar[
+                if selected_metro:
+                    highlighted_city = df_city_sidebar[
                         df_city_sidebar["city_full"] == selected_metro
                     ]["city"].iloc[0]
+
+                if selected_metro and st.button("➡️ View ZIP codes"):
+                    city_match = highlighted_city
                     st.session_state["selected_city"] = city_match
                     st.session_state["view_mode"] = "zip"
                     st.session_state["selected_zip"] = None
                     st.rerun()
 
-    # keep this in sidebar as well
-    if st.session_state["view_mode"] == "city":
-        with st.expander("📈 Multi-Metro Affordability Comparison", expanded=False):
-            selected_cities, show_legend = render_affordability_sidebar(city_order)
-    else:
-        selected_cities, show_legend = [], True
-    
+    # Startup warm-up progress (process-wide, shared by every session)
+    warm_status = warmup.status()
+    still_loading = [name for name, state in warm_status.items() if state == "loading"]
+    if still_loading:
+        st.caption(
+            f"⏳ Warming up: {len(warm_status) - len(still_loading)}/{len(warm_status)} ready "
+            f"· loading {', '.join(still_loading)}"
+        )
+
     # Navigation button to app_d3.py
     st.markdown("---")
     if st.button("🔍 Price Affordability Finder", use_container_width=True, help="Navigate to the Price Affordability Finder tool"):
@@ -553,68 +1346,49 @@ st.markdown(
 # =========================================================================
 # 7. Prepare data for selected year & metric
 # =========================================================================
-df_year = df_all[df_all["year"] == selected_year].copy()
-if df_year.empty:
+year_frames = prepare_year_frames(selected_year, metric_type)
+if year_frames is None:
     st.warning(f"### ⚠️ No data available for {selected_year}")
     st.stop()
 
-if metric_type == "Price-to-Income Ratio (PTI)":
-    df_year = compute_pti(df_year)
-    value_source_col = "PTI"
-    if df_year.empty:
-        st.warning(f"⚠️ PTI values out of range for {selected_year}.")
-        st.stop()
+df_zip_metric, df_city_map, zip_pti_year = year_frames
+if df_zip_metric.empty:
+    st.warning(f"⚠️ No valid {metric_type} data for {selected_year}.")
+    st.stop()
 
-    df_zip_metric = (
-        df_year.groupby(
-            ["city", "city_full", "city_clean", "zip_code_str", "year"],
-            as_index=False,
-        ).agg(
-            metric_value=("PTI", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
-    )
+metro_yoy = get_metro_yoy(selected_year, metric_type)
 
-    df_city = (
-        df_zip_metric.groupby(["city", "city_full", "city_clean"], as_index=False).agg(
-            n=("zip_code_str", "count"),
-            avg_metric_value=("metric_value", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
+# Trend stats over the sidebar window (cached per metric/window)
+metro_trends = get_trend_table("metro", metric_type, trend_start, trend_end)
+map_metric_label = metric_type
+df_city_color = df_city_map
+if map_trend_stat:
+    map_metric_label = trend_map_label(map_trend_stat, trend_start, trend_end)
+    df_city_color = with_trend_values(
+        df_city_map, metro_trends, map_trend_stat, ["city"], "avg_metric_value"
     )
-else:
-    df_year = df_year[df_year["median_sale_price"].notna()].copy()
-    value_source_col = "median_sale_price"
-    if df_year.empty:
-        st.warning(f"⚠️ No valid price data for {selected_year}.")
-        st.stop()
-
-    df_zip_metric = (
-        df_year.groupby(
-            ["city", "city_full", "city_clean", "zip_code_str", "year"],
-            as_index=False,
-        ).agg(
-            metric_value=("median_sale_price", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
+elif map_by_change:
+    map_metric_label = change_map_label(metric_type, *change_years, change_kind)
+    df_city_color = with_trend_values(
+        df_city_map,
+        get_year_pair_changes("metro_avg", metric_type).frame(*change_years, change_kind),
+        "change",
+        ["city"],
+        "avg_metric_value",
     )
-
-    df_city = (
-        df_zip_metric.groupby(["city", "city_full", "city_clean"], as_index=False).agg(
-            n=("zip_code_str", "count"),
-            avg_metric_value=("metric_value", "mean"),
-            lat=("lat", "mean"),
-            lon=("lon", "mean"),
-        )
+elif map_by_cluster:
+    map_metric_label = cluster_map_label(metric_type)
+    df_city_color = with_trend_values(
+        df_city_map, get_cluster_table("metro", metric_type), "cluster", ["city"], "avg_metric_value"
+    )
+elif projected_year:
+    map_metric_label = f"{metric_type} · projected {projected_year}"
+    metro_projection = get_projection(
+        "metro", metric_type, projection_model, projection_damping
+    ).year_frame(projected_year)
+    df_city_color = with_trend_values(
+        df_city_map, metro_projection, "value", ["city"], "avg_metric_value"
     )
-
-df_city_map = df_city.copy().reset_index(drop=True)
-df_city_map = compute_rankings(df_city_map, "avg_metric_value", "city")
-
-metro_yoy = get_metro_yoy(df_all, selected_year, metric_type)
 
 # =========================================================================
 # 8. Layout: title + help
@@ -647,6 +1421,9 @@ with st.expander("ℹ️ How to Interact with This Map", expanded=False):
           - Metro view: average PTI across ZIPs in the metro  
           - ZIP view: PTI for this ZIP  
           - Lower PTI = more affordable
+        - **Mortgage Payment-to-Income** = monthly payment ÷ monthly income  
+          - Principal + interest at the chosen rate (or each year's average rate), plus tax and insurance  
+          - Under 30% is commonly considered affordable
         """
         )
 
@@ -674,27 +1451,24 @@ if st.session_state["view_mode"] == "city":
 
     with col_s2:
         avg_val = df_city_map["avg_metric_value"].mean()
-        if metric_type == "Price-to-Income Ratio (PTI)":
-            st.metric("Avg PTI", f"{avg_val:.2f}x")
-        else:
-            st.metric("Avg Price", f"${avg_val:,.0f}")
+        st.metric(f"Avg {metric_short_name(metric_type)}", format_metric_value(avg_val, metric_type))
 
     with col_s3:
         top_metro = df_city_map.loc[df_city_map["avg_metric_value"].idxmax()]
         metro_label_high = top_metro["city_full"]
-        if metric_type == "Price-to-Income Ratio (PTI)":
-            st.metric("Highest PTI", f"{top_metro['avg_metric_value']:.2f}x")
-        else:
-            st.metric("Highest Price", f"${top_metro['avg_metric_value']:,.0f}")
+        st.metric(
+            f"Highest {metric_short_name(metric_type)}",
+            format_metric_value(top_metro["avg_metric_value"], metric_type),
+        )
         st.caption(f"Metro: **{metro_label_high}**")
 
     with col_s4:
         bottom_metro = df_city_map.loc[df_city_map["avg_metric_value"].idxmin()]
         metro_label_low = bottom_metro["city_full"]
-        if metric_type == "Price-to-Income Ratio (PTI)":
-            st.metric("Lowest PTI", f"{bottom_metro['avg_metric_value']:.2f}x")
-        else:
-            st.metric("Lowest Price", f"${bottom_metro['avg_metric_value']:,.0f}")
+        st.metric(
+            f"Lowest {metric_short_name(metric_type)}",
+            format_metric_value(bottom_metro["avg_metric_value"], metric_type),
+        )
         st.caption(f"Metro: **{metro_label_low}**")
 
     with col_s5:
@@ -724,38 +1498,91 @@ if st.session_state["view_mode"] == "city":
 
     st.markdown("---")
 
+    with st.spinner("🏙️ Loading metro area boundaries..."):
+        warmup.wait_for("cbsa_shapes", "metro_polygons")
+
     fig_city = None
     gdf_metro = None
+    figure_cache = get_figure_cache()
     try:
-        cbsa_shapes = load_cbsa_shapes()
-        fig_city, gdf_metro = create_city_choropleth(
-            df_city_map, cbsa_shapes, map_style, metric_type, is_dark_mode
+        # Reruns that don't change the map's inputs reuse the finished figure
+        fig_city, gdf_metro = figure_cache.get_or_build(
+            (
+                "metro",
+                selected_year,
+                map_metric_label,
+                frame_fingerprint(df_city_color, ["city", "avg_metric_value", "rank"]),
+            ),
+            lambda: create_city_choropleth(
+                df_city_color, load_cbsa_shapes(), map_style, map_metric_label
+            ),
         )
     except Exception as e:
         st.error(f"❌ Shapefile Error: {e}")
 
     if fig_city is not None and gdf_metro is not None:
-        event = st.plotly_chart(
-            fig_city,
-            width="stretch",
-            on_select="rerun",
-            selection_mode="points",
-            key=f"metro_map_{selected_year}_{metric_type}_{map_style}",
-            config={"scrollZoom": True},
-        )
-        clicked_city = extract_city_from_event(event)
+        metro_version = geometry_version("metro", gdf_metro, "city")
+        with figure_cache.checkout():
+            apply_map_theme(fig_city, map_metric_label, is_dark_mode, "metro", map_style)
+            # Stable key: year / metric / theme changes are sent as a patch
+            event = choropleth_map(
+                fig_city,
+                metro_version,
+                key="metro_map",
+                on_lasso=lambda points: _compare_lassoed_metros(points, city_order),
+            )
+        metro_hit_index = build_hit_index(gdf_metro, "city", metro_version)
+        clicked_city = extract_city_from_event(event, metro_hit_index)
         if clicked_city and clicked_city != st.session_state["selected_city"]:
             st.session_state["selected_city"] = clicked_city
             st.session_state["selected_zip"] = None
             st.session_state["view_mode"] = "zip"
             st.rerun()
 
+    if map_by_cluster:
+        render_cluster_summary("metro", metric_type)
+
+    with st.expander(f"📈 Long-run Trends ({trend_start}–{trend_end}) · {metric_type}", expanded=False):
+        trend_cols = ["city_full", "cagr", "volatility", "max_drawdown", "peak_year", "cagr_rank"]
+        st.dataframe(
+            metro_trends[trend_cols].sort_values("cagr_rank").rename(
+                columns={
+                    "city_full": "Metro",
+                    "cagr": "CAGR",
+                    "volatility": "Volatility",
+                    "max_drawdown": "Max Drawdown",
+                    "peak_year": "Peak Year",
+                    "cagr_rank": "CAGR Rank",
+                }
+            ),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "CAGR": st.column_config.NumberColumn(format="%+.1f%%"),
+                "Volatility": st.column_config.NumberColumn(format="%.1f%%"),
+                "Max Drawdown": st.column_config.NumberColumn(format="%.1f%%"),
+            },
+        )
+
+    render_radius_search(df_city_map, selected_year)
+
     st.markdown("---")
 
     st.markdown("## 📈 Multi-Metro Affordability Comparison Dashboard")
 
     # ----------------------- MULTI-METRO DASHBOARD ------------------------
-    render_affordability_dashboard(selected_cities, show_legend, ratio_agg, prices_year)
+    render_comparison_dashboard(city_order, metric_type, ratio_agg, prices_year, change_years)
+
+    # Warm the ZIP views the user is likely to open next (background pool)
+    top_ranked = df_city_map.sort_values("rank")["city"].head(PREFETCH_METROS).tolist()
+    session_prefetch("home").replace(
+        {
+            (city, selected_year, metric_type): prefetch_zip_view(
+                city, selected_year, metric_type, map_metric_label, map_style
+            )
+            for city in likely_next(highlighted_city, top_ranked, "home")
+        }
+    )
 
 else:
     # --------------------- ZIP VIEW ---------------------
@@ -775,234 +1602,102 @@ else:
         f"Click ZIPs to see details · Scroll to zoom"
     )
 
+    # Reuse this metro's prefetch if it is running; drop the other candidates
+    prefetch = session_prefetch("home")
+    prefetch.wait((selected_city, selected_year, metric_type))
+    prefetch.cancel()
+    record_visit("home", selected_city)
+
+    with st.spinner("🗺️ Loading ZIP code boundaries..."):
+        warmup.wait_for("zcta_shapes")
     try:
-        zcta_shapes = load_zcta_shapes()
-        zip_df_city, gdf_merge = get_zip_polygons_for_metro(
-            selected_city, zcta_shapes, df_zip_metric
+        zip_df_city, gdf_merge = prepare_zip_frames(
+            selected_city, selected_year, metric_type, load_zcta_shapes()
         )
     except Exception as e:
         st.error(f"❌ ZIP Shapefile Error: {e}")
         zip_df_city, gdf_merge = pd.DataFrame(), gpd.GeoDataFrame()
 
-    if gdf_merge.empty or zip_df_city.empty:
+    if gdf_merge.empty:
         st.warning(
             f"### ⚠️ No ZIP code data available for {selected_city} in {selected_year}"
         )
     else:
-        # Only keep ZIPs that have metric values
-        zip_df_city = zip_df_city[zip_df_city["metric_value"].notna()].copy()
-
-        # Only keep ZIPs that appear in the polygon GeoDataFrame
-        valid_zips = gdf_merge["zip_code_str"].unique()
-        zip_df_city = zip_df_city[zip_df_city["zip_code_str"].isin(valid_zips)].copy()
-
         if zip_df_city.empty:
             st.warning(
                 f"⚠️ No valid {metric_type} data for {selected_city} in {selected_year}."
             )
         else:
-            # Rankings at ZIP level (within this metro)
-            zip_df_city = compute_rankings(
-                zip_df_city, "metric_value", "zip_code_str"
+            # Detail-card values for every ZIP of this metro, computed once
+            zip_detail = get_zip_detail_table(
+                selected_city,
+                selected_year,
+                metric_type,
+                tuple(zip_df_city["zip_code_str"]),
             )
 
-            if st.session_state.get("selected_zip") is None and not zip_df_city.empty:
-                st.session_state["selected_zip"] = zip_df_city["zip_code_str"].iloc[0]
-
-            col_map, col_detail = st.columns([2.2, 1])
-
-            with col_map:
-                city_coords = None
-                fig_zip, gdf_zip = create_zip_choropleth(
+            # Map colors: the selected year's value, a projection or a trend stat
+            gdf_map = attach_ranks(gdf_merge, "zip", metric_type, selected_year)
+            if map_trend_stat:
+                zip_trends = get_trend_table("zip", metric_type, trend_start, trend_end)
+                gdf_map = with_trend_values(
                     gdf_merge,
-                    map_style,
-                    city_coords,
-                    zip_df_city,
-                    metric_type,
-                    is_dark_mode,
+                    zip_trends[zip_trends["city"] == selected_city],
+                    map_trend_stat,
+                    ["zip_code_str"],
+                    "metric_value",
+                )
+            elif map_by_change:
+                zip_changes = get_year_pair_changes("zip", metric_type).frame(
+                    *change_years, change_kind
+                )
+                gdf_map = with_trend_values(
+                    gdf_merge,
+                    zip_changes[zip_changes["city"] == selected_city],
+                    "change",
+                    ["zip_code_str"],
+                    "metric_value",
+                )
+            elif map_by_cluster:
+                zip_clusters = get_cluster_table("zip", metric_type)
+                gdf_map = with_trend_values(
+                    gdf_merge,
+                    zip_clusters[zip_clusters["city"] == selected_city],
+                    "cluster",
+                    ["zip_code_str"],
+                    "metric_value",
+                )
+            elif projected_year:
+                zip_projection = get_projection(
+                    "zip", metric_type, projection_model, projection_damping
+                ).year_frame(projected_year)
+                gdf_map = with_trend_values(
+                    gdf_merge,
+                    zip_projection[zip_projection["city"] == selected_city],
+                    "value",
+                    ["zip_code_str"],
+                    "metric_value",
                 )
-                if fig_zip is not None and gdf_zip is not None:
-                    event = st.plotly_chart(
-                        fig_zip,
-                        width="stretch",
-                        on_select="rerun",
-                        selection_mode="points",
-                        key=(
-                            f"zip_map_{selected_city}_{selected_year}_"
-                            f"{metric_type}_{map_style}"
-                        ),
-                        config={"scrollZoom": True},
-                    )
-                    clicked_zip = extract_zip_from_event(event, gdf_zip)
-                    if clicked_zip:
-                        st.session_state["selected_zip"] = clicked_zip
-
-            with col_detail:
-                st.subheader("📋 ZIP Details")
-                active_zip = st.session_state.get("selected_zip")
-                if not active_zip:
-                    st.info("👈 Click any ZIP on the map")
-                else:
-                    row_now = zip_df_city[
-                        zip_df_city["zip_code_str"] == active_zip
-                    ]
-                    if row_now.empty:
-                        st.warning(f"⚠️ No data for ZIP {active_zip}")
-                    else:
-                        metric_val = float(row_now["metric_value"].iloc[0])
-                        metro_avg_now = float(zip_df_city["metric_value"].mean())
-                        diff = metric_val - metro_avg_now
-                        pct_diff = (
-                            diff / metro_avg_now * 100 if metro_avg_now != 0 else 0.0
-                        )
-                        rank = int(row_now["rank"].iloc[0])
-                        rank_total = int(row_now["rank_total"].iloc[0])
-                        percentile = float(row_now["percentile"].iloc[0])
-                        metro_name = row_now["city_full"].iloc[0]
-
-                        st.markdown(f"### ZIP `{active_zip}`")
-                        st.caption(metro_name)
-
-                        # YoY for this ZIP
-                        if metric_type == "Price-to-Income Ratio (PTI)":
-                            zip_prev_raw = df_all[
-                                (df_all["city"] == selected_city)
-                                & (df_all["zip_code_str"] == active_zip)
-                                & (df_all["year"] == selected_year - 1)
-                            ].copy()
-                            zip_prev_raw = (
-                                compute_pti(zip_prev_raw)
-                                if not zip_prev_raw.empty
-                                else pd.DataFrame()
-                            )
-                            if not zip_prev_raw.empty:
-                                prev_val = zip_prev_raw["PTI"].mean()
-                                yoy_change = (
-                                    (metric_val - prev_val) / prev_val * 100
-                                )
-                                main_value = f"{metric_val:.2f}x"
-                                delta_text = f"{yoy_change:+.1f}% YoY"
-                            else:
-                                main_value = f"{metric_val:.2f}x"
-                                delta_text = "No prior year"
-                        else:
-                            zip_prev = df_all[
-                                (df_all["city"] == selected_city)
-                                & (df_all["zip_code_str"] == active_zip)
-                                & (df_all["year"] == selected_year - 1)
-                                & df_all["median_sale_price"].notna()
-                            ]
-                            if not zip_prev.empty:
-                                prev_val = zip_prev["median_sale_price"].mean()
-                                yoy_change = (
-                                    (metric_val - prev_val) / prev_val * 100
-                                )
-                                main_value = f"${metric_val:,.0f}"
-                                delta_text = f"{yoy_change:+.1f}% YoY"
-                            else:
-                                main_value = f"${metric_val:,.0f}"
-                                delta_text = "No prior year"
-
-                        rank_percentile = 100 - percentile
-                        if pct_diff > 5:
-                            diff_label = f"{pct_diff:+.1f}% above metro avg"
-                        elif pct_diff < -5:
-                            diff_label = f"{pct_diff:+.1f}% below metro avg"
-                        else:
-                            diff_label = f"{pct_diff:+.1f}% vs metro avg"
-
-                        st.markdown(
-                            f"""
-                            <div class="metric-card">
-                                <div style="font-size: 0.8rem; text-transform: uppercase; color: #6b7280; margin-bottom: 0.25rem;">
-                                    {'PTI Ratio' if 'PTI' in metric_type else 'Median Sale Price'}
-                                </div>
-                                <div style="font-size: 1.6rem; font-weight: 600; margin-bottom: 0.1rem;">
-                                    {main_value}
-                                </div>
-                                <div style="font-size: 0.85rem; color: #6b7280; margin-bottom: 0.6rem;">
-                                    {delta_text}
-                                </div>
-                                <div style="font-size: 0.9rem;">
-                                    <b>Rank:</b> #{rank} of {rank_total} · Top {rank_percentile:.0f}% in this metro<br>
-                                    <b>Relative to metro:</b> {diff_label}
-                                </div>
-                            </div>
-                            """,
-                            unsafe_allow_html=True,
-                        )
 
-                        st.markdown("#### 📈 Trend")
-                        if metric_type == "Price-to-Income Ratio (PTI)":
-                            zip_hist_raw = df_all[
-                                (df_all["city"] == selected_city)
-                                & (df_all["zip_code_str"] == active_zip)
-                            ].copy()
-                            zip_hist_raw = compute_pti(zip_hist_raw)
-                            if not zip_hist_raw.empty:
-                                zip_hist = (
-                                    zip_hist_raw.groupby(
-                                        "year", as_index=False
-                                    ).agg(PTI=("PTI", "mean")).sort_values("year")
-                                )
-                                if not zip_hist.empty:
-                                    fig_hist = create_history_chart(
-                                        zip_hist,
-                                        metro_avg_now,
-                                        metric_type,
-                                        is_dark_mode,
-                                    )
-                                    if fig_hist:
-                                        st.plotly_chart(
-                                            fig_hist,
-                                            width="stretch",
-                                            config={"displayModeBar": False},
-                                        )
-                                else:
-                                    st.caption("No historical data for this ZIP.")
-                            else:
-                                st.caption("No historical data for this ZIP.")
-                        else:
-                            zip_hist = (
-                                df_all[
-                                    (df_all["city"] == selected_city)
-                                    & (df_all["zip_code_str"] == active_zip)
-                                    & df_all["median_sale_price"].notna()
-                                ]
-                                .groupby("year", as_index=False)
-                                .agg(price=("median_sale_price", "mean"))
-                                .sort_values("year")
-                            )
-                            if not zip_hist.empty:
-                                fig_hist = create_history_chart(
-                                    zip_hist,
-                                    metro_avg_now,
-                                    metric_type,
-                                    is_dark_mode,
-                                )
-                                if fig_hist:
-                                    st.plotly_chart(
-                                        fig_hist,
-                                        width="stretch",
-                                        config={"displayModeBar": False},
-                                    )
-                            else:
-                                st.caption("No historical data for this ZIP.")
-
-                        st.markdown("---")
-                        csv = zip_df_city[
-                            ["zip_code_str", "year", "metric_value", "city_full", "rank"]
-                        ].to_csv(index=False)
-                        st.download_button(
-                            label="📥 Download ZIP-level data (CSV)",
-                            data=csv,
-                            file_name=(
-                                f"{selected_city.replace(',', '_')}_"
-                                f"{selected_year}_zipdata.csv"
-                            ),
-                            mime="text/csv",
-                            use_container_width=True,
-                        )
+            render_zip_explorer(
+                selected_city,
+                selected_year,
+                metric_type,
+                metric_choice,
+                map_metric_label,
+                map_style,
+                is_dark_mode,
+                map_by_cluster,
+                gdf_map,
+                zip_df_city,
+                zip_detail,
+                zip_pti_year,
+                trend_start,
+                trend_end,
+                projection_model,
+                projection_damping,
+                mortgage_scenario,
+            )
 
             st.markdown("---")
             st.markdown("#### 📊 Metro Summary")
@@ -1017,6 +1712,41 @@ else:
                 selected_year=selected_year,
             )
 
+            cluster_metros = [
+                c for c in metros_in_cluster(metric_type, selected_city) if c in set(city_order)
+            ]
+            if len(cluster_metros) > 1 and st.button(
+                f"🧩 Compare the {len(cluster_metros)} metros in this trajectory cluster"
+            ):
+                st.session_state["compare_metros"] = cluster_metros
+                st.session_state["view_mode"] = "city"
+                st.session_state["selected_city"] = None
+                st.session_state["selected_zip"] = None
+                st.rerun()
+
+            value_format = {
+                "Price-to-Income Ratio (PTI)": "%.2fx",
+                MORTGAGE_METRIC: "%.1f%%",
+            }.get(metric_choice, "$%.0f")
+            col_top, col_bottom = st.columns(2)
+            for col, title, bottom in (
+                (col_top, "⬆️ Highest 5 ZIPs", False),
+                (col_bottom, "⬇️ Lowest 5 ZIPs", True),
+            ):
+                with col:
+                    st.markdown(f"##### {title}")
+                    extremes = top_k(
+                        "zip", metric_type, selected_year, k=5, city=selected_city, bottom=bottom
+                    )
+                    st.dataframe(
+                        extremes[["zip_code_str", "value", "rank"]].rename(
+                            columns={"zip_code_str": "ZIP", "value": "Value", "rank": "Rank"}
+                        ),
+                        hide_index=True,
+                        use_container_width=True,
+                        column_config={"Value": st.column_config.NumberColumn(format=value_format)},
+                    )
+
             values = zip_df_city["metric_value"]
             nonzero_values = values[values > 0]
 
@@ -1024,42 +1754,19 @@ else:
                 st.metric("ZIP Codes (on map)", len(zip_df_city))
 
             with col_m2:
-                if metric_type == "Price-to-Income Ratio (PTI)":
-                    st.metric("Metro Avg", f"{values.mean():.2f}x")
-                else:
-                    st.metric("Metro Avg", f"${values.mean():,.0f}")
+                st.metric("Metro Avg", format_metric_value(values.mean(), metric_type))
 
             with col_m3:
-                if metric_type == "Price-to-Income Ratio (PTI)":
-                    st.metric(
-                        "Max PTI",
-                        f"{nonzero_values.max():.2f}x"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
-                else:
-                    st.metric(
-                        "Max Price",
-                        f"${nonzero_values.max():,.0f}"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
+                st.metric(
+                    f"Max {metric_short_name(metric_type)}",
+                    format_metric_value(nonzero_values.max(), metric_type),
+                )
 
             with col_m4:
-                if metric_type == "Price-to-Income Ratio (PTI)":
-                    st.metric(
-                        "Min PTI",
-                        f"{nonzero_values.min():.2f}x"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
-                else:
-                    st.metric(
-                        "Min Price",
-                        f"${nonzero_values.min():,.0f}"
-                        if not nonzero_values.empty
-                        else "N/A",
-                    )
+                st.metric(
+                    f"Min {metric_short_name(metric_type)}",
+                    format_metric_value(nonzero_values.min(), metric_type),
+                )
 
             with col_m5:
                 metro_row = (
@@ -3,6 +3,7 @@ import json
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+from plotly.colors import qualitative
 import geopandas as gpd
 import streamlit as st
 
@@ -14,7 +15,101 @@ from config_data import (
 )
 from config_data import get_colorscale
 from config_data import compute_rankings
-from geo_utils import build_city_cbsa_polygons
+from geo_utils import build_city_cbsa_polygons, with_display_centroids
+from panel import history_value_col, is_change_label
+from clusters import is_cluster_label
+from monthly import downsample
+
+
+def _is_percent_metric(metric_name: str) -> bool:
+    """Trend stats (CAGR, volatility, drawdown) are labelled "... (%)"."""
+    return metric_name.endswith(("(%)", "(% pts)"))
+
+
+def _format_change(value: float, metric_name: str) -> str:
+    """Signed hover text of a change-map value."""
+    if _is_percent_metric(metric_name):
+        return f"{value:+.1f}%"
+    if "PTI" in metric_name:
+        return f"{value:+.2f}x"
+    return f"{'+' if value >= 0 else '-'}${abs(value):,.0f}"
+
+
+def _colorbar_format(metric_name: str):
+    """(tickprefix, tickformat, ticksuffix) for a metric's colorbar."""
+    if is_cluster_label(metric_name):
+        return "", "d", ""
+    if _is_percent_metric(metric_name):
+        return "", ",.1f", "%"
+    if "PTI" in metric_name:
+        return "", ",.2f", "x"
+    return "$", ",", ""
+
+def _map_color_range(values: pd.Series, metric_name: str):
+    """
+    (zmin, zmax, colorbar ticks) of a choropleth. Cluster numbers 1..k
+    are centred in one color band each; changes are symmetric around 0.
+    """
+    if is_cluster_label(metric_name):
+        k = int(values.max())
+        return 0.5, k + 0.5, dict(tickvals=list(range(1, k + 1)))
+    if is_change_label(metric_name):
+        bound = float(values.abs().max()) or 1.0
+        return -bound, bound, {}
+    return float(values.min()), float(values.max()), {}
+
+
+def _map_colorscale(metric_name: str, is_dark_mode: bool, zmax: float):
+    """
+    Colorscale of a choropleth. Clusters get one flat qualitative color
+    each; changes diverge around zero (falls blue, rises orange).
+    """
+    if is_cluster_label(metric_name):
+        k = max(int(round(zmax - 0.5)), 1)
+        palette = qualitative.Set2 if not is_dark_mode else qualitative.Pastel
+        colorscale = []
+        for i in range(k):
+            color = palette[i % len(palette)]
+            colorscale += [[i / k, color], [(i + 1) / k, color]]
+        return colorscale
+    if is_change_label(metric_name):
+        mid = "#f8fafc" if not is_dark_mode else "#1e293b"
+        return [[0.0, "#2563eb"], [0.5, mid], [1.0, "#c2410c"]]
+    return get_colorscale(metric_name, is_dark_mode)
+
+
+# Polygon outline colors (light, dark) per map level
+_MAP_LINE_COLORS = {
+    "metro": ("rgba(249,250,251,0.8)", "rgba(15,23,42,0.7)"),
+    "zip": ("rgba(248,250,252,0.9)", "rgba(15,23,42,0.8)"),
+}
+
+
+def apply_map_theme(
+    fig, metric_name: str, is_dark_mode: bool, level: str = "metro", map_style: str = None
+):
+    """
+    Set the theme-dependent styling of a choropleth in place: colorscale,
+    outlines, colorbar and hover backgrounds, and the base map style.
+    Only style properties change (no data arrays or GeoJSON), so a cached
+    figure can switch between Light and Dark without being rebuilt.
+    """
+    base = fig.data[0]
+    base.colorscale = _map_colorscale(metric_name, is_dark_mode, base.zmax)
+    base.marker.line.color = _MAP_LINE_COLORS[level][is_dark_mode]
+    base.colorbar.bgcolor = "rgba(255,255,255,0.85)" if not is_dark_mode else "rgba(15,23,42,0.9)"
+    fig.layout.hoverlabel.bgcolor = "white" if not is_dark_mode else "#020617"
+    if map_style is not None:
+        fig.layout.mapbox.style = map_style
+    return fig
+
+
+def _rank_text(rank, rank_total, prefix: str = "") -> str:
+    """"#3 of 50" (after prefix), or "Not ranked" when there is no rank this year."""
+    if pd.isna(rank) or pd.isna(rank_total):
+        return "Not ranked"
+    return f"{prefix}#{int(rank)} of {int(rank_total)}"
+
 
 # ----------------- METRO LEVEL -----------------
 def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mode=False):
@@ -33,24 +128,38 @@ def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mo
     city_polygons = city_polygons.reset_index(drop=True)
     city_polygons["id"] = city_polygons.index.astype(str)
 
-    city_polygons_4326 = city_polygons.to_crs(epsg=4326)
-    city_polygons_proj = city_polygons_4326.to_crs(epsg=2163)
-    centroids_proj = city_polygons_proj.geometry.centroid
-    centroids_4326 = gpd.GeoSeries(centroids_proj, crs=2163).to_crs(epsg=4326)
-    city_polygons_4326["center_lat"] = centroids_4326.y
-    city_polygons_4326["center_lon"] = centroids_4326.x
+    # Geometry is already EPSG:4326 with cached equal-area centroids
+    city_polygons_4326 = with_display_centroids(city_polygons)
 
     geojson = json.loads(city_polygons_4326.to_json())
-    vmin = float(city_polygons["avg_metric_value"].min())
-    vmax = float(city_polygons["avg_metric_value"].max())
-    colorscale = get_colorscale(metric_name, is_dark_mode)
+    vmin, vmax, colorbar_ticks = _map_color_range(city_polygons["avg_metric_value"], metric_name)
+    tickprefix, tickformat, ticksuffix = _colorbar_format(metric_name)
 
     fig = go.Figure()
 
     hover_texts = []
     for _, row in city_polygons_4326.iterrows():
-        rank_text = f"#{int(row['rank'])} of {int(row['rank_total'])}"
-        if "PTI" in metric_name:
+        rank_text = _rank_text(row["rank"], row["rank_total"])
+        if is_cluster_label(metric_name):
+            hover_texts.append(
+                f"<b>{row['metro_name']}</b><br>"
+                f"Primary city: {row['city']}<br>"
+                f"Cluster {int(row['avg_metric_value'])}"
+            )
+        elif is_change_label(metric_name):
+            hover_texts.append(
+                f"<b>{row['metro_name']}</b><br>"
+                f"Primary city: {row['city']}<br>"
+                f"{metric_name}: {_format_change(row['avg_metric_value'], metric_name)}"
+            )
+        elif _is_percent_metric(metric_name):
+            hover_texts.append(
+                f"<b>{row['metro_name']}</b><br>"
+                f"Primary city: {row['city']}<br>"
+                f"{metric_name}: {row['avg_metric_value']:.1f}%<br>"
+                f"{rank_text}"
+            )
+        elif "PTI" in metric_name:
             hover_texts.append(
                 f"<b>{row['metro_name']}</b><br>"
                 f"Primary city: {row['city']}<br>"
@@ -71,45 +180,30 @@ def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mo
             locations=city_polygons_4326["id"],
             z=city_polygons_4326["avg_metric_value"],
             featureidkey="properties.id",
-            colorscale=colorscale,
             zmin=vmin,
             zmax=vmax,
             marker_opacity=0.88,
             marker_line_width=0.8,
-            marker_line_color="rgba(249,250,251,0.8)"
-            if not is_dark_mode
-            else "rgba(15,23,42,0.7)",
             colorbar=dict(
                 title=dict(text=metric_name, side="right"),
-                tickprefix="" if "PTI" in metric_name else "$",
-                tickformat=",.2f" if "PTI" in metric_name else ",",
-                ticksuffix="x" if "PTI" in metric_name else "",
+                tickprefix=tickprefix,
+                tickformat=tickformat,
+                ticksuffix=ticksuffix,
+                **colorbar_ticks,
                 thickness=12,
                 len=0.55,
                 y=0.5,
                 yanchor="middle",
-                bgcolor="rgba(255,255,255,0.85)"
-                if not is_dark_mode
-                else "rgba(15,23,42,0.9)",
                 borderwidth=0,
             ),
-            hoverinfo="skip",
-            showscale=True,
-        )
-    )
-
-    fig.add_trace(
-        go.Scattermapbox(
-            lat=city_polygons_4326["center_lat"],
-            lon=city_polygons_4326["center_lon"],
-            mode="markers",
-            marker=dict(size=30, opacity=0.0, color="rgba(0,0,0,0)"),
+            # Polygons carry the click payload themselves, so a click anywhere
+            # inside a metro resolves (not only near its centroid).
             customdata=city_polygons_4326[
                 ["city", "metro_name", "avg_metric_value", "rank", "rank_total"]
             ].values,
             text=hover_texts,
             hovertemplate="%{text}<extra></extra>",
-            showlegend=False,
+            showscale=True,
         )
     )
 
@@ -124,18 +218,15 @@ def create_city_choropleth(df_city, cbsa_gdf, map_style, metric_name, is_dark_mo
         height=650,
         clickmode="event+select",
         dragmode="pan",
-        hoverlabel=dict(
-            bgcolor="white" if not is_dark_mode else "#020617",
-            font_size=13,
-            font_family="Arial",
-        ),
+        hoverlabel=dict(font_size=13, font_family="Arial"),
     )
 
-    return fig, city_polygons_4326
+    return apply_map_theme(fig, metric_name, is_dark_mode, "metro"), city_polygons_4326
 
 # ----------------- ZIP LEVEL -----------------
 def create_zip_choropleth(
-    gdf, map_style, city_coords, center_df, metric_name, is_dark_mode=False
+    gdf, map_style, city_coords, center_df, metric_name, is_dark_mode=False,
+    highlight_zips=None,
 ):
     if gdf.empty:
         return None, None
@@ -147,21 +238,15 @@ def create_zip_choropleth(
 
     gdf = gdf.reset_index(drop=True)
     gdf["id"] = gdf.index.astype(str)
-    gdf = compute_rankings(gdf, "metric_value", "zip_code_str")
+    if "rank" not in gdf.columns:
+        gdf = compute_rankings(gdf, "metric_value", "zip_code_str")
 
-    gdf_4326 = (
-        gdf.to_crs(epsg=4326)
-        if isinstance(gdf, gpd.GeoDataFrame) and gdf.crs and gdf.crs != "EPSG:4326"
-        else gdf.copy()
-    )
+    gdf["rank_text"] = [_rank_text(r, t, "Rank: ") for r, t in zip(gdf["rank"], gdf["rank_total"])]
 
-    if isinstance(gdf_4326, gpd.GeoDataFrame) and gdf_4326.geometry.notna().any():
-        gdf_proj = gdf_4326.to_crs(epsg=2163)
-        centroids_proj = gdf_proj.geometry.centroid
-        centroids_4326 = gpd.GeoSeries(centroids_proj, crs=2163).to_crs(epsg=4326)
-        gdf_4326["center_lat"] = centroids_4326.y
-        gdf_4326["center_lon"] = centroids_4326.x
+    if isinstance(gdf, gpd.GeoDataFrame) and gdf.geometry.notna().any():
+        gdf_4326 = with_display_centroids(gdf)
     else:
+        gdf_4326 = gdf.copy()
         gdf_4326["center_lat"] = center_df["lat"]
         gdf_4326["center_lon"] = center_df["lon"]
 
@@ -176,9 +261,8 @@ def create_zip_choropleth(
         center_lat = gdf_4326["center_lat"].mean()
         center_lon = gdf_4326["center_lon"].mean()
 
-    vmin = float(gdf["metric_value"].min())
-    vmax = float(gdf["metric_value"].max())
-    colorscale = get_colorscale(metric_name, is_dark_mode)
+    vmin, vmax, colorbar_ticks = _map_color_range(gdf["metric_value"], metric_name)
+    tickprefix, tickformat, ticksuffix = _colorbar_format(metric_name)
 
     fig = go.Figure()
     fig.add_trace(
@@ -187,48 +271,70 @@ def create_zip_choropleth(
             locations=gdf_4326["id"],
             z=gdf_4326["metric_value"],
             featureidkey="properties.id",
-            colorscale=colorscale,
             zmin=vmin,
             zmax=vmax,
             marker_opacity=0.9,
             marker_line_width=0.5,
-            marker_line_color="rgba(248,250,252,0.9)"
-            if not is_dark_mode
-            else "rgba(15,23,42,0.8)",
             selected=dict(marker=dict(opacity=1.0)),
             unselected=dict(marker=dict(opacity=0.35)),
             colorbar=dict(
                 title=dict(text=metric_name, side="right"),
-                tickprefix="" if "PTI" in metric_name else "$",
-                tickformat=",.2f" if "PTI" in metric_name else ",",
-                ticksuffix="x" if "PTI" in metric_name else "",
+                tickprefix=tickprefix,
+                tickformat=tickformat,
+                ticksuffix=ticksuffix,
+                **colorbar_ticks,
                 thickness=12,
                 len=0.55,
                 y=0.5,
                 yanchor="middle",
-                bgcolor="rgba(255,255,255,0.85)"
-                if not is_dark_mode
-                else "rgba(15,23,42,0.9)",
                 borderwidth=0,
             ),
             customdata=gdf_4326[
-                ["zip_code_str", "city_full", "metric_value", "rank", "rank_total"]
+                ["zip_code_str", "city_full", "metric_value", "rank_text"]
             ].values,
             hovertemplate=(
                 "<b>ZIP %{customdata[0]}</b><br>"
                 "Metro: %{customdata[1]}<br>"
                 + (
-                    "PTI: %{customdata[2]:.2f}x"
+                    "Cluster %{customdata[2]:.0f}"
+                    if is_cluster_label(metric_name)
+                    else f"{metric_name}: %{{customdata[2]:+.1f}}%"
+                    if is_change_label(metric_name) and _is_percent_metric(metric_name)
+                    else f"{metric_name}: %{{customdata[2]:+.2f}}x"
+                    if is_change_label(metric_name) and "PTI" in metric_name
+                    else f"{metric_name}: $%{{customdata[2]:+,.0f}}"
+                    if is_change_label(metric_name)
+                    else f"{metric_name}: %{{customdata[2]:.1f}}%"
+                    if _is_percent_metric(metric_name)
+                    else "PTI: %{customdata[2]:.2f}x"
                     if "PTI" in metric_name
                     else "Price: $%{customdata[2]:,.0f}"
                 )
-                + "<br>Rank: #%{customdata[3]} of %{customdata[4]}"
+                + (
+                    ""
+                    if is_cluster_label(metric_name) or is_change_label(metric_name)
+                    else "<br>%{customdata[3]}"
+                )
                 + "<extra></extra>"
             ),
             showscale=True,
         )
     )
 
+    # Outline-only overlay (e.g. similar-trajectory matches); same
+    # location ids, so clicks on it resolve like clicks on the base layer
+    fig.add_trace(
+        go.Choroplethmapbox(
+            featureidkey="properties.id",
+            colorscale=[[0, "rgba(0,0,0,0)"], [1, "rgba(0,0,0,0)"]],
+            marker_line_width=3,
+            marker_line_color="#f59e0b",
+            hovertemplate="<b>ZIP %{customdata[0]}</b><br>Similar trajectory<extra></extra>",
+            showscale=False,
+        )
+    )
+    set_zip_highlight(fig, gdf_4326, highlight_zips)
+
     fig.update_layout(
         mapbox=dict(
             style=map_style,
@@ -240,21 +346,52 @@ def create_zip_choropleth(
         height=650,
         clickmode="event+select",
         dragmode="pan",
-        hoverlabel=dict(
-            bgcolor="white" if not is_dark_mode else "#020617",
-            font_size=13,
-            font_family="Arial",
-        ),
+        hoverlabel=dict(font_size=13, font_family="Arial"),
     )
 
-    return fig, gdf_4326
+    return apply_map_theme(fig, metric_name, is_dark_mode, "zip"), gdf_4326
+
+def set_zip_highlight(fig, gdf_4326, highlight_zips):
+    """
+    Point the outline overlay of a ZIP choropleth at highlight_zips, in
+    place. The overlay carries only those ZIPs' features, so a cached
+    figure can follow the selection without being rebuilt.
+    """
+    hl = gdf_4326[gdf_4326["zip_code_str"].isin(highlight_zips or [])]
+    ids = set(hl["id"])
+    features = [f for f in fig.data[0].geojson["features"] if f["properties"]["id"] in ids]
+    fig.data[1].update(
+        geojson={"type": "FeatureCollection", "features": features},
+        locations=hl["id"].tolist(),
+        z=np.zeros(len(hl)),
+        customdata=hl[["zip_code_str"]].values,
+    )
+    return fig
+
 
 # ----------------- HISTORY CHART -----------------
-def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name: str, is_dark_mode: bool = False):
+def create_history_chart(
+    zip_hist: pd.DataFrame,
+    metro_avg: float,
+    metric_name: str,
+    is_dark_mode: bool = False,
+    projection: pd.DataFrame = None,
+    monthly: pd.DataFrame = None,
+    focus_year: int = None,
+):
+    """
+    Year history of one ZIP against the metro average. `projection`
+    (year, value column, lower, upper) adds a dashed projected line with
+    its confidence band, continuing from the last observed year.
+    `monthly` (month, fractional year, value column) adds the monthly
+    series as an LTTB-downsampled WebGL line; `focus_year` zooms the x
+    axis to that year's months.
+    """
     if zip_hist.empty:
         return None
 
-    value_col = "PTI" if "PTI" in metric_name else "price"
+    value_col = history_value_col(metric_name)
+    percent = _is_percent_metric(metric_name)
     line_color = "#2563eb" if not is_dark_mode else "#60a5fa"
     avg_line_color = "#ea580c" if not is_dark_mode else "#fb923c"
     grid_color = "rgba(148,163,184,0.35)" if not is_dark_mode else "rgba(148,163,184,0.3)"
@@ -272,7 +409,9 @@ def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name:
             hovertemplate=(
                 "Year: %{x}<br>"
                 + (
-                    "PTI: %{y:.2f}x"
+                    "Payment: %{y:.1f}% of income"
+                    if percent
+                    else "PTI: %{y:.2f}x"
                     if "PTI" in metric_name
                     else "Price: $%{y:,.0f}"
                 )
@@ -280,6 +419,76 @@ def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name:
             ),
         )
     )
+    if monthly is not None and not monthly.empty:
+        monthly = downsample(monthly, "year", value_col)
+        fig.add_trace(
+            go.Scattergl(
+                x=monthly["year"],
+                y=monthly[value_col],
+                mode="lines",
+                name="Monthly",
+                line=dict(color=line_color, width=1),
+                opacity=0.6,
+                customdata=monthly["month"].dt.strftime("%b %Y"),
+                hovertemplate=(
+                    "%{customdata}<br>"
+                    + (
+                        "Payment: %{y:.1f}% of income"
+                        if percent
+                        else "PTI: %{y:.2f}x"
+                        if "PTI" in metric_name
+                        else "Price: $%{y:,.0f}"
+                    )
+                    + "<extra></extra>"
+                ),
+            )
+        )
+
+    if projection is not None and not projection.empty:
+        # Start the projected line at the last observed point
+        proj = pd.concat(
+            [
+                zip_hist[["year", value_col]].tail(1).assign(
+                    lower=lambda d: d[value_col], upper=lambda d: d[value_col]
+                ),
+                projection,
+            ],
+            ignore_index=True,
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=pd.concat([proj["year"], proj["year"][::-1]]),
+                y=pd.concat([proj["upper"], proj["lower"][::-1]]),
+                fill="toself",
+                fillcolor="rgba(37,99,235,0.12)" if not is_dark_mode else "rgba(96,165,250,0.18)",
+                line=dict(width=0),
+                hoverinfo="skip",
+                name="95% band",
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=proj["year"],
+                y=proj[value_col],
+                mode="lines+markers",
+                name="Projected",
+                line=dict(color=line_color, width=2, dash="dash"),
+                marker=dict(size=5, color=line_color, symbol="circle-open"),
+                customdata=proj[["lower", "upper"]].values,
+                hovertemplate=(
+                    "Year: %{x} (projected)<br>"
+                    + (
+                        "Payment: %{y:.1f}% (%{customdata[0]:.1f}–%{customdata[1]:.1f}%)"
+                        if percent
+                        else "PTI: %{y:.2f}x (%{customdata[0]:.2f}–%{customdata[1]:.2f})"
+                        if "PTI" in metric_name
+                        else "Price: $%{y:,.0f} ($%{customdata[0]:,.0f}–$%{customdata[1]:,.0f})"
+                    )
+                    + "<extra></extra>"
+                ),
+            )
+        )
+
     fig.add_hline(
         y=metro_avg,
         line_dash="dash",
@@ -292,7 +501,9 @@ def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name:
         xref="paper",  
         yref="y",
         text=(
-            f"Metro Avg: {metro_avg:.2f}x"
+            f"Metro Avg: {metro_avg:.1f}%"
+            if percent
+            else f"Metro Avg: {metro_avg:.2f}x"
             if "PTI" in metric_name
             else f"Metro Avg: ${metro_avg:,.0f}"
         ),
@@ -317,12 +528,55 @@ def create_history_chart(zip_hist: pd.DataFrame, metro_avg: float, metric_name:
             title="",
             gridcolor=grid_color,
             tickfont=dict(color=text_color, size=10),
-            tickprefix="" if "PTI" in metric_name else "$",
-            tickformat=",.1f" if "PTI" in metric_name else ",.0f",
+            tickprefix=_colorbar_format(metric_name)[0],
+            tickformat=",.0f" if not percent and "PTI" not in metric_name else ",.1f",
+            ticksuffix="%" if percent else "",
             showline=True,
             linecolor=grid_color,
         ),
         showlegend=False,
-        hovermode="x unified",
+        hovermode="x unified" if monthly is None or monthly.empty else "closest",
+    )
+    if focus_year is not None:
+        fig.update_xaxes(range=[focus_year - 0.05, focus_year + 1 - 1 / 12 + 0.05])
+    return fig
+
+# ----------------- RANK HISTORY CHART -----------------
+def create_rank_history_chart(rank_hist: pd.DataFrame, is_dark_mode: bool = False):
+    """Rank of one ZIP within its metro across years (1 = highest, drawn on top)."""
+    if rank_hist.empty:
+        return None
+
+    line_color = "#7c3aed" if not is_dark_mode else "#a78bfa"
+    grid_color = "rgba(148,163,184,0.35)" if not is_dark_mode else "rgba(148,163,184,0.3)"
+    text_color = "#111827" if not is_dark_mode else "#e5e7eb"
+
+    fig = go.Figure(
+        go.Scatter(
+            x=rank_hist["year"],
+            y=rank_hist["rank"],
+            mode="lines+markers",
+            line=dict(color=line_color, width=2),
+            marker=dict(size=6, color=line_color),
+            customdata=rank_hist[["rank_total", "percentile"]].values,
+            hovertemplate=(
+                "Year: %{x}<br>Rank: #%{y} of %{customdata[0]}"
+                "<br>Percentile: %{customdata[1]:.0f}<extra></extra>"
+            ),
+        )
+    )
+    fig.update_layout(
+        height=180,
+        margin=dict(l=0, r=0, t=10, b=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        xaxis=dict(gridcolor=grid_color, tickfont=dict(color=text_color, size=10)),
+        yaxis=dict(
+            autorange="reversed",
+            gridcolor=grid_color,
+            tickfont=dict(color=text_color, size=10),
+            tickprefix="#",
+        ),
+        showlegend=False,
     )
     return fig
@@ -0,0 +1,264 @@
+# clusters.py
+"""
+k-means clusters of metro and ZIP affordability trajectories.
+
+Each entity of a panel is described by its growth index
+log(value_t / value_first_year) over the panel's years (gaps filled),
+so entities cluster by how their price / PTI moved, not by level.
+Clusters are numbered 1..k from the fastest to the slowest overall
+growth.
+
+Incremental updates: the centroids are saved by the offline step
+preprocess_trajectory_clusters.py. When the panel gains a year, the
+saved centroids are extended by that year (the mean of each cluster's
+members) and k-means restarts from them, so it converges in a few
+iterations over the existing panel instead of a fresh fit from raw rows.
+Without a saved file (or after the year range changes at the start)
+clusters are fitted from a k-means++ seeding.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config_data import TRAJECTORY_CLUSTERS_PATH
+from panel import fill_year_gaps, get_metric_panel, metric_short_name
+
+N_CLUSTERS = {"metro": 6, "zip": 8}
+MIN_CLUSTER_YEARS = 3  # fewer observed years → no cluster
+MAX_KMEANS_ITER = 100
+CLUSTER_LEVELS = list(N_CLUSTERS)
+
+
+def cluster_map_label(metric_type: str) -> str:
+    """Colorbar / metric label of the cluster map mode."""
+    return f"Trajectory cluster · {metric_short_name(metric_type)}"
+
+
+def is_cluster_label(metric_name: str) -> bool:
+    return metric_name.startswith("Trajectory cluster")
+
+
+# =========================
+# 1. Features and k-means
+# =========================
+
+def growth_features(values: np.ndarray):
+    """
+    (features, rows): log growth index of every row of a panel matrix
+    that has enough observed, positive years, and those rows' positions.
+    """
+    filled = fill_year_gaps(values)
+    n_observed = (~np.isnan(values)).sum(axis=1)
+    usable = (n_observed >= MIN_CLUSTER_YEARS) & (np.nan_to_num(filled, nan=-1.0) > 0).all(axis=1)
+    rows = np.flatnonzero(usable)
+    features = np.log(filled[rows] / filled[rows, :1])
+    return features, rows
+
+
+def _assign(features: np.ndarray, centroids: np.ndarray):
+    """Nearest centroid of each row and the squared distance to it."""
+    d2 = (
+        (features**2).sum(axis=1)[:, None]
+        - 2 * features @ centroids.T
+        + (centroids**2).sum(axis=1)[None, :]
+    )
+    labels = d2.argmin(axis=1)
+    return labels, np.maximum(d2[np.arange(len(features)), labels], 0.0)
+
+
+def _kmeans_pp(features: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """k-means++ seeding (deterministic for a given seed)."""
+    rng = np.random.default_rng(seed)
+    centroids = [features[rng.integers(len(features))]]
+    d2 = ((features - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = d2.sum()
+        probs = d2 / total if total > 0 else np.full(len(features), 1 / len(features))
+        centroids.append(features[rng.choice(len(features), p=probs)])
+        d2 = np.minimum(d2, ((features - centroids[-1]) ** 2).sum(axis=1))
+    return np.array(centroids)
+
+
+def run_kmeans(features: np.ndarray, centroids: np.ndarray, max_iter: int = MAX_KMEANS_ITER):
+    """
+    Lloyd iterations from the given centroids. Empty clusters are
+    re-seeded at the rows farthest from their centroid.
+    Returns (labels, centroids, distances, n_iter).
+    """
+    centroids = centroids.astype(float).copy()
+    k = len(centroids)
+    for n_iter in range(1, max_iter + 1):
+        labels, d2 = _assign(features, centroids)
+        counts = np.bincount(labels, minlength=k)
+        updated = np.zeros_like(centroids)
+        np.add.at(updated, labels, features)
+        filled = counts > 0
+        updated[filled] /= counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            updated[empty] = features[np.argsort(-d2)[: len(empty)]]
+
+        converged = np.allclose(updated, centroids)
+        centroids = updated
+        if converged:
+            break
+    labels, d2 = _assign(features, centroids)
+    return labels, centroids, np.sqrt(d2), n_iter
+
+
+# =========================
+# 2. Cluster model
+# =========================
+
+class TrajectoryClusters:
+    """
+    Cluster centroids over a panel's years, plus (after fit) per-row
+    results aligned with the panel's keys:
+
+    - labels   : cluster number 1..k of each panel row (0 = not clustered)
+    - distance : distance of each row to its centroid (NaN if not clustered)
+    - n_iter   : k-means iterations the fit took
+    """
+
+    def __init__(self, years, centroids, labels=None, distance=None, n_iter=0):
+        self.years = np.asarray(years, dtype=int)
+        self.centroids = np.asarray(centroids, dtype=float)
+        self.labels = labels
+        self.distance = distance
+        self.n_iter = n_iter
+
+    def __len__(self):
+        return len(self.centroids)
+
+    @classmethod
+    def fit(cls, panel, k: int, previous: "TrajectoryClusters" = None) -> "TrajectoryClusters":
+        """Cluster the rows of `panel`, warm-starting from `previous` when it fits."""
+        features, rows = growth_features(panel.values)
+        labels = np.zeros(len(panel.keys), dtype=int)
+        distance = np.full(len(panel.keys), np.nan)
+        k = min(k, len(rows))
+        if k == 0:
+            return cls(panel.years, np.empty((0, len(panel.years))), labels, distance)
+
+        init = previous.warm_start(features, panel.years) if previous is not None else None
+        if init is None or len(init) != k:
+            init = _kmeans_pp(features, k)
+        row_labels, centroids, row_distance, n_iter = run_kmeans(features, init)
+
+        # Number clusters by overall growth: 1 = fastest
+        order = np.argsort(-centroids[:, -1], kind="stable")
+        number = np.empty(k, dtype=int)
+        number[order] = np.arange(1, k + 1)
+        labels[rows] = number[row_labels]
+        distance[rows] = row_distance
+        return cls(panel.years, centroids[order], labels, distance, n_iter)
+
+    def warm_start(self, features: np.ndarray, years: np.ndarray):
+        """
+        Initial centroids for `features` over `years` from these centroids,
+        or None unless this model's years are a leading run of `years`.
+        New years get the mean of each cluster's members (members found on
+        the old years).
+        """
+        n_old = len(self.years)
+        if len(self) == 0 or n_old > len(years) or not np.array_equal(self.years, years[:n_old]):
+            return None
+
+        init = np.empty((len(self), len(years)))
+        init[:, :n_old] = self.centroids
+        if len(years) > n_old:
+            labels, _ = _assign(features[:, :n_old], self.centroids)
+            counts = np.bincount(labels, minlength=len(self))
+            for j in range(n_old, len(years)):
+                sums = np.bincount(labels, weights=features[:, j], minlength=len(self))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    init[:, j] = np.where(counts > 0, sums / counts, self.centroids[:, -1])
+        return init
+
+
+def save_cluster_centroids(models: dict, path: str = TRAJECTORY_CLUSTERS_PATH):
+    """Save {(level, metric_type): TrajectoryClusters} centroids to one .npz."""
+    arrays = {}
+    for (level, metric_type), model in models.items():
+        arrays[f"{level}|{metric_type}|years"] = model.years
+        arrays[f"{level}|{metric_type}|centroids"] = model.centroids
+    np.savez_compressed(path, **arrays)
+
+
+def load_cluster_centroids(path: str = TRAJECTORY_CLUSTERS_PATH) -> dict:
+    """Saved centroids keyed by (level, metric_type); empty if never built."""
+    if not os.path.exists(path):
+        return {}
+    models = {}
+    with np.load(path) as data:
+        for name in data.files:
+            level, metric_type, field = name.split("|")
+            if field == "years":
+                models[(level, metric_type)] = TrajectoryClusters(
+                    data[name], data[f"{level}|{metric_type}|centroids"]
+                )
+    return models
+
+
+# =========================
+# 3. Cached clusters
+# =========================
+
+@st.cache_resource(show_spinner=False)
+def _saved_centroids() -> dict:
+    return load_cluster_centroids()
+
+
+@st.cache_resource(max_entries=16, show_spinner="🧩 Clustering trajectories...")
+def get_trajectory_clusters(level: str, metric_type: str) -> TrajectoryClusters:
+    """Clusters of the ("metro" | "zip", metric_type) panel, fitted once per process."""
+    return TrajectoryClusters.fit(
+        get_metric_panel(level, metric_type),
+        N_CLUSTERS[level],
+        previous=_saved_centroids().get((level, metric_type)),
+    )
+
+
+def get_cluster_table(level: str, metric_type: str) -> pd.DataFrame:
+    """Panel keys plus a "cluster" column (float, NaN where not clustered)."""
+    clusters = get_trajectory_clusters(level, metric_type)
+    table = get_metric_panel(level, metric_type).keys.copy()
+    table["cluster"] = np.where(clusters.labels > 0, clusters.labels, np.nan)
+    return table
+
+
+def cluster_summary(level: str, metric_type: str, n_examples: int = 3) -> pd.DataFrame:
+    """
+    One row per cluster: cluster, members, growth_pct (the centroid's
+    first-to-last-year change) and the most typical members (closest to
+    the centroid).
+    """
+    clusters = get_trajectory_clusters(level, metric_type)
+    table = get_cluster_table(level, metric_type)
+    table["distance"] = clusters.distance
+    name_col = "zip_code_str" if level == "zip" else "city_full"
+
+    rows = []
+    for number, centroid in enumerate(clusters.centroids, start=1):
+        members = table[table["cluster"] == number]
+        rows.append(
+            {
+                "cluster": number,
+                "members": len(members),
+                "growth_pct": (np.exp(centroid[-1]) - 1) * 100,
+                "examples": ", ".join(members.nsmallest(n_examples, "distance")[name_col]),
+            }
+        )
+    return pd.DataFrame(rows, columns=["cluster", "members", "growth_pct", "examples"])
+
+
+def metros_in_cluster(metric_type: str, city: str) -> list:
+    """city_full of every metro in the same cluster as `city` (empty if none)."""
+    table = get_cluster_table("metro", metric_type)
+    cluster = table.loc[table["city"] == city, "cluster"]
+    if cluster.empty or pd.isna(cluster.iloc[0]):
+        return []
+    return sorted(table.loc[table["cluster"] == cluster.iloc[0], "city_full"].unique())
@@ -18,6 +18,8 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 
+from affordability import classify_affordability
+
 # Only needed if you still use Databricks
 #from databricks import sql
 #from databricks.sdk.core import Config
@@ -32,6 +34,7 @@ USE_LOCAL_DATA = True
 
 # Local file paths (you can change these later)
 LOCAL_HOUSE_FILE = "data/house_ts_agg.csv"   # or .csv
+LOCAL_MONTHLY_FILE = "HouseTS.csv"           # raw monthly rows (offline only)
 #LOCAL_ZIP_GEO_FILE = "data/zip_geo.parquet"      # or .csv
 
 # ============================================================
@@ -48,6 +51,19 @@ ZCTA_SHP_PATH = "data/cb_2018_us_zcta510_500k.shp"
 CBSA_ZIP_PATH = "data/cbsa_shapes.zip"
 ZCTA_ZIP_PATH = "data/zcta_shapes.zip"
 
+# Precomputed ZIP adjacency graph (built by preprocess_zip_adjacency.py)
+ZIP_ADJACENCY_PATH = "data/zip_adjacency.npz"
+
+# Trajectory cluster centroids (built by preprocess_trajectory_clusters.py)
+TRAJECTORY_CLUSTERS_PATH = "data/trajectory_clusters.npz"
+
+# Delta-encoded ZIP × month prices (built by preprocess_monthly_store.py)
+MONTHLY_STORE_PATH = "data/zip_monthly.npz"
+
+# Coordinate reference systems
+DISPLAY_EPSG = 4326      # lon/lat, used for GeoJSON / mapbox
+EQUAL_AREA_EPSG = 2163   # US National Atlas equal-area, used for centroids
+
 
 # Map center & zoom
 US_CENTER_LAT = 39.8283
@@ -343,6 +359,41 @@ def _load_all_data_local() -> pd.DataFrame:
 
     return _standardize_house_df(house)
 
+def load_monthly_rows() -> pd.DataFrame:
+    """
+    Monthly rows before the yearly aggregation, for the offline monthly
+    store: city, city_full, zip_code_str, month (datetime64),
+    median_sale_price.
+    """
+    if USE_LOCAL_DATA:
+        # Same file and column handling as dataprep.load_data
+        raw = pd.read_csv(os.path.join(os.path.dirname(__file__), LOCAL_MONTHLY_FILE))
+        raw = raw.rename(columns={"zipcode": "zip_code", "city": "city_geojson_code"})
+        if "city_full" not in raw.columns:
+            raw["city_full"] = raw["city_geojson_code"] + " Metro Area"
+        raw = raw.rename(columns={"city_geojson_code": "city"})
+    else:
+        raw = _sql_query(
+            f"""
+            SELECT city, city_full, zip_code, date, median_sale_price
+            FROM {HOUSE_TABLE}
+            WHERE median_sale_price IS NOT NULL
+              AND median_sale_price > 0
+            """
+        )
+
+    zip_code = pd.to_numeric(raw["zip_code"], errors="coerce")
+    df = pd.DataFrame(
+        {
+            "city": raw["city"],
+            "city_full": raw["city_full"],
+            "zip_code_str": zip_code.astype("Int64").astype(str).str.zfill(5),
+            "month": pd.to_datetime(raw["date"]).dt.to_period("M").dt.to_timestamp(),
+            "median_sale_price": pd.to_numeric(raw["median_sale_price"], errors="coerce"),
+        }
+    )
+    return df[zip_code.notna() & (df["median_sale_price"] > 0)]
+
 @st.cache_data(show_spinner="📊 Loading housing data...")
 def load_all_data() -> pd.DataFrame:
     """
@@ -362,6 +413,48 @@ def load_all_data() -> pd.DataFrame:
         df = _load_all_data_databricks()
     return df
 
+@st.cache_data(show_spinner="Loading required data...")
+def load_affordability_data():
+    """
+    Metro × year price-to-income medians with affordability ratings
+    (ratio_agg), the sorted metro names (city_order) and metro × year
+    median prices (prices_year) for the comparison dashboard.
+    """
+    df = pd.read_csv(LOCAL_HOUSE_FILE)
+    df = df.fillna(0)
+
+    # Price to Income Data Preparation
+    df["Price_Income_Ratio"] = df["median_sale_price"] / df["per_capita_income"]
+
+    ratio_agg = (
+        df.groupby(["city_full", "year"], as_index=False).agg(
+            {
+                "Price_Income_Ratio": "median",
+                "median_sale_price": "median",
+                "per_capita_income": "median",
+            }
+        )
+    )
+
+    ratio_agg["Affordability"] = classify_affordability(ratio_agg["Price_Income_Ratio"])
+
+    city_order = sorted(df["city_full"].unique())
+
+    # Metro × year median prices for the price-change bars
+    prices_agg = (
+        df.groupby(["city_full", "year"], as_index=False).agg(
+            {"median_sale_price": "median"}
+        )
+    )
+
+    prices_year = pd.pivot(
+        prices_agg, index=["city_full"], columns="year", values="median_sale_price"
+    )
+    prices_year = prices_year.reset_index()
+    prices_year.columns = prices_year.columns.astype(str)
+
+    return ratio_agg, city_order, prices_year
+
 # ============================================================
 # 6. Metric utilities: PTI, rankings, YoY
 # ============================================================
@@ -438,23 +531,3 @@ def compute_yoy(
     merged["yoy_change"] = merged[value_col] - merged[f"{value_col}_prev"]
     merged["yoy_pct"] = (merged["yoy_change"] / merged[f"{value_col}_prev"] * 100).round(1)
     return merged
-
-@st.cache_data
-def get_metro_yoy(df_all_input: pd.DataFrame, current_year: int, metric_type_input: str) -> pd.DataFrame:
-    """
-    Cached helper to compute metro-level year-over-year changes
-    for either PTI or median sale price.
-
-    metric_type_input should be one of:
-        - "Price-to-Income Ratio (PTI)"
-        - "Median Sale Price"
-    """
-    df_all_local = df_all_input.copy()
-    if metric_type_input == "Price-to-Income Ratio (PTI)":
-        df_processed = compute_pti(df_all_local)
-        value_col = "PTI"
-    else:
-        df_processed = df_all_local[df_all_local["median_sale_price"].notna()].copy()
-        value_col = "median_sale_price"
-
-    return compute_yoy(df_processed, current_year, ["city", "city_full"], value_col)
@@ -7,40 +7,24 @@ import os
 import streamlit as st
 from typing import Optional
 
+from affordability import (
+    AFFORDABILITY_THRESHOLD,
+    AFFORDABILITY_CATEGORIES,
+    NA_TIER,
+    classify_affordability,
+)
+
 # --- Define Constants at the TOP LEVEL ---
 LOCAL_CSV_PATH = "HouseTS.csv"
 CSV_URL = "https://github.com/yyy1029/House-Browse/releases/download/v1.0/HouseTS.csv"
 RATIO_COL = "price_to_income_ratio"
 RATIO_COL_ZIP = "price_to_income_ratio_zip"
-AFFORDABILITY_THRESHOLD = 3.0
-AFFORDABILITY_CATEGORIES = {
-    "Affordable": (None, 3.0), "Moderately Unaffordable": (3.0, 4.0), 
-    "Seriously Unaffordable": (4.0, 5.0), "Severely Unaffordable": (5.0, 8.9), 
-    "Impossibly Unaffordable": (8.9, None),
-}
 AFFORDABILITY_COLORS = {
     "Affordable": "green", "Moderately Unaffordable": "yellowgreen", 
     "Seriously Unaffordable": "orange", "Severely Unaffordable": "red", 
     "Impossibly Unaffordable": "darkred",
 }
 
-def classify_affordability(ratio: float) -> str:
-    """Classifies a price-to-income ratio."""
-    if pd.isna(ratio): return "N/A"
-    
-    sorted_categories = sorted(AFFORDABILITY_CATEGORIES.items(), 
-                               key=lambda item: item[1][1] if item[1][1] is not None else float('inf'))
-
-    for category, (lower, upper) in sorted_categories:
-        if category == "Affordable":
-            if ratio <= upper: return category
-        elif lower is not None and upper is None:
-            if ratio > lower: return category
-        elif lower is not None and upper is not None:
-            if lower < ratio <= upper: return category
-            
-    return "Uncategorized"
-
 @st.cache_data(ttl=3600*24)
 def load_data() -> pd.DataFrame:
     """Loads and standardizes data."""
@@ -91,21 +75,27 @@ def apply_income_filter(df: pd.DataFrame, annual_income: float) -> pd.DataFrame:
     return df.copy() # NOTE: Returns copy of full data for map context
 
 
-@st.cache_data(ttl=3600*24)
-def make_city_view_data(df_full: pd.DataFrame, annual_income: float, year: int, budget_pct: float = 30):
-    """Aggregates data for the bar chart."""
-    df_year = df_full[df_full['year'] == year].copy()
-
-    # Aggregate by the GeoJSON code ('city_geojson_code')
-    city_agg = df_year.groupby("city_geojson_code").agg(
+def _aggregate_city_year(df: pd.DataFrame, by: list) -> pd.DataFrame:
+    """Metro-level medians and price-to-income ratio, grouped by `by`."""
+    city_agg = df.groupby(by).agg(
         median_sale_price=("median_sale_price", "median"), 
         per_capita_income=("per_capita_income", "median"), 
         city_full=("city_full", "first"), 
     ).reset_index()
 
     city_agg[RATIO_COL] = city_agg["median_sale_price"] / city_agg["per_capita_income"]
-    city_agg["affordability_rating"] = city_agg[RATIO_COL].apply(classify_affordability)
-    city_agg["affordable"] = city_agg[RATIO_COL] <= AFFORDABILITY_THRESHOLD
+    return city_agg
+
+
+@st.cache_data(ttl=3600*24)
+def make_city_view_data(df_full: pd.DataFrame, annual_income: float, year: int, budget_pct: float = 30):
+    """Aggregates data for the bar chart."""
+    df_year = df_full[df_full['year'] == year].copy()
+
+    # Aggregate by the GeoJSON code ('city_geojson_code')
+    city_agg = _aggregate_city_year(df_year, ["city_geojson_code"])
+    city_agg["affordability_rating"] = classify_affordability(city_agg[RATIO_COL])
+    city_agg["affordable"] = city_agg[RATIO_COL] < AFFORDABILITY_THRESHOLD
 
     # Rename columns for display in charts/tables
     city_agg.rename(
@@ -119,6 +109,89 @@ def make_city_view_data(df_full: pd.DataFrame, annual_income: float, year: int,
     return city_agg
 
 
+@st.cache_data(ttl=3600*24)
+def make_history_overview(df_full: pd.DataFrame):
+    """
+    All-years history for the Dataset Historical Overview charts.
+
+    One groupby builds the (year, metro) median table; both series are
+    derived from it:
+      - median_history : year, median_ratio (median of metro ratios)
+      - prop_history   : year, category, percentage of metros per tier
+    """
+    city_year = _aggregate_city_year(df_full, ["year", "city_geojson_code"])
+    city_year = city_year[city_year[RATIO_COL].notna()]
+
+    median_history = (
+        city_year.groupby("year", as_index=False)[RATIO_COL]
+        .median()
+        .rename(columns={RATIO_COL: "median_ratio"})
+    )
+
+    category = classify_affordability(city_year[RATIO_COL], labels=True)
+    shares = pd.crosstab(city_year["year"], category, normalize="index", dropna=False) * 100
+    tier_labels = [c for c in category.cat.categories if c != NA_TIER]
+    prop_history = (
+        shares.reindex(columns=tier_labels, fill_value=0.0)
+        .rename_axis(index="year", columns="category")
+        .stack()
+        .rename("percentage")
+        .reset_index()
+    )
+    return median_history, prop_history
+
+
+@st.cache_data(ttl=3600*24)
+def make_income_required_curves(df_full: pd.DataFrame) -> pd.DataFrame:
+    """
+    Income needed to afford each ZIP, for every metro and year at once.
+
+    A ZIP is affordable when its median sale price is below
+    AFFORDABILITY_THRESHOLD × income, so it needs an income above
+    price / AFFORDABILITY_THRESHOLD. Rows are sorted by
+    (city_geojson_code, year, income_required) in one pass; within each
+    metro/year, affordable_share is the percent of that metro's ZIPs
+    affordable once income exceeds the row's income_required.
+    """
+    zip_year = (
+        df_full.dropna(subset=["median_sale_price"])
+        .groupby(["city_geojson_code", "year", "zipcode"], as_index=False)
+        .agg(median_sale_price=("median_sale_price", "median"), city_full=("city_full", "first"))
+    )
+    zip_year["income_required"] = zip_year["median_sale_price"] / AFFORDABILITY_THRESHOLD
+
+    curves = zip_year.sort_values(
+        ["city_geojson_code", "year", "income_required"], kind="mergesort"
+    ).reset_index(drop=True)
+    group = curves.groupby(["city_geojson_code", "year"], sort=False)
+    n_zips = group["zipcode"].transform("size")
+    curves["affordable_share"] = (group.cumcount() + 1) / n_zips * 100
+    return curves
+
+
+def get_income_curve(curves: pd.DataFrame, city_name: str, year: int) -> pd.DataFrame:
+    """Rows of make_income_required_curves for one metro (GeoJSON code) and year."""
+    mask = (curves["city_geojson_code"] == city_name) & (curves["year"] == year)
+    return curves[mask]
+
+
+def affordable_share_at_income(curve: pd.DataFrame, annual_income: float) -> float:
+    """Percent of a metro/year curve's ZIPs affordable at annual_income."""
+    if curve.empty:
+        return 0.0
+    n = np.searchsorted(curve["income_required"].to_numpy(), annual_income, side="left")
+    return n / len(curve) * 100
+
+
+def income_for_share(curve: pd.DataFrame, share_pct: float) -> float:
+    """Smallest income_required that reaches share_pct of a curve's ZIPs (NaN if empty)."""
+    if curve.empty:
+        return np.nan
+    shares = curve["affordable_share"].to_numpy()
+    pos = min(np.searchsorted(shares, share_pct, side="left"), len(shares) - 1)
+    return float(curve["income_required"].iloc[pos])
+
+
 def make_city_history(df: pd.DataFrame, city_name: str) -> pd.DataFrame:
     """
     Return year-level history for a selected city:
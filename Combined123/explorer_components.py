@@ -0,0 +1,151 @@
+# explorer_components.py
+"""
+Client-side filtering for the Price Affordability Finder (pages/app_d3.py).
+
+Metro filtering / sorting and the ZIP income slider used to rerun the
+whole page on every change. Here the data for the selected year (and
+metro) is shipped to the browser once as Arrow tables, and two local
+components do the filtering there:
+
+    - metro_ranking  : metro multiselect + sort + ranking bar chart, and a
+                       "breakdown" instance (one chart per affordability
+                       category) that follows the same filter
+    - zip_income_map : ZIP map with the income slider; ZIPs with income
+                       above the slider are hidden per animation frame
+
+Python is only involved when the year or metro changes (a new `version`),
+and when the slider is released (to keep the profile income in sync).
+Metro GeoJSON files are read once per process (load_zip_geojson), so the
+page can prefetch the metros the user is likely to open next.
+"""
+
+import json
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+
+from affordability import AFFORDABILITY_CATEGORIES
+from dataprep import AFFORDABILITY_COLORS, AFFORDABILITY_THRESHOLD, RATIO_COL
+from zip_module import MAX_ZIP_RATIO_CLIP, get_income_sweep_index
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_COMPONENTS_DIR = os.path.join(_BASE_DIR, "components")
+GEOJSON_DIR = os.path.join(_BASE_DIR, "city_geojson")
+_metro_ranking = components.declare_component(
+    "metro_ranking", path=os.path.join(_COMPONENTS_DIR, "metro_ranking")
+)
+_zip_income_map = components.declare_component(
+    "zip_income_map", path=os.path.join(_COMPONENTS_DIR, "zip_income_map")
+)
+
+# Same range / step as the Streamlit slider it replaces (ui_components)
+INCOME_MIN, INCOME_MAX, INCOME_STEP = 20000, 200000, 1000
+
+
+# =========================
+# 1. Metro ranking
+# =========================
+
+def metro_ranking_table(city_data: pd.DataFrame) -> pd.DataFrame:
+    """Compact per-metro table shipped to the browser (plain strings, floats)."""
+    return pd.DataFrame(
+        {
+            "city": city_data["city"].astype(str),
+            "city_full": city_data["city_full"].astype(str),
+            "price": city_data["Median Sale Price"].astype(float),
+            "income": city_data["Per Capita Income"].astype(float),
+            "ratio": city_data[RATIO_COL].astype(float),
+            "rating": city_data["affordability_rating"].astype(str),
+        }
+    ).reset_index(drop=True)
+
+
+def metro_ranking(city_data: pd.DataFrame, year: int, mode: str = "ranking", key: str = None):
+    """
+    Ranking bar chart (mode="ranking") or per-category breakdown
+    (mode="breakdown") of the year's metros, filtered and sorted client-side.
+    """
+    _metro_ranking(
+        table=metro_ranking_table(city_data),
+        version=f"{year}:{len(city_data)}",
+        mode=mode,
+        categories=[[name, upper] for name, (_, upper) in AFFORDABILITY_CATEGORIES.items()],
+        colors=AFFORDABILITY_COLORS,
+        key=key or f"metro_{mode}",
+        default=None,
+    )
+
+
+# =========================
+# 2. ZIP income map
+# =========================
+
+def zip_geojson_path(city_code: str) -> str:
+    """Path of a metro's ZIP GeoJSON (city_geojson/<city_geojson_code>.geojson)."""
+    return os.path.join(GEOJSON_DIR, f"{city_code}.geojson")
+
+
+@st.cache_resource(show_spinner=False)
+def load_zip_geojson(city_code: str):
+    """A metro's ZIP GeoJSON, read once per process; None if the file is missing."""
+    path = zip_geojson_path(city_code)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def prefetch_zip_income_map(city_code: str) -> list:
+    """Prefetch steps of a metro's ZIP income map: the ZIP index and its GeoJSON."""
+    return [get_income_sweep_index, partial(load_zip_geojson, city_code)]
+
+
+def zip_income_rows(df_zip: pd.DataFrame) -> pd.DataFrame:
+    """Compact per-ZIP table shipped to the browser."""
+    return pd.DataFrame(
+        {
+            # GeoJSON ids are zero-padded strings (Boston ZIPs are 02xxx)
+            "zip": df_zip["zip_code_int"].astype(str).str.zfill(5),
+            "zip_code_str": df_zip["zip_code_str"].astype(str),
+            "price": df_zip["median_sale_price"].astype(float),
+            "income": df_zip["per_capita_income"].astype(float),
+            "ratio": df_zip[RATIO_COL].astype(float),
+            "ratio_for_map": df_zip["ratio_for_map"].astype(float),
+            "rating": df_zip["affordability_rating"].astype(str),
+        }
+    ).reset_index(drop=True)
+
+
+def _sync_income(key: str):
+    """Released slider value → the page's income (manual box and slider keys)."""
+    value = st.session_state.get(key) or {}
+    if "income" in value:
+        st.session_state.income_manual_key = int(value["income"])
+        st.session_state.income_slider_key = int(value["income"])
+
+
+def zip_income_map(df_zip: pd.DataFrame, geojson: dict, version: str, income: float, key: str = "zip_income_map"):
+    """
+    ZIP map of every row of one metro/year with the income slider applied
+    in the browser. `version` identifies the metro/year.
+    """
+    _zip_income_map(
+        rows=zip_income_rows(df_zip),
+        geojson=geojson,
+        featureidkey="properties.ZCTA5CE10",
+        center={"lat": float(np.nanmean(df_zip["lat"])), "lon": float(np.nanmean(df_zip["lon"]))},
+        zmax=MAX_ZIP_RATIO_CLIP,
+        threshold=AFFORDABILITY_THRESHOLD,
+        income=int(income),
+        income_min=INCOME_MIN,
+        income_max=INCOME_MAX,
+        income_step=INCOME_STEP,
+        version=version,
+        key=key,
+        default=None,
+        on_change=lambda: _sync_income(key),
+    )
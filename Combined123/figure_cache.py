@@ -0,0 +1,117 @@
+# figure_cache.py
+"""
+Process-wide LRU cache of finished map figures.
+
+Building a choropleth (GeoJSON serialization, hover texts, trace
+validation) is the most expensive part of a rerun, yet most reruns come
+from widgets that don't change the map (expanders, the dashboard
+multiselect, the ZIP detail card). Figures are cached under the
+parameters that determine them:
+    (view, year, map label, fingerprint of the input frame)
+Theme and base map style are not part of the key: charts.apply_map_theme
+restyles a cached figure per render.
+
+The cache holds at most FIGURE_CACHE_BYTES (estimated from each figure's
+JSON size plus its companion frame); least recently used figures are
+evicted first. Cached figures are shared across sessions, so restyling
+and rendering happen under the cache lock (see `checkout`).
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+
+FIGURE_CACHE_BYTES = 128 * 1024 * 1024
+
+
+def frame_fingerprint(df: pd.DataFrame, columns: list) -> int:
+    """Cheap content hash of the columns of df that feed a figure."""
+    cols = [c for c in columns if c in df.columns]
+    return int(pd.util.hash_pandas_object(df[cols], index=False).sum())
+
+
+def figure_nbytes(fig, companion=None) -> int:
+    """Approximate memory of a cached entry: figure JSON + companion frame."""
+    nbytes = len(pio.to_json(fig, validate=False))
+    if isinstance(companion, pd.DataFrame):
+        nbytes += int(companion.memory_usage(deep=True).sum())
+    return nbytes
+
+
+class FigureCache:
+    """Bounded LRU of (figure, companion) pairs with byte accounting."""
+
+    def __init__(self, max_bytes: int = FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key → (value, nbytes)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes: int):
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return  # larger than the whole budget: never cached
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, freed) = self._entries.popitem(last=False)
+                self.nbytes -= freed
+                self.evictions += 1
+
+    def get_or_build(self, key, build):
+        """
+        Cached (figure, companion) for key, or build() and cache it.
+        Results whose figure is None (nothing to draw) are not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = build()
+        fig, companion = value
+        if fig is not None:
+            self.put(key, value, figure_nbytes(fig, companion))
+        return value
+
+    @contextmanager
+    def checkout(self):
+        """Hold the cache lock while a shared figure is restyled and rendered."""
+        with self._lock:
+            yield
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "mb": self.nbytes / 1024**2,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_figure_cache() -> FigureCache:
+    """The process-wide FigureCache."""
+    return FigureCache()
@@ -1,9 +1,11 @@
 # geo_utils.py
 import os
+import functools
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 import streamlit as st
+from pyproj import Transformer
 
 from config_data import (
     CBSA_SHP_PATH,
@@ -11,6 +13,8 @@ from config_data import (
     CBSA_ZIP_PATH,
     ZCTA_ZIP_PATH,
     MANUAL_CBSA_NAME_MAP,
+    DISPLAY_EPSG,
+    EQUAL_AREA_EPSG,
 )
 from config_data import compute_rankings
 
@@ -47,30 +51,94 @@ def _resolve_shapefile_path(shp_path: str, zip_path: str, label: str) -> str:
     )
 
 
-@st.cache_resource(show_spinner="🗺️ Loading ZIP code boundaries...")
-def load_zcta_shapes() -> gpd.GeoDataFrame:
-    """Load ZCTA (ZIP Code Tabulation Area) boundaries."""
-    path = _resolve_shapefile_path(ZCTA_SHP_PATH, ZCTA_ZIP_PATH, "ZCTA")
-    gdf = gpd.read_file(path)
+_SHAPE_SOURCES = {
+    "zcta": (ZCTA_SHP_PATH, ZCTA_ZIP_PATH, "ZCTA"),
+    "cbsa": (CBSA_SHP_PATH, CBSA_ZIP_PATH, "CBSA"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(src_epsg: int, dst_epsg: int) -> Transformer:
+    """Cached pyproj Transformer (x/y order = lon/lat)."""
+    return Transformer.from_crs(src_epsg, dst_epsg, always_xy=True)
 
-    if "ZCTA5CE10" not in gdf.columns:
-        raise RuntimeError("ZCTA shapefile is missing the column 'ZCTA5CE10'.")
 
-    gdf["zip_code_str"] = gdf["ZCTA5CE10"].astype(str).str.zfill(5)
+def _equal_area_centroids(geoms_equal_area: gpd.GeoSeries):
+    """Centroids of equal-area geometries, returned as (lon, lat) arrays."""
+    centroids = geoms_equal_area.centroid
+    return get_transformer(EQUAL_AREA_EPSG, DISPLAY_EPSG).transform(
+        centroids.x.to_numpy(), centroids.y.to_numpy()
+    )
+
+
+def with_display_centroids(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Return gdf in DISPLAY_EPSG with center_lat / center_lon columns.
+
+    Frames derived from the cached shape layers already carry
+    centroid_lat / centroid_lon, so this is only a column copy; anything
+    else is reprojected once as a fallback.
+    """
+    if gdf.crs is not None and gdf.crs.to_epsg() != DISPLAY_EPSG:
+        gdf = gdf.to_crs(epsg=DISPLAY_EPSG)
+    else:
+        gdf = gdf.copy()
+
+    if {"centroid_lat", "centroid_lon"}.issubset(gdf.columns):
+        gdf["center_lat"] = gdf["centroid_lat"]
+        gdf["center_lon"] = gdf["centroid_lon"]
+    else:
+        lon, lat = _equal_area_centroids(gdf.geometry.to_crs(epsg=EQUAL_AREA_EPSG))
+        gdf["center_lat"] = lat
+        gdf["center_lon"] = lon
     return gdf
 
 
+@st.cache_resource(show_spinner=False)
+def _load_shape_layers(kind: str):
+    """
+    Read a boundary shapefile once and keep it in both CRSs:
+        - display layer    : GeoDataFrame in DISPLAY_EPSG, with
+                             centroid_lat / centroid_lon precomputed
+        - equal-area layer : GeoSeries in EQUAL_AREA_EPSG (same index)
+    """
+    shp_path, zip_path, label = _SHAPE_SOURCES[kind]
+    path = _resolve_shapefile_path(shp_path, zip_path, label)
+    gdf = gpd.read_file(path)
+
+    if kind == "zcta":
+        if "ZCTA5CE10" not in gdf.columns:
+            raise RuntimeError("ZCTA shapefile is missing the column 'ZCTA5CE10'.")
+        gdf["zip_code_str"] = gdf["ZCTA5CE10"].astype(str).str.zfill(5)
+    else:
+        if "NAME" not in gdf.columns:
+            raise RuntimeError("CBSA shapefile is missing the column 'NAME'.")
+        gdf["name_lower"] = gdf["NAME"].astype(str).str.lower()
+
+    gdf = gdf.to_crs(epsg=DISPLAY_EPSG)
+    geoms_equal_area = gdf.geometry.to_crs(epsg=EQUAL_AREA_EPSG)
+
+    lon, lat = _equal_area_centroids(geoms_equal_area)
+    gdf["centroid_lat"] = lat
+    gdf["centroid_lon"] = lon
+    return gdf, geoms_equal_area
+
+
+@st.cache_resource(show_spinner="🗺️ Loading ZIP code boundaries...")
+def load_zcta_shapes() -> gpd.GeoDataFrame:
+    """Load ZCTA (ZIP Code Tabulation Area) boundaries (EPSG:4326)."""
+    return _load_shape_layers("zcta")[0]
+
+
 @st.cache_resource(show_spinner="🏙️ Loading metro area boundaries...")
 def load_cbsa_shapes() -> gpd.GeoDataFrame:
-    """Load CBSA (Core-Based Statistical Area) boundaries."""
-    path = _resolve_shapefile_path(CBSA_SHP_PATH, CBSA_ZIP_PATH, "CBSA")
-    gdf = gpd.read_file(path)
+    """Load CBSA (Core-Based Statistical Area) boundaries (EPSG:4326)."""
+    return _load_shape_layers("cbsa")[0]
 
-    if "NAME" not in gdf.columns:
-        raise RuntimeError("CBSA shapefile is missing the column 'NAME'.")
 
-    gdf["name_lower"] = gdf["NAME"].astype(str).str.lower()
-    return gdf
+def load_equal_area_geometry(kind: str) -> gpd.GeoSeries:
+    """Cached EQUAL_AREA_EPSG geometries for "zcta" or "cbsa" shapes."""
+    return _load_shape_layers(kind)[1]
 
 
 # =========================
@@ -140,22 +208,17 @@ def build_city_cbsa_polygons(
     Given aggregated city-level metrics, match each city to a corresponding CBSA polygon.
     Returns a GeoDataFrame suitable for metro-level choropleths.
     """
-    cbsa_gdf = _cbsa_gdf.copy()
+    # Shapes from load_cbsa_shapes() are already in EPSG:4326 with
+    # equal-area centroids; only foreign frames need the fallback.
+    cbsa_gdf = _cbsa_gdf
+    if "centroid_lat" not in cbsa_gdf.columns:
+        cbsa_gdf = with_display_centroids(cbsa_gdf).rename(
+            columns={"center_lat": "centroid_lat", "center_lon": "centroid_lon"}
+        )
     if "name_lower" not in cbsa_gdf.columns:
+        cbsa_gdf = cbsa_gdf.copy()
         cbsa_gdf["name_lower"] = cbsa_gdf["NAME"].astype(str).str.lower()
 
-    # Precompute centroids (EPSG 4326) for nearest-distance fallback
-    cbsa_4326 = cbsa_gdf.to_crs(epsg=4326)
-    # Earlier method of calculating centroid used degress was off since .centroid applies simple planar math, but earth is curved
-    cbsa_projected = cbsa_4326.to_crs(epsg=3857)
-
-    centroids_projected = cbsa_projected.geometry.centroid
-
-    # Reproject back to Lat/Lon
-    centroids = centroids_projected.to_crs(epsg=4326)
-    cbsa_gdf["centroid_lat"] = centroids.y
-    cbsa_gdf["centroid_lon"] = centroids.x
-
     cbsa_name_lower = cbsa_gdf["name_lower"]
     cbsa_name_upper = cbsa_gdf["NAME"].astype(str).str.upper()
 
@@ -165,6 +228,7 @@ def build_city_cbsa_polygons(
         city = str(row["city"])
         city_full = str(row.get("city_full", city)).strip()
         avg_value = row["avg_metric_value"]
+        ranks = {col: row[col] for col in ("rank", "rank_total", "percentile") if col in row}
         lat0 = float(row.get("lat", np.nan))
         lon0 = float(row.get("lon", np.nan))
 
@@ -185,7 +249,10 @@ def build_city_cbsa_polygons(
                         "city_full": city_full,
                         "metro_name": city_full,
                         "avg_metric_value": avg_value,
+                        "centroid_lat": best["centroid_lat"],
+                        "centroid_lon": best["centroid_lon"],
                         "geometry": best.geometry,
+                        **ranks,
                     }
                 )
                 continue
@@ -240,7 +307,10 @@ def build_city_cbsa_polygons(
                 "city_full": city_full,
                 "metro_name": city_full,
                 "avg_metric_value": avg_value,
+                "centroid_lat": best["centroid_lat"],
+                "centroid_lon": best["centroid_lon"],
                 "geometry": best.geometry,
+                **ranks,
             }
         )
 
@@ -250,7 +320,8 @@ def build_city_cbsa_polygons(
         )
 
     gdf_out = gpd.GeoDataFrame(records, geometry="geometry", crs=cbsa_gdf.crs)
-    gdf_out = compute_rankings(gdf_out, "avg_metric_value", "city")
+    if "rank" not in gdf_out.columns:
+        gdf_out = compute_rankings(gdf_out, "avg_metric_value", "city")
     return gdf_out
 
 
@@ -0,0 +1,156 @@
+# map_component.py
+"""
+Patch-based rendering of the metro / ZIP choropleths.
+
+st.plotly_chart re-sends the whole figure (GeoJSON included) on every
+rerun, and a key that changes with the year remounts the chart. The
+choropleth_map component (components/choropleth_map) keeps one Plotly
+instance per key instead, and sends each part only when needed:
+
+    - geometry : the GeoJSON, identified by a geometry version (hash of the
+                 polygons' keys and bounds). The browser keeps it in
+                 IndexedDB and asks for it only when it has no copy, so
+                 repeat visits and drill-downs don't re-download polygons
+    - base     : the figure without GeoJSON, sent when the version changes
+    - patch    : per-trace arrays and styles that change with year, metric,
+                 theme or selection (z, zmin/zmax, customdata, hover text,
+                 colors, overlay locations), applied client-side with
+                 Plotly.restyle / relayout
+
+Clicks and lasso selections come back as component values with a sequence
+number; each is handled once. Clicks are returned shaped like a
+st.plotly_chart selection event, so events.extract_*_from_event work
+unchanged; lasso selections go to an on_lasso callback.
+"""
+
+import hashlib
+import json
+import os
+from functools import partial
+from types import SimpleNamespace
+
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+import streamlit.components.v1 as components
+from plotly.utils import PlotlyJSONEncoder
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "choropleth_map")
+_choropleth_map = components.declare_component("choropleth_map", path=_FRONTEND_DIR)
+
+# Attributes patched on the base layer and on the ZIP outline overlay
+BASE_TRACE_ATTRS = [
+    "z",
+    "zmin",
+    "zmax",
+    "customdata",
+    "text",
+    "hovertemplate",
+    "colorscale",
+    "colorbar",
+    "marker.line.color",
+]
+OVERLAY_TRACE_ATTRS = ["locations", "z", "customdata"]  # polygons: the base geometry
+LAYOUT_ATTRS = ["mapbox.style", "hoverlabel.bgcolor"]
+
+MAP_CONFIG = {"scrollZoom": True, "displaylogo": False}
+
+
+def geometry_version(level: str, gdf, key_col: str) -> str:
+    """
+    Version of a polygon set: same keys in the same order with the same
+    bounds → same GeoJSON, so the browser's cached copy can be reused.
+    """
+    keys = pd.util.hash_pandas_object(gdf[key_col].astype(str), index=False)
+    bounds = pd.util.hash_pandas_object(gdf.geometry.bounds.round(6), index=False)
+    digest = hashlib.sha1(keys.to_numpy().tobytes() + bounds.to_numpy().tobytes()).hexdigest()[:16]
+    return f"{level}:{digest}"
+
+
+def _get_path(obj, path: str):
+    for part in path.split("."):
+        obj = obj[part]
+    return obj
+
+
+def _to_json(obj):
+    return json.loads(json.dumps(obj, cls=PlotlyJSONEncoder))
+
+
+def build_patch(fig) -> dict:
+    """Changed-by-rerun parts of a choropleth figure, as restyle / relayout updates."""
+    traces = [{attr: _get_path(fig.data[0], attr) for attr in BASE_TRACE_ATTRS}]
+    if len(fig.data) > 1:
+        traces.append({attr: _get_path(fig.data[1], attr) for attr in OVERLAY_TRACE_ATTRS})
+    layout = {attr: _get_path(fig.layout, attr) for attr in LAYOUT_ATTRS}
+    patch = _to_json({"traces": traces, "layout": layout})
+    patch["revision"] = hashlib.sha1(json.dumps(patch, sort_keys=True).encode()).hexdigest()[:16]
+    return patch
+
+
+def base_figure_json(fig) -> dict:
+    """
+    The figure as JSON without GeoJSON (the browser holds the geometry).
+    The traces' GeoJSON is detached while serializing, so it is never
+    encoded here; the caller must hold the figure (figure_cache.checkout).
+    """
+    geojsons = [trace.geojson for trace in fig.data]
+    fig.update_traces(geojson=None)
+    try:
+        return json.loads(pio.to_json(fig, validate=False))
+    finally:
+        for trace, geojson in zip(fig.data, geojsons):
+            trace.geojson = geojson
+
+
+def _new_request(key: str) -> dict:
+    """The component's need_base request, if it hasn't been answered yet."""
+    value = st.session_state.get(key) or {}
+    seq_key = f"_{key}_seq"
+    if value.get("event") == "need_base" and value.get("seq", 0) > st.session_state.get(seq_key, 0):
+        st.session_state[seq_key] = value["seq"]
+        return value
+    return {}
+
+
+def _lasso_callback(key: str, on_lasso):
+    """on_change handler: pass a new lasso selection's points to on_lasso."""
+    value = st.session_state.get(key) or {}
+    seq_key = f"_{key}_seq"
+    if value.get("event") == "lasso" and value.get("seq", 0) > st.session_state.get(seq_key, 0):
+        st.session_state[seq_key] = value["seq"]
+        on_lasso(value.get("points", []))
+
+
+def choropleth_map(fig, version: str, key: str, height: int = 650, on_lasso=None):
+    """
+    Render `fig` through the patching component under a stable key.
+    `version` is the geometry_version of the figure's polygons. Lasso
+    selections call on_lasso(points) as a widget callback (so it may set
+    other widgets' state). Returns a click event (st.plotly_chart selection
+    shape) the first time it is seen, else None.
+    """
+    base_key, seq_key = f"_{key}_base", f"_{key}_seq"
+    request = _new_request(key)
+    send_base = request.get("figure") or st.session_state.get(base_key) != version
+    send_geometry = request.get("geometry") and request.get("base") == version
+
+    value = _choropleth_map(
+        figure=base_figure_json(fig) if send_base else None,
+        geometry=_to_json(fig.data[0].geojson) if send_geometry else None,
+        base_id=version,
+        patch=build_patch(fig),
+        config=MAP_CONFIG,
+        height=height,
+        key=key,
+        default=None,
+        on_change=partial(_lasso_callback, key, on_lasso) if on_lasso else None,
+    )
+    st.session_state[base_key] = version
+
+    if not value or value.get("seq", 0) <= st.session_state.get(seq_key, 0):
+        return None
+    st.session_state[seq_key] = value["seq"]
+    if value.get("event") != "click" or value.get("base") != version:
+        return None
+    return SimpleNamespace(selection=SimpleNamespace(points=value.get("points", [])))
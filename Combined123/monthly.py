@@ -0,0 +1,240 @@
+# monthly.py
+"""
+Monthly ZIP prices for history drill-down.
+
+The yearly panels average monthly medians away; this module keeps the
+monthly series in a compact ZIP × month store instead of 12× more rows:
+
+    On disk (MONTHLY_STORE_PATH, built by preprocess_monthly_store.py):
+        keys     : city / city_full / zip_code_str, one per row
+        months   : YYYYMM of each column
+        first    : (n,) int32 first price of each row, whole dollars
+        deltas   : (n, m) int32 month-over-month change in dollars
+                   (0 across missing months), which compresses well
+        observed : (n, m) bit-packed mask of months with data
+    In memory:
+        values   : (n, m) float32, NaN where not observed
+
+Long series are downsampled with largest-triangle-three-buckets (LTTB)
+before plotting, which keeps peaks and troughs a plain stride would drop.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config_data import MONTHLY_STORE_PATH, compute_pti
+from mortgage import historical_rate, payment_to_income, scenario_for_metric
+from panel import PTI_METRIC, PRICE_METRIC, get_income_panel, get_metric_panel, history_value_col
+
+MAX_CHART_POINTS = 400  # per series, after LTTB
+
+
+# =========================
+# 1. Delta encoding
+# =========================
+
+def encode_deltas(values: np.ndarray) -> dict:
+    """
+    Whole-dollar delta encoding of a (n, m) float matrix with NaN gaps.
+    Gaps carry the previous price forward (leading gaps the first one),
+    so their deltas are 0; the observed mask restores them on decode.
+    """
+    observed = ~np.isnan(values)
+    filled = (
+        pd.DataFrame(np.round(values))
+        .ffill(axis=1)
+        .bfill(axis=1)
+        .fillna(0)
+        .to_numpy(dtype=np.int64)
+    )
+    deltas = np.zeros(filled.shape, dtype=np.int32)
+    deltas[:, 1:] = np.diff(filled, axis=1)
+    return {
+        "first": filled[:, 0].astype(np.int32),
+        "deltas": deltas,
+        "observed": np.packbits(observed, axis=1),
+    }
+
+
+def decode_deltas(first: np.ndarray, deltas: np.ndarray, observed: np.ndarray) -> np.ndarray:
+    """Inverse of encode_deltas: (n, m) float32 with NaN where not observed."""
+    n_months = deltas.shape[1]
+    values = first[:, None].astype(np.int64) + np.cumsum(deltas, axis=1, dtype=np.int64)
+    mask = np.unpackbits(observed, axis=1, count=n_months).astype(bool)
+    return np.where(mask, values, np.nan).astype(np.float32)
+
+
+# =========================
+# 2. Monthly store
+# =========================
+
+class MonthlyStore:
+    """
+    ZIP × month median sale prices.
+
+    - keys      : DataFrame (city, city_full, zip_code_str), one per row
+    - months    : datetime64[M] of each column
+    - values    : (n, m) float32, NaN where missing
+    - row_index : (city, zip_code_str) → row
+    """
+
+    def __init__(self, keys: pd.DataFrame, months: np.ndarray, values: np.ndarray):
+        self.keys = keys.reset_index(drop=True)
+        self.months = np.asarray(months, dtype="datetime64[M]")
+        self.values = values
+        self.row_index = {
+            k: i for i, k in enumerate(zip(self.keys["city"], self.keys["zip_code_str"]))
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_rows(cls, rows: pd.DataFrame) -> "MonthlyStore":
+        """Build from load_monthly_rows() output (mean per ZIP and month)."""
+        wide = rows.pivot_table(
+            index=["city", "city_full", "zip_code_str"],
+            columns="month",
+            values="median_sale_price",
+            aggfunc="mean",
+        )
+        months = pd.period_range(wide.columns.min(), wide.columns.max(), freq="M").to_timestamp()
+        wide = wide.reindex(columns=months)
+        return cls(
+            wide.index.to_frame(index=False),
+            months.to_numpy().astype("datetime64[M]"),
+            wide.to_numpy(dtype=np.float32),
+        )
+
+    def save(self, path: str = MONTHLY_STORE_PATH):
+        months = self.months.astype(object)
+        np.savez_compressed(
+            path,
+            city=self.keys["city"].to_numpy(dtype=str),
+            city_full=self.keys["city_full"].to_numpy(dtype=str),
+            zip_code_str=self.keys["zip_code_str"].to_numpy(dtype=str),
+            months=np.array([m.year * 100 + m.month for m in months], dtype=np.int32),
+            **encode_deltas(self.values.astype(float)),
+        )
+
+    @classmethod
+    def load(cls, path: str = MONTHLY_STORE_PATH) -> "MonthlyStore":
+        with np.load(path) as data:
+            keys = pd.DataFrame(
+                {col: data[col] for col in ("city", "city_full", "zip_code_str")}
+            )
+            yyyymm = data["months"]
+            months = np.array(
+                [f"{m // 100:04d}-{m % 100:02d}" for m in yyyymm], dtype="datetime64[M]"
+            )
+            values = decode_deltas(data["first"], data["deltas"], data["observed"])
+        return cls(keys, months, values)
+
+    def series(self, key) -> pd.DataFrame:
+        """month / price rows of one ZIP (months without data dropped)."""
+        row = self.row_index.get(key)
+        if row is None:
+            return pd.DataFrame(columns=["month", "price"])
+        out = pd.DataFrame(
+            {"month": self.months.astype("datetime64[ns]"), "price": self.values[row].astype(float)}
+        )
+        return out[out["price"].notna()].reset_index(drop=True)
+
+
+@st.cache_resource(show_spinner="🗓️ Loading monthly prices...")
+def get_monthly_store():
+    """Process-wide MonthlyStore, or None when preprocess_monthly_store.py hasn't run."""
+    if not os.path.exists(MONTHLY_STORE_PATH):
+        return None
+    return MonthlyStore.load(MONTHLY_STORE_PATH)
+
+
+def get_zip_monthly_history(city: str, zip_code: str, metric_type: str) -> pd.DataFrame:
+    """
+    Monthly history of one ZIP, shaped like get_zip_history but with a
+    month column (and a fractional year for plotting on the yearly axis).
+    PTI and payment-to-income use the year's per-capita income (and rate).
+    Empty without a monthly store.
+    """
+    value_col = history_value_col(metric_type)
+    store = get_monthly_store()
+    if store is None:
+        return pd.DataFrame(columns=["month", "year", value_col])
+
+    out = store.series((city, zip_code))
+    out["year"] = out["month"].dt.year + (out["month"].dt.month - 1) / 12
+    if metric_type == PRICE_METRIC or out.empty:
+        return out[["month", "year", "price"]]
+
+    # Yearly income of this ZIP, aligned with the price panel
+    price_panel = get_metric_panel("zip", PRICE_METRIC)
+    row = price_panel.row_index.get((city, zip_code))
+    if row is None:
+        return pd.DataFrame(columns=["month", "year", value_col])
+    years = out["month"].dt.year.to_numpy()
+    # Months past either end use the edge year's income; a gap year inside
+    # the panel has none (those months drop out below)
+    edge_years = np.clip(years, int(price_panel.years[0]), int(price_panel.years[-1]))
+    pos = np.array([price_panel.year_pos.get(int(y), -1) for y in edge_years], dtype=int)
+    income = get_income_panel("zip")[row]
+    out["per_capita_income"] = np.where(pos >= 0, income[pos], np.nan)
+    out["median_sale_price"] = out["price"]
+
+    if metric_type == PTI_METRIC:
+        out = compute_pti(out)
+    else:
+        scenario = scenario_for_metric(metric_type)
+        rate = historical_rate(years) if scenario.rate_pct is None else scenario.rate_pct
+        out[value_col] = payment_to_income(
+            out["price"].to_numpy(), out["per_capita_income"].to_numpy(), rate, scenario
+        )
+        out = out[np.isfinite(out[value_col])]
+    return out[["month", "year", value_col]].reset_index(drop=True)
+
+
+# =========================
+# 3. Downsampling
+# =========================
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int = MAX_CHART_POINTS) -> np.ndarray:
+    """
+    Indices of the points kept by largest-triangle-three-buckets
+    downsampling (first and last always kept). Returns all indices when
+    the series is already short enough.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df: pd.DataFrame, x_col: str, y_col: str, n_out: int = MAX_CHART_POINTS) -> pd.DataFrame:
+    """Rows of df kept by LTTB on (x_col, y_col)."""
+    if len(df) <= n_out:
+        return df
+    x = df[x_col].to_numpy()
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[s]").astype(float)
+    return df.iloc[lttb(x, df[y_col].to_numpy(), n_out)]
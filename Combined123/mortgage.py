@@ -0,0 +1,151 @@
+# mortgage.py
+"""
+Mortgage payment-to-income scenarios.
+
+PTI ignores interest rates; this module turns a ZIP's median sale price
+into a monthly housing payment (principal + interest on a fixed-rate
+loan, plus property tax and insurance) and expresses it as a percent of
+monthly per-capita income.
+
+A MortgageScenario fixes the loan terms. Its rate is either a fixed
+percentage or None, meaning "the average 30-year rate of each year"
+from HISTORICAL_MORTGAGE_RATES. Payments broadcast over any array
+shapes, so many rate scenarios × ZIPs × years are one numpy expression.
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Freddie Mac PMMS 30-year fixed, annual average (%)
+HISTORICAL_MORTGAGE_RATES = {
+    2012: 3.66,
+    2013: 3.98,
+    2014: 4.17,
+    2015: 3.85,
+    2016: 3.65,
+    2017: 3.99,
+    2018: 4.54,
+    2019: 3.94,
+    2020: 3.11,
+    2021: 2.96,
+    2022: 5.34,
+    2023: 6.81,
+}
+
+MORTGAGE_METRIC = "Mortgage Payment-to-Income (%)"
+MORTGAGE_AFFORDABLE_PCT = 30.0  # common "no more than 30% of income" rule
+
+
+class MortgageScenario(NamedTuple):
+    down_payment_pct: float = 20.0
+    rate_pct: Optional[float] = None  # None → historical rate of each year
+    term_years: int = 30
+    tax_pct: float = 1.1        # property tax, % of price per year
+    insurance_pct: float = 0.35  # homeowner's insurance, % of price per year
+
+    def label(self) -> str:
+        """Short description; tax / insurance appear only when non-default."""
+        rate = "historical rates" if self.rate_pct is None else f"{self.rate_pct:g}% rate"
+        parts = [f"{self.down_payment_pct:g}% down", f"{self.term_years}y", rate]
+        defaults = type(self)._field_defaults
+        if (self.tax_pct, self.insurance_pct) != (defaults["tax_pct"], defaults["insurance_pct"]):
+            parts.append(f"tax {self.tax_pct:g}% · ins {self.insurance_pct:g}%")
+        return " · ".join(parts)
+
+
+DEFAULT_SCENARIO = MortgageScenario()
+
+_METRIC_PREFIX = "Mortgage Payment-to-Income"
+_NUMBER = r"[-+]?[\d.]+(?:e[-+]?\d+)?"
+# Inverse of mortgage_metric(): the name spells out the whole scenario
+_METRIC_PATTERN = re.compile(
+    rf"^{_METRIC_PREFIX} · (?P<down>{_NUMBER})% down · (?P<term>\d+)y · "
+    rf"(?:historical rates|(?P<rate>{_NUMBER})% rate)"
+    rf"(?: · tax (?P<tax>{_NUMBER})% · ins (?P<ins>{_NUMBER})%)? \(%\)$"
+)
+
+
+def mortgage_metric(scenario: MortgageScenario) -> str:
+    """
+    Metric name of a scenario, usable wherever a metric_type is expected
+    (panels, trends, projections, charts).
+    """
+    return f"{_METRIC_PREFIX} · {scenario.label()} (%)"
+
+
+def is_mortgage_metric(metric_type: str) -> bool:
+    return metric_type.startswith(_METRIC_PREFIX)
+
+
+def scenario_for_metric(metric_type: str) -> MortgageScenario:
+    """
+    Scenario of a mortgage_metric() name, parsed from the name itself so
+    any thread or page gets the same answer. KeyError if it is not one.
+    """
+    match = _METRIC_PATTERN.match(metric_type)
+    if match is None:
+        raise KeyError(f"Not a mortgage scenario metric: {metric_type!r}")
+    defaults = MortgageScenario._field_defaults
+    return MortgageScenario(
+        down_payment_pct=float(match["down"]),
+        rate_pct=None if match["rate"] is None else float(match["rate"]),
+        term_years=int(match["term"]),
+        tax_pct=float(match["tax"]) if match["tax"] else defaults["tax_pct"],
+        insurance_pct=float(match["ins"]) if match["ins"] else defaults["insurance_pct"],
+    )
+
+
+def historical_rate(years) -> np.ndarray:
+    """Average 30-year rate of each year (first / last known year outside the table)."""
+    known = np.array(sorted(HISTORICAL_MORTGAGE_RATES))
+    rates = np.array([HISTORICAL_MORTGAGE_RATES[y] for y in known])
+    pos = np.clip(np.searchsorted(known, np.asarray(years, dtype=int)), 0, len(known) - 1)
+    return rates[pos]
+
+
+# =========================
+# 1. Payment math
+# =========================
+
+def monthly_payment(price, rate_pct, scenario: MortgageScenario = DEFAULT_SCENARIO):
+    """
+    Monthly principal + interest + tax + insurance on `price`; price and
+    rate_pct broadcast against each other.
+    """
+    price = np.asarray(price, dtype=float)
+    principal = price * (1 - scenario.down_payment_pct / 100)
+    r = np.asarray(rate_pct, dtype=float) / 100 / 12
+    n = scenario.term_years * 12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortized = principal * r / (1 - (1 + r) ** -n)
+    p_and_i = np.where(r > 0, amortized, principal / n)
+    escrow = price * (scenario.tax_pct + scenario.insurance_pct) / 100 / 12
+    return p_and_i + escrow
+
+
+def payment_to_income(price, income, rate_pct, scenario: MortgageScenario = DEFAULT_SCENARIO):
+    """Monthly payment as % of monthly per-capita income (all inputs broadcast)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return monthly_payment(price, rate_pct, scenario) / (np.asarray(income, dtype=float) / 12) * 100
+
+
+def add_payment_to_income(df: pd.DataFrame, scenario: MortgageScenario) -> pd.DataFrame:
+    """
+    Rows of df with a valid payment-to-income under `scenario` (same
+    price / income filters as compute_pti), plus a payment_to_income column.
+    """
+    df = df[
+        df["median_sale_price"].notna()
+        & df["per_capita_income"].notna()
+        & (df["median_sale_price"] > 0)
+        & (df["per_capita_income"] >= 5000)
+    ].copy()
+    rate = historical_rate(df["year"]) if scenario.rate_pct is None else scenario.rate_pct
+    df["payment_to_income"] = payment_to_income(
+        df["median_sale_price"].to_numpy(), df["per_capita_income"].to_numpy(), rate, scenario
+    )
+    return df
+
@@ -4,19 +4,24 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-import json
-import os
-import time 
 
 # --- RESTORED IMPORTS ---
-from zip_module import load_city_zip_data, get_zip_coordinates
-from dataprep import load_data, make_city_view_data, RATIO_COL, AFFORDABILITY_THRESHOLD, apply_income_filter, AFFORDABILITY_CATEGORIES, AFFORDABILITY_COLORS, classify_affordability, make_zip_view_data
-from ui_components import income_control_panel, render_manual_input_and_summary, persona_income_slider
+from zip_module import get_income_sweep_index
+from dataprep import load_data, make_city_view_data, make_history_overview, make_income_required_curves, get_income_curve, affordable_share_at_income, income_for_share, RATIO_COL, AFFORDABILITY_THRESHOLD, apply_income_filter, classify_affordability, make_zip_view_data
+from affordability import TIER_LABELS
+from ui_components import income_control_panel, render_manual_input_and_summary, persona_income_slider, render_income_required_curve, mortgage_settings
+from explorer_components import metro_ranking, zip_income_map, load_zip_geojson, zip_geojson_path, prefetch_zip_income_map
+from prefetch import PREFETCH_METROS, likely_next, record_visit, session_prefetch
+from warmup import start_warmup
 
 
 # ---------- Global config ----------
 st.set_page_config(page_title="Design 3 – Price Affordability Finder", layout="wide")
 
+# Process-wide warm-up of the home page's data (see warmup.py); this page
+# waits on none of it
+start_warmup()
+
 # Navigation button to go back to home
 with st.sidebar:
     if st.button("🏠 Back to Home", use_container_width=True, help="Navigate back to the main page"):
@@ -35,11 +40,11 @@ st.markdown(
             <strong>Median Sale Price / Per Capita Income</strong>
     </span><br>
     <small>Lower ratios indicate better affordability. 
-    In this dashboard, cities with a ratio &le; 3.0 are classified as <strong>"Affordable"</strong>.
-    Those with a ratio between 3.1 to 4.0 inclusive are classified as <strong>"Moderately Unaffordable"</strong>.
-    Those with a ratio between 4.1 to 5.0 inclusive are classified as <strong>"Seriously Unaffordable"</strong>.
-    Those with a ratio between 5.1 to 8.9 inclusive are classified as <strong>"Severely Unaffordable"</strong>.
-    Those with a ratios &ge; are classified as <strong>"Impossibly Unaffordable"</strong></small>.
+    In this dashboard, cities with a ratio below 3.0 are classified as <strong>"Affordable"</strong>.
+    Those with a ratio from 3.0 to 3.9 are classified as <strong>"Moderately Unaffordable"</strong>.
+    Those with a ratio from 4.0 to 4.9 are classified as <strong>"Seriously Unaffordable"</strong>.
+    Those with a ratio from 5.0 to 8.9 are classified as <strong>"Severely Unaffordable"</strong>.
+    Those with a ratio of 9.0 or more are classified as <strong>"Impossibly Unaffordable"</strong></small>.
     </div>
     """,
     unsafe_allow_html=True
@@ -58,7 +63,6 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-MAX_ZIP_RATIO_CLIP = 15.0
 
 
 # ---------- Function Definitions ----------
@@ -87,53 +91,6 @@ def year_selector(df: pd.DataFrame, key: str):
 def get_data_cached():
     return load_data()
 
-@st.cache_data
-def calculate_median_ratio_history(dataframe):
-    years = sorted(dataframe["year"].unique())
-    history_data = []
-    for yr in years:
-        city_data_yr = make_city_view_data(dataframe, annual_income=0, year=yr, budget_pct=30)
-        if not city_data_yr.empty and RATIO_COL in city_data_yr.columns:
-            median_ratio = city_data_yr[RATIO_COL].median()
-            history_data.append({"year": yr, "median_ratio": median_ratio})
-    return pd.DataFrame(history_data)
-
-@st.cache_data
-def calculate_category_proportions_history(dataframe):
-    """Calculates the % composition of affordability tiers over time."""
-    years = sorted(dataframe["year"].unique())
-    history_data = []
-    
-    def classify_strict(ratio):
-        if ratio < 3.0: return "Affordable (<3.0)"
-        elif ratio <= 4.0: return "Moderately Unaffordable (3.1-4.0)"
-        elif ratio <= 5.0: return "Seriously Unaffordable (4.1-5.0)"
-        elif ratio <= 9.0: return "Severely Unaffordable (5.1-9.0)" 
-        else: return "Impossibly Unaffordable (>9.0)"
-
-    category_order = [
-        "Affordable (<3.0)", 
-        "Moderately Unaffordable (3.1-4.0)", 
-        "Seriously Unaffordable (4.1-5.0)", 
-        "Severely Unaffordable (5.1-9.0)", 
-        "Impossibly Unaffordable (>9.0)"
-    ]
-
-    for yr in years:
-        city_data_yr = make_city_view_data(dataframe, annual_income=0, year=yr, budget_pct=30)
-        if not city_data_yr.empty and RATIO_COL in city_data_yr.columns:
-            city_data_yr["cat"] = city_data_yr[RATIO_COL].apply(classify_strict)
-            counts = city_data_yr["cat"].value_counts(normalize=True) * 100
-            for cat in category_order:
-                history_data.append({
-                    "year": yr,
-                    "category": cat,
-                    "percentage": counts.get(cat, 0.0)
-                })
-
-    return pd.DataFrame(history_data)
-
-
 # ---------- Load data ----------
 df = get_data_cached()
 if df.empty:
@@ -143,8 +100,6 @@ if df.empty:
 # Initialize session state
 if 'last_drawn_city' not in st.session_state:
     st.session_state.last_drawn_city = None
-if 'last_drawn_income' not in st.session_state: 
-    st.session_state.last_drawn_income = 0
 
 
 # =====================================================================
@@ -157,8 +112,8 @@ max_affordable_price = AFFORDABILITY_THRESHOLD * final_income
 df_filtered_by_income = apply_income_filter(df, final_income)
 
 # Calculate Histories
-df_history = calculate_median_ratio_history(df)
-df_prop_history = calculate_category_proportions_history(df)
+df_history, df_prop_history = make_history_overview(df)
+income_curves = make_income_required_curves(df)
 
 
 # --- [FIX 1] CUSTOM DIVIDER TO REPLACE '---' (REMOVES WHITESPACE) ---
@@ -202,7 +157,7 @@ city_data = make_city_view_data(
 
 # 4. Apply Column Fixes
 if not city_data.empty:
-    city_data["affordability_rating"] = city_data[RATIO_COL].apply(classify_affordability)
+    city_data["affordability_rating"] = classify_affordability(city_data[RATIO_COL])
     gap = city_data[RATIO_COL] - AFFORDABILITY_THRESHOLD
     dist = gap.abs()
     city_data["gap_for_plot"] = np.where(city_data["affordable"], dist, -dist)
@@ -217,105 +172,52 @@ with main_col_left:
     profile_settings_container = st.container(border=True)
     with profile_settings_container:
         st.markdown("### Your Profile & Budget Settings")
-        render_manual_input_and_summary(final_income, persona, max_affordable_price)
+        with st.expander("🏦 Mortgage assumptions", expanded=False):
+            mortgage_scenario = mortgage_settings("d3_mortgage")
+        render_manual_input_and_summary(final_income, persona, max_affordable_price, mortgage_scenario)
+
+        with st.expander("📈 Income needed to afford each ZIP", expanded=False):
+            curve_metro_pairs = (
+                income_curves[income_curves["year"] == selected_year][["city_geojson_code", "city_full"]]
+                .drop_duplicates()
+                .sort_values("city_full")
+            )
+            if curve_metro_pairs.empty:
+                st.caption(f"No ZIP-level prices available for {selected_year}.")
+            else:
+                curve_metro_full = st.selectbox(
+                    "Metro area",
+                    options=curve_metro_pairs["city_full"].tolist(),
+                    key="income_curve_metro",
+                )
+                curve_code = curve_metro_pairs.loc[
+                    curve_metro_pairs["city_full"] == curve_metro_full, "city_geojson_code"
+                ].iloc[0]
+                curve = get_income_curve(income_curves, curve_code, selected_year)
+                render_income_required_curve(
+                    curve, final_income, curve_metro_full,
+                    affordable_share_at_income(curve, final_income),
+                )
+                st.caption(
+                    f"Income needed for half of the ZIPs: **${income_for_share(curve, 50):,.0f}** · "
+                    f"for 90%: **${income_for_share(curve, 90):,.0f}**"
+                )
 
     st.markdown("#### Metro Area Affordability Ranking")
 
     if city_data.empty:
         st.warning(f"No data available for {selected_year}.")
     else:
-        unique_city_pairs = city_data[["city", "city_full"]].drop_duplicates().sort_values("city_full")
-        full_to_clean_city_map = pd.Series(unique_city_pairs["city"].values, index=unique_city_pairs["city_full"]).to_dict()
-
-        selected_full_metros = st.multiselect(
-            "Filter Metro Areas (All selected by default):",
-            options=unique_city_pairs["city_full"].tolist(), 
-            default=unique_city_pairs["city_full"].tolist(), 
-            key="metro_multiselect"
-        )
-        
-        selected_clean_metros = [full_to_clean_city_map[f] for f in selected_full_metros]
-
-        # Sort Option
-        sort_option = st.selectbox(
-            "Sort metro areas by",
-            ["Metro Area Name", "Price to Income Ratio", "Median Sale Price", "Per Capita Income"],
-            key="sort_bar_chart",
-        )
-        
-        plot_data = city_data[city_data["city"].isin(selected_clean_metros)].copy()
-        
-        if plot_data.empty:
-            st.warning("No cities match your current filter selection.")
-        
-        else:
-            # Sort logic
-            if sort_option == "Price to Income Ratio":
-                sorted_data = plot_data.sort_values(RATIO_COL, ascending=True)
-            elif sort_option == "Median Sale Price":
-                sorted_data = plot_data.sort_values("Median Sale Price", ascending=False)
-            elif sort_option == "Per Capita Income":
-                sorted_data = plot_data.sort_values("Per Capita Income", ascending=False)
-            else: 
-                sorted_data = plot_data.sort_values("city_full") 
-
-            # Color logic
-            sorted_data["afford_label"] = sorted_data["affordability_rating"].astype('category')
-            ordered_categories = list(AFFORDABILITY_CATEGORIES.keys())
-            if 'N/A' in sorted_data["afford_label"].unique():
-                ordered_categories.append('N/A')
-            sorted_data["afford_label"] = pd.Categorical(sorted_data["afford_label"], categories=ordered_categories, ordered=True)
-
-            if not sorted_data.empty:
-                fig_city = px.bar(
-                    sorted_data,
-                    x="city",
-                    y=RATIO_COL,
-                    color="afford_label",
-                    color_discrete_map=AFFORDABILITY_COLORS,
-                    labels={
-                        "city": "City",
-                        RATIO_COL: "Price-to-income ratio",
-                        "afford_label": "Affordability Rating",
-                    },
-                    hover_data={
-                        "city_full": True,
-                        "Median Sale Price": ":,.0f",
-                        "Per Capita Income": ":,.0f",
-                        RATIO_COL: ":.2f",
-                        "afford_label": True,
-                    },
-                    height=520, 
-                )
-                
-                # Threshold lines
-                for i, (category, (lower, upper)) in enumerate(AFFORDABILITY_CATEGORIES.items()):
-                    if upper is not None and category != "Affordable":
-                        fig_city.add_hline(
-                            y=upper,
-                            line_dash="dot",
-                            line_color="gray",
-                            annotation_text=f"{category} threshold ({upper:.1f})",
-                            annotation_position="top right" if i % 2 == 0 else "bottom right",
-                            opacity=0.5
-                        )
-
-                fig_city.update_layout(
-                    yaxis_title="Price-to-income ratio",
-                    xaxis_tickangle=-45,
-                    margin=dict(l=20, r=20, t=40, b=80),
-                    bargap=0.05,
-                    bargroupgap=0.0,
-                )
-
-                st.plotly_chart(fig_city, use_container_width=True)
+        # Filter, sort and chart run in the browser: no rerun per change
+        metro_ranking(city_data, selected_year)
 
 
 # --- RIGHT COLUMN: MAP & FILTERS ---
 with main_col_right:
     with st.container(border=True):
         st.markdown("### Adjust Map View Filters")
-        persona_income_slider(final_income, persona) 
+        # The income slider lives in the ZIP map component below
+        persona_income_slider(final_income, persona, show_slider=False)
 
     st.markdown("#### ZIP-level Map (Select Metro Below)")
 
@@ -341,9 +243,10 @@ with main_col_right:
     if city_clicked is None:
         st.info("Select a Metro Area from the dropdown above to view the ZIP-code map.")
     else:
+        # The map is only rebuilt for a new metro/year: the income slider
+        # filters ZIPs in the browser
         map_selection_changed = (selected_map_metro_full != st.session_state.last_drawn_city)
-        income_changed = (final_income != st.session_state.last_drawn_income)
-        should_trigger_spinner = map_selection_changed or income_changed
+        should_trigger_spinner = map_selection_changed
 
         st.markdown(f"**Map for {selected_map_metro_full} ({selected_year})**")
         
@@ -356,90 +259,38 @@ with main_col_right:
                 f'</div>', 
                 unsafe_allow_html=True
             )
-            time.sleep(0.5) 
 
-        # Load Map Data
-        df_zip = load_city_zip_data(city_clicked, df_full=df_filtered_by_income, max_pci=final_income)
-        
-        if "year" in df_zip.columns:
-            df_zip = df_zip[df_zip["year"] == selected_year].copy() 
+        # Reuse this metro's prefetch if it is running; drop the other candidates
+        prefetch = session_prefetch("d3")
+        prefetch.wait((city_clicked, selected_year))
+        prefetch.cancel()
+        record_visit("d3", selected_map_metro_full)
+
+        # Load Map Data: every ZIP of this metro/year (the component applies the income filter)
+        zip_index = get_income_sweep_index()
+        df_zip_map = zip_index.zips_within_income(city_clicked, selected_year, np.inf)
 
-        if df_zip.empty:
+        if df_zip_map.empty:
             if should_trigger_spinner: loading_message_placeholder.empty()
             st.error("No ZIP-level data available for this city/year.")
         else:
-            df_zip_map = get_zip_coordinates(df_zip) 
-            price_col = "median_sale_price"
-            income_col = "per_capita_income"
+            # Read once per process (and possibly prefetched)
+            zip_geojson = load_zip_geojson(city_clicked)
 
-            if df_zip_map.empty or price_col not in df_zip_map.columns:
+            if zip_geojson is None:
                 if should_trigger_spinner: loading_message_placeholder.empty()
-                st.error("Map data processing failed.")
+                st.error(f"GeoJSON file not found for {city_clicked}. Expected path: {zip_geojson_path(city_clicked)}")
             else:
-                if RATIO_COL not in df_zip_map.columns:
-                    denom_zip = df_zip_map[income_col].replace(0, np.nan)
-                    df_zip_map[RATIO_COL] = df_zip_map[price_col] / denom_zip
-                
-                df_zip_map["affordability_rating"] = df_zip_map[RATIO_COL].apply(classify_affordability)
-                df_zip_map["ratio_for_map"] = df_zip_map[RATIO_COL].clip(0, MAX_ZIP_RATIO_CLIP)
-
-                # Fix path: go up one level from pages/ to Combined123/ directory
-                geojson_path = os.path.join(
-                    os.path.dirname(os.path.dirname(__file__)),
-                    "city_geojson",
-                    f"{city_clicked}.geojson", 
-                )
+                if should_trigger_spinner: loading_message_placeholder.empty() 
 
-                if not os.path.exists(geojson_path):
-                    if should_trigger_spinner: loading_message_placeholder.empty()
-                    st.error(f"GeoJSON file not found for {city_clicked}. Expected path: {geojson_path}")
-                else:
-                    with open(geojson_path, "r") as f:
-                        zip_geojson = json.load(f)
-
-                    # --- FIX START: FORCE STRING FORMAT WITH LEADING ZEROS ---
-                    # Boston ZIPs are 02xxx. Integers (2xxx) won't match GeoJSON ("02xxx").
-                    df_zip_map["zip_str_padded"] = df_zip_map["zip_code_int"].astype(str).str.zfill(5)
-                    # --- FIX END --------------------------------------------
-
-                    fig_map = px.choropleth_mapbox(
-                        df_zip_map,
-                        geojson=zip_geojson,
-                        locations="zip_str_padded", # UPDATED: Use the padded string column
-                        featureidkey="properties.ZCTA5CE10",
-                        color="ratio_for_map", 
-                        color_continuous_scale="RdYlGn_r",
-                        range_color=[0, MAX_ZIP_RATIO_CLIP],
-                        hover_name="zip_code_str",
-                        hover_data={
-                            price_col: ":,.0f",
-                            income_col: ":,.0f",
-                            RATIO_COL: ":.2f",
-                            "affordability_rating": True,
-                        },
-                        mapbox_style="carto-positron",
-                        center={
-                            "lat": df_zip_map["lat"].mean(),
-                            "lon": df_zip_map["lon"].mean(),
-                        },
-                        zoom=10,
-                        height=520,
-                    )
-
-                    fig_map.update_layout(
-                        margin=dict(l=0, r=0, t=0, b=0),
-                        coloraxis_colorbar=dict(
-                            title="Price-to-income ratio",
-                            tickformat=".1f",
-                        ),
-                    )
-                    
-                    if should_trigger_spinner: loading_message_placeholder.empty() 
-
-                    st.plotly_chart(fig_map, use_container_width=True, config={"scrollZoom": True})
-                    
-                    st.session_state.last_drawn_city = selected_map_metro_full 
-                    st.session_state.last_drawn_income = final_income
+                zip_income_map(
+                    df_zip_map,
+                    zip_geojson,
+                    version=f"{city_clicked}:{selected_year}",
+                    income=final_income,
+                )
+                
+                st.session_state.last_drawn_city = selected_map_metro_full 
 
         # --- CITY SNAPSHOT DETAILS ---
         st.markdown("")
@@ -464,6 +315,24 @@ with main_col_right:
                 with snap_col2:
                     st.caption("The map displays price-to-income ratios calculated at the ZIP-code level.")
 
+        # --- PREFETCH: maps the user is likely to open next ---
+        # Next dropdown entry, most opened metros, most affordable metros
+        metro_codes = (
+            df_filtered_by_income.drop_duplicates("city_full")
+            .set_index("city_full")["city_geojson_code"]
+        )
+        next_pos = map_city_options_full.index(selected_map_metro_full) + 1
+        next_metro = map_city_options_full[next_pos] if next_pos < len(map_city_options_full) else None
+        most_affordable = [
+            m for m in city_data.sort_values(RATIO_COL)["city_full"]
+            if m in metro_codes.index and m != selected_map_metro_full
+        ][:PREFETCH_METROS]
+        session_prefetch("d3").replace({
+            (metro_codes[m], selected_year): prefetch_zip_income_map(metro_codes[m])
+            for m in likely_next(next_metro, most_affordable, "d3")
+            if m in metro_codes.index and m != selected_map_metro_full
+        })
+
 # =====================================================================
 #   SECTION 4: OPTIONAL SPLIT CHART (BY CATEGORY)
 # =====================================================================
@@ -472,58 +341,9 @@ st.markdown("---")
 st.markdown("### Advanced Metro Area Comparisons by Affordability Category")
 
 with st.expander("Show breakdown by Affordability Rating"):
-    if 'sorted_data' in locals() and not sorted_data.empty:
-        
-        # Define the exact order and list of categories to iterate through
-        categories_to_plot = [
-            "Affordable",
-            "Moderately Unaffordable",
-            "Seriously Unaffordable",
-            "Severely Unaffordable",
-            "Impossibly Unaffordable"
-        ]
-
-        for cat in categories_to_plot:
-            # Filter data for just this category
-            cat_data = sorted_data[sorted_data["affordability_rating"] == cat].copy()
-            
-            # Create a visual header
-            st.markdown(f"**{cat}**")
-            
-            if cat_data.empty:
-                st.info(f"No cities in the current selection fall into the '{cat}' category.")
-            else:
-                # Sort by ratio for the chart (lowest to highest for that group)
-                cat_data = cat_data.sort_values(RATIO_COL, ascending=True)
-                
-                fig_cat = px.bar(
-                    cat_data,
-                    x="city",
-                    y=RATIO_COL,
-                    color="affordability_rating",
-                    color_discrete_map=AFFORDABILITY_COLORS,
-                    # We hide the legend because the title explains the category
-                    labels={"city": "City", RATIO_COL: "Price-to-income ratio"},
-                    hover_data={
-                        "city_full": True, 
-                        "Median Sale Price": ":,.0f", 
-                        RATIO_COL: ":.2f",
-                        "affordability_rating": False # redundant in hover
-                    },
-                    height=300,
-                )
-                
-                fig_cat.update_layout(
-                    xaxis_tickangle=-45, 
-                    bargap=0.2,
-                    showlegend=False, # Hide legend as color is uniform per chart
-                    margin=dict(l=0, r=0, t=0, b=0)
-                )
-                st.plotly_chart(fig_cat, use_container_width=True)
-            
-            # Add a small divider between charts
-            st.markdown("<hr style='margin: 10px 0; border: none; border-top: 1px dashed #eee;'>", unsafe_allow_html=True)
-
+    if not city_data.empty:
+        # Follows the metro filter of the ranking chart (shared in the browser)
+        metro_ranking(city_data, selected_year, mode="breakdown")
     else:
         st.info("No data available to show advanced city comparisons based on current filters.")
 
@@ -563,11 +383,11 @@ with st.container(border=True):
         st.markdown("##### Distribution of Affordability Categories Over Time")
         
         custom_colors = {
-            "Affordable (<3.0)": "green",
-            "Moderately Unaffordable (3.1-4.0)": "#FFD700",
-            "Seriously Unaffordable (4.1-5.0)": "orange",
-            "Severely Unaffordable (5.1-9.0)": "red",
-            "Impossibly Unaffordable (>9.0)": "maroon"
+            TIER_LABELS["Affordable"]: "green",
+            TIER_LABELS["Moderately Unaffordable"]: "#FFD700",
+            TIER_LABELS["Seriously Unaffordable"]: "orange",
+            TIER_LABELS["Severely Unaffordable"]: "red",
+            TIER_LABELS["Impossibly Unaffordable"]: "maroon"
         }
 
         fig_prop = px.line(
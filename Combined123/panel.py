@@ -0,0 +1,579 @@
+# panel.py
+"""
+Precomputed metro × year and ZIP × year metric panels.
+
+Each panel is a dense entity × year matrix built once per process from
+load_all_data() (one pivot per level and metric). Year-over-year change
+comes from shifting the matrix by one column, so every per-year view the
+pages need is a column lookup instead of a fresh groupby.
+
+Ranks (1 = highest, same convention as compute_rankings) and percentiles
+are computed for every year at once when a panel is built: metros rank
+nationally, ZIPs within their metro.
+
+Levels:
+    - "metro"     : mean of all rows of a metro (YoY, metro trends)
+    - "metro_avg" : mean of the metro's ZIP values (the metro map's
+                    avg_metric_value)
+    - "zip"       : mean of all rows of a ZIP
+
+Metrics are the fixed METRICS plus mortgage payment-to-income metrics,
+one per MortgageScenario (see mortgage.mortgage_metric), whose panels
+are built on first use and cached per scenario.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config_data import load_all_data, compute_pti
+from mortgage import (
+    DEFAULT_SCENARIO,
+    MortgageScenario,
+    add_payment_to_income,
+    is_mortgage_metric,
+    monthly_payment,
+    mortgage_metric,
+    payment_to_income,
+    scenario_for_metric,
+)
+
+PTI_METRIC = "Price-to-Income Ratio (PTI)"
+PRICE_METRIC = "Median Sale Price"
+METRICS = [PRICE_METRIC, PTI_METRIC]
+
+METRO_KEYS = ["city", "city_full"]
+ZIP_KEYS = ["city", "city_full", "zip_code_str"]
+
+
+def metric_value_col(metric_type: str) -> str:
+    """Column holding the raw values of a metric."""
+    if metric_type == PTI_METRIC:
+        return "PTI"
+    if is_mortgage_metric(metric_type):
+        return "payment_to_income"
+    return "median_sale_price"
+
+
+def history_value_col(metric_type: str) -> str:
+    """Value column of history frames (get_zip_history, create_history_chart)."""
+    if metric_type == PTI_METRIC:
+        return "PTI"
+    if is_mortgage_metric(metric_type):
+        return "payment_to_income"
+    return "price"
+
+
+def metric_short_name(metric_type: str) -> str:
+    """Short label for metric cards, e.g. "Avg PTI"."""
+    if metric_type == PTI_METRIC:
+        return "PTI"
+    if is_mortgage_metric(metric_type):
+        return "Payment Share"
+    return "Price"
+
+
+def format_metric_value(value: float, metric_type: str) -> str:
+    """Display text of one value: 2.35x, $412,000 or 31.4%."""
+    if pd.isna(value):
+        return "N/A"
+    if metric_type == PTI_METRIC:
+        return f"{value:.2f}x"
+    if is_mortgage_metric(metric_type):
+        return f"{value:.1f}%"
+    return f"${value:,.0f}"
+
+
+def metric_rows(df_all: pd.DataFrame, metric_type: str) -> pd.DataFrame:
+    """Rows of df_all that carry a valid value for metric_type."""
+    if metric_type == PTI_METRIC:
+        return compute_pti(df_all)
+    if is_mortgage_metric(metric_type):
+        return add_payment_to_income(df_all, scenario_for_metric(metric_type))
+    return df_all[df_all["median_sale_price"].notna()]
+
+
+# =========================
+# 1. Year panel
+# =========================
+
+class YearPanel:
+    """
+    Dense entity × year matrix of one metric.
+
+    - keys       : DataFrame of identifying columns, one row per entity
+    - years      : contiguous year range, one per matrix column
+    - values     : float matrix (n_entities, n_years), NaN where missing
+    - prev       : values shifted one year right (previous year's value)
+    - yoy_change : values - prev
+    - yoy_pct    : yoy_change / prev * 100, rounded to 0.1
+    - row_index  : lookup key → row, where the key is the city (metro
+                   panels) or (city, zip_code_str) (ZIP panels)
+    - city_rows  : city → array of rows belonging to that metro
+    - rank, rank_total, percentile : per-year ranking matrices (NaN where
+                   the entity has no value), within each metro when
+                   rank_within="city", otherwise across all rows
+    """
+
+    def __init__(self, wide: pd.DataFrame, rank_within: str = None):
+        years = np.arange(int(wide.columns.min()), int(wide.columns.max()) + 1)
+        wide = wide.reindex(columns=years)
+
+        self.keys = wide.index.to_frame(index=False)
+        self.years = years
+        self.year_pos = {int(y): i for i, y in enumerate(years)}
+        self.values = wide.to_numpy(dtype=float)
+        self.prev = wide.shift(1, axis=1).to_numpy(dtype=float)
+        self.yoy_change = self.values - self.prev
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.yoy_pct = np.round(self.yoy_change / self.prev * 100, 1)
+
+        lookup_cols = [c for c in self.keys.columns if c != "city_full"]
+        lookup_keys = (
+            self.keys[lookup_cols[0]]
+            if len(lookup_cols) == 1
+            else pd.MultiIndex.from_frame(self.keys[lookup_cols])
+        )
+        self.row_index = {k: i for i, k in enumerate(lookup_keys)}
+        self.city_rows = self.keys.groupby("city").indices
+
+        groups = self.keys[rank_within].to_numpy() if rank_within else None
+        self.rank, self.rank_total, self.percentile = rank_matrix(self.values, groups)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def column(self, matrix: np.ndarray, year: int) -> np.ndarray:
+        """One year's column of `matrix` (all NaN for years outside the panel)."""
+        pos = self.year_pos.get(int(year))
+        if pos is None:
+            return np.full(len(self.keys), np.nan)
+        return matrix[:, pos]
+
+    def rows_for(self, df: pd.DataFrame) -> np.ndarray:
+        """Panel row of each row of df (matched on the lookup key columns; -1 if absent)."""
+        if "zip_code_str" in self.keys.columns:
+            keys = zip(df["city"], df["zip_code_str"])
+        else:
+            keys = df["city"]
+        return np.fromiter((self.row_index.get(k, -1) for k in keys), dtype=int, count=len(df))
+
+    def history(self, key, value_col: str) -> pd.DataFrame:
+        """year / value_col rows of one entity (years without data dropped)."""
+        row = self.row_index.get(key)
+        if row is None:
+            return pd.DataFrame(columns=["year", value_col])
+        out = pd.DataFrame({"year": self.years, value_col: self.values[row]})
+        return out[out[value_col].notna()].reset_index(drop=True)
+
+    def year_frame(self, year: int, value_col: str) -> pd.DataFrame:
+        """
+        Keys plus value, previous-year value, yoy_change and yoy_pct for one
+        year (same columns compute_yoy produces); entities without a value
+        that year are dropped.
+        """
+        out = self.keys.copy()
+        out[value_col] = self.column(self.values, year)
+        out[f"{value_col}_prev"] = self.column(self.prev, year)
+        out["yoy_change"] = self.column(self.yoy_change, year)
+        out["yoy_pct"] = self.column(self.yoy_pct, year)
+        return out[out[value_col].notna()].reset_index(drop=True)
+
+
+def rank_matrix(values: np.ndarray, groups=None):
+    """
+    Descending "min" ranks of every column of `values`, optionally within
+    row groups, in one grouped rank call. Returns (rank, rank_total,
+    percentile) matrices; missing values stay NaN.
+    """
+    frame = pd.DataFrame(values)
+    present = frame.notna()
+    if groups is None:
+        rank = frame.rank(ascending=False, method="min")
+        total = np.broadcast_to(present.sum().to_numpy(dtype=float), values.shape)
+    else:
+        rank = frame.groupby(groups).rank(ascending=False, method="min")
+        total = present.groupby(groups).transform("sum").to_numpy(dtype=float)
+
+    rank = rank.to_numpy(dtype=float)
+    total = np.where(np.isnan(rank), np.nan, total)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentile = np.round((total - rank + 1) / total * 100, 1)
+    return rank, total, percentile
+
+
+def fill_year_gaps(values: np.ndarray) -> np.ndarray:
+    """
+    Copy of a panel matrix with interior missing years interpolated and
+    leading / trailing ones held at the nearest observed value (all-NaN
+    rows stay NaN).
+    """
+    return (
+        pd.DataFrame(values)
+        .interpolate(axis=1, limit_direction="both")
+        .to_numpy(dtype=float)
+    )
+
+
+def pivot_year_wide(df: pd.DataFrame, key_cols: list, value_col: str) -> pd.DataFrame:
+    """Long rows → key × year frame (mean of value_col per key and year)."""
+    return df.pivot_table(index=key_cols, columns="year", values=value_col, aggfunc="mean")
+
+
+def build_year_panel(df: pd.DataFrame, key_cols: list, value_col: str, rank_within: str = None) -> YearPanel:
+    """Pivot long rows into a YearPanel."""
+    return YearPanel(pivot_year_wide(df, key_cols, value_col), rank_within=rank_within)
+
+
+# =========================
+# 2. Process-wide panels
+# =========================
+
+def _build_level_panels(df_all: pd.DataFrame, metric_type: str) -> dict:
+    """The three level panels of one metric, keyed by level."""
+    rows = metric_rows(df_all, metric_type)
+    value_col = metric_value_col(metric_type)
+    zip_wide = pivot_year_wide(rows, ZIP_KEYS, value_col)
+    return {
+        "metro": build_year_panel(rows, METRO_KEYS, value_col),
+        "metro_avg": YearPanel(zip_wide.groupby(level=METRO_KEYS).mean()),
+        "zip": YearPanel(zip_wide, rank_within="city"),
+    }
+
+
+@st.cache_resource(show_spinner="📈 Precomputing metro and ZIP panels...")
+def load_metric_panels() -> dict:
+    """
+    All panels, keyed by (level, metric_type) with level in
+    {"metro", "metro_avg", "zip"}. Built once per process and shared
+    across sessions.
+    """
+    df_all = load_all_data()
+    panels = {}
+    for metric_type in METRICS:
+        for level, panel in _build_level_panels(df_all, metric_type).items():
+            panels[(level, metric_type)] = panel
+    return panels
+
+
+@st.cache_resource(max_entries=8, show_spinner="🏦 Computing mortgage payments...")
+def load_scenario_panels(scenario: MortgageScenario) -> dict:
+    """Level panels of one mortgage scenario's payment-to-income metric."""
+    return _build_level_panels(load_all_data(), mortgage_metric(scenario))
+
+
+def get_metric_panel(level: str, metric_type: str) -> YearPanel:
+    """Panel for the "metro", "metro_avg" or "zip" level of a metric."""
+    if is_mortgage_metric(metric_type):
+        return load_scenario_panels(scenario_for_metric(metric_type))[level]
+    return load_metric_panels()[(level, metric_type)]
+
+
+@st.cache_resource(show_spinner=False)
+def get_income_panel(level: str) -> np.ndarray:
+    """
+    Per-capita income matrix aligned row for row and year for year with
+    the level's Median Sale Price panel.
+    """
+    price_panel = get_metric_panel(level, PRICE_METRIC)
+    key_cols = list(price_panel.keys.columns)
+    wide = pivot_year_wide(load_all_data(), key_cols, "per_capita_income")
+    index = pd.MultiIndex.from_frame(price_panel.keys) if len(key_cols) > 1 else price_panel.keys[key_cols[0]]
+    return wide.reindex(index=index, columns=price_panel.years).to_numpy(dtype=float)
+
+
+def get_metro_yoy(current_year: int, metric_type: str) -> pd.DataFrame:
+    """
+    Metro-level year-over-year change for either PTI or median sale price.
+
+    metric_type should be one of:
+        - "Price-to-Income Ratio (PTI)"
+        - "Median Sale Price"
+    """
+    return get_metric_panel("metro", metric_type).year_frame(
+        current_year, metric_value_col(metric_type)
+    )
+
+
+def get_zip_yoy(current_year: int, metric_type: str) -> pd.DataFrame:
+    """ZIP-level year-over-year change (same columns as get_metro_yoy)."""
+    return get_metric_panel("zip", metric_type).year_frame(
+        current_year, metric_value_col(metric_type)
+    )
+
+
+# =========================
+# 3. ZIP detail card
+# =========================
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_zip_detail_table(city: str, year: int, metric_type: str, zips: tuple) -> pd.DataFrame:
+    """
+    Detail-card values for every ZIP of one metro, in one vectorized pass.
+
+    zips restricts the table to the ZIPs drawn on the map (the metro
+    average and the deltas are computed over that set); ranks are the
+    panel's within-metro ranks. Indexed by zip_code_str with columns:
+        city_full, value, prev_value, yoy_pct, rank, rank_total,
+        percentile, metro_avg, diff, pct_diff
+    """
+    panel = get_metric_panel("zip", metric_type)
+    rows = panel.city_rows.get(city, np.array([], dtype=int))
+    keys = panel.keys.iloc[rows]
+    keep = keys["zip_code_str"].isin(zips).to_numpy()
+    rows, keys = rows[keep], keys[keep]
+
+    out = pd.DataFrame(
+        {
+            "city_full": keys["city_full"].to_numpy(),
+            "value": panel.column(panel.values, year)[rows],
+            "prev_value": panel.column(panel.prev, year)[rows],
+            "rank": panel.column(panel.rank, year)[rows],
+            "rank_total": panel.column(panel.rank_total, year)[rows],
+            "percentile": panel.column(panel.percentile, year)[rows],
+        },
+        index=pd.Index(keys["zip_code_str"].to_numpy(), name="zip_code_str"),
+    )
+    out = out[out["value"].notna()]
+    out = out[~out.index.duplicated()]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["yoy_pct"] = (out["value"] - out["prev_value"]) / out["prev_value"] * 100
+
+    out["rank"] = out["rank"].astype(int)
+    out["rank_total"] = out["rank_total"].astype(int)
+
+    metro_avg = float(out["value"].mean()) if len(out) else np.nan
+    out["metro_avg"] = metro_avg
+    out["diff"] = out["value"] - metro_avg
+    out["pct_diff"] = out["diff"] / metro_avg * 100 if metro_avg else 0.0
+    return out
+
+
+def get_zip_history(city: str, zip_code: str, metric_type: str) -> pd.DataFrame:
+    """
+    Full year history of one ZIP, shaped for create_history_chart
+    (columns year and history_value_col(metric_type)).
+    """
+    return get_metric_panel("zip", metric_type).history((city, zip_code), history_value_col(metric_type))
+
+
+# =========================
+# 4. Rank queries
+# =========================
+
+def attach_ranks(df: pd.DataFrame, level: str, metric_type: str, year: int) -> pd.DataFrame:
+    """
+    Copy of df with rank, rank_total and percentile from the panel's
+    precomputed ranks for `year`; rows are matched on city (and
+    zip_code_str for ZIP panels). Unmatched rows, and entities without a
+    value that year, get NA ranks.
+    """
+    panel = get_metric_panel(level, metric_type)
+    df = df.copy()
+    rows = panel.rows_for(df)
+    found = rows >= 0
+    for col in ("rank", "rank_total", "percentile"):
+        values = np.full(len(df), np.nan)
+        values[found] = panel.column(getattr(panel, col), year)[rows[found]]
+        df[col] = pd.array(values, dtype="Int64") if col != "percentile" else values
+    return df
+
+
+def get_rank_history(level: str, metric_type: str, key) -> pd.DataFrame:
+    """
+    year / rank / rank_total / percentile of one entity across all years
+    (ZIPs rank within their metro). key as in YearPanel.row_index.
+    """
+    panel = get_metric_panel(level, metric_type)
+    row = panel.row_index.get(key)
+    if row is None:
+        return pd.DataFrame(columns=["year", "rank", "rank_total", "percentile"])
+    out = pd.DataFrame(
+        {
+            "year": panel.years,
+            "rank": panel.rank[row],
+            "rank_total": panel.rank_total[row],
+            "percentile": panel.percentile[row],
+        }
+    )
+    out = out[out["rank"].notna()].reset_index(drop=True)
+    out[["rank", "rank_total"]] = out[["rank", "rank_total"]].astype(int)
+    return out
+
+
+def top_k(
+    level: str, metric_type: str, year: int, k: int = 5, city: str = None, bottom: bool = False
+) -> pd.DataFrame:
+    """
+    The k highest (or lowest, bottom=True) entities of a year, optionally
+    restricted to one metro's rows, via argpartition on the year column.
+    Keys plus value and rank, ordered best-first.
+    """
+    panel = get_metric_panel(level, metric_type)
+    rows = panel.city_rows.get(city, np.array([], dtype=int)) if city else np.arange(len(panel))
+    col = panel.column(panel.values, year)[rows]
+    rows, col = rows[~np.isnan(col)], col[~np.isnan(col)]
+    if len(rows) == 0:
+        return panel.keys.iloc[0:0].assign(value=[], rank=[])
+
+    order_vals = col if bottom else -col
+    k = min(k, len(rows))
+    pick = np.argpartition(order_vals, k - 1)[:k]
+    pick = pick[np.argsort(order_vals[pick], kind="stable")]
+
+    out = panel.keys.iloc[rows[pick]].reset_index(drop=True)
+    out["value"] = col[pick]
+    out["rank"] = panel.column(panel.rank, year)[rows[pick]].astype(int)
+    return out
+
+
+# =========================
+# 5. Mortgage rate scenarios
+# =========================
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_rate_scenarios(level: str, rates: tuple, scenario: MortgageScenario = DEFAULT_SCENARIO) -> np.ndarray:
+    """
+    Payment-to-income of every entity × year of the level's price and
+    income panels under each rate in `rates`, as one broadcast:
+    (n_rates, n_entities, n_years). Cached per (level, rates, scenario).
+    Rows / columns follow the level's Median Sale Price panel.
+    """
+    price = get_metric_panel(level, PRICE_METRIC).values
+    income = get_income_panel(level)
+    rate_axis = np.asarray(rates, dtype=float)[:, None, None]
+    return payment_to_income(price[None], income[None], rate_axis, scenario)
+
+
+def rate_scenario_table(level: str, key, year: int, rates: tuple, scenario: MortgageScenario) -> pd.DataFrame:
+    """
+    One entity's payment under each rate for one year: columns rate_pct,
+    monthly_payment, payment_to_income. Empty if the entity/year is missing.
+    """
+    price_panel = get_metric_panel(level, PRICE_METRIC)
+    row = price_panel.row_index.get(key)
+    pos = price_panel.year_pos.get(int(year))
+    if row is None or pos is None or np.isnan(price_panel.values[row, pos]):
+        return pd.DataFrame(columns=["rate_pct", "monthly_payment", "payment_to_income"])
+
+    shares = get_rate_scenarios(level, rates, scenario)
+    price = price_panel.values[row, pos]
+    return pd.DataFrame(
+        {
+            "rate_pct": list(rates),
+            "monthly_payment": monthly_payment(price, np.asarray(rates, dtype=float), scenario),
+            "payment_to_income": shares[:, row, pos],
+        }
+    )
+
+
+# =========================
+# 6. Year-pair changes
+# =========================
+
+CHANGE_KINDS = ["percent", "absolute"]
+
+
+def change_map_label(metric_type: str, start_year: int, end_year: int, kind: str = "percent") -> str:
+    """
+    Colorbar / metric label of the change map mode, e.g.
+    "Price change 2020–2021 (%)"; absolute changes keep the metric's unit.
+    """
+    label = f"{metric_short_name(metric_type)} change {start_year}–{end_year}"
+    if kind == "percent":
+        return f"{label} (%)"
+    if is_mortgage_metric(metric_type):
+        return f"{label} (% pts)"
+    return label
+
+
+def is_change_label(metric_name: str) -> bool:
+    return " change " in metric_name
+
+
+class YearPairChanges:
+    """
+    Change of every entity of a panel between two of its years, computed
+    on demand from the panel matrix (two column reads and one vector op
+    per pair; the UI shows one pair at a time):
+
+    - absolute : value in end year - value in start year
+    - percent  : absolute / value in start year * 100
+    """
+
+    def __init__(self, panel):
+        self.keys = panel.keys
+        self.year_pos = panel.year_pos
+        self.values = panel.values
+
+    def frame(self, start_year: int, end_year: int, kind: str = "percent") -> pd.DataFrame:
+        """Keys plus "change" from start_year to end_year (entities without both years dropped)."""
+        i = self.year_pos.get(int(start_year))
+        j = self.year_pos.get(int(end_year))
+        out = self.keys.copy()
+        if i is None or j is None:
+            return out.assign(change=np.nan).iloc[0:0]
+        start = self.values[:, i].astype(float)
+        change = self.values[:, j] - start
+        if kind == "percent":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change = change / start * 100
+        out["change"] = change
+        return out[np.isfinite(out["change"])].reset_index(drop=True)
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_year_pair_changes(level: str, metric_type: str) -> YearPairChanges:
+    """YearPairChanges of the level's panel (shares the panel's matrix)."""
+    return YearPairChanges(get_metric_panel(level, metric_type))
+
+
+# =========================
+# 7. Year frames of the home page
+# =========================
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def prepare_year_frames(selected_year, metric_type):
+    """
+    Year × metric inputs of both views, cached so that reruns which keep
+    the year and metric (clicks, dashboard and detail widgets) skip the
+    groupbys over the full table:
+      - df_zip_metric : ZIP rows with metric_value / lat / lon
+      - df_city_map   : metro averages with ranks
+      - zip_pti_year  : ZIP PTI of the year (nearby affordable search)
+    Returns None when the year has no rows at all; frames are empty when
+    the year has no valid values of the metric.
+    """
+    df_all = load_all_data()
+    df_year = df_all[df_all["year"] == selected_year]
+    if df_year.empty:
+        return None
+
+    df_year = metric_rows(df_year, metric_type).copy()
+    value_source_col = metric_value_col(metric_type)
+
+    df_zip_metric = (
+        df_year.groupby(
+            ["city", "city_full", "city_clean", "zip_code_str", "year"],
+            as_index=False,
+        ).agg(
+            metric_value=(value_source_col, "mean"),
+            lat=("lat", "mean"),
+            lon=("lon", "mean"),
+        )
+    )
+
+    df_city = (
+        df_zip_metric.groupby(["city", "city_full", "city_clean"], as_index=False).agg(
+            n=("zip_code_str", "count"),
+            avg_metric_value=("metric_value", "mean"),
+            lat=("lat", "mean"),
+            lon=("lon", "mean"),
+        )
+    )
+    df_city_map = attach_ranks(df_city.reset_index(drop=True), "metro_avg", metric_type, selected_year)
+
+    df_year_pti = df_year if "PTI" in df_year.columns else compute_pti(df_year)
+    zip_pti_year = df_year_pti.groupby("zip_code_str")["PTI"].mean()
+    return df_zip_metric, df_city_map, zip_pti_year
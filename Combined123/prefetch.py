@@ -0,0 +1,154 @@
+# prefetch.py
+"""
+Background prefetch of likely next drill-downs.
+
+The first drill-down into a metro pays for the ZIP shapes, the metro's
+polygons and figure and its detail tables. While the user is still on the
+overview, a small process-wide thread pool warms those caches for the
+metros they are likely to open next (see `likely_next`):
+    - the entry currently picked in a metro selectbox
+    - metros opened most often on this server (VisitCounter)
+    - the top-ranked metros of the current view
+
+Each session keeps one PrefetchBatch per page. A rerun replaces the
+batch's tasks and moving to another page (or drilling down) cancels them:
+queued tasks are dropped and running ones stop before their next step.
+Tasks only fill caches (st.cache_data / st.cache_resource / the figure
+cache), so a failed or cancelled prefetch costs nothing but the work done.
+"""
+
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import streamlit as st
+
+PREFETCH_WORKERS = 2          # pool threads, shared by all sessions
+PREFETCH_METROS = 3           # metros warmed per screen
+PREFETCH_WAIT_SECONDS = 30    # how long a drill-down waits for its running prefetch
+
+
+# =========================
+# 1. Tasks and batches
+# =========================
+
+class PrefetchTask:
+    """A list of steps run in order; cancelling stops before the next step."""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def run(self) -> bool:
+        for step in self.steps:
+            if self.cancelled.is_set():
+                return False
+            step()
+        return True
+
+
+class PrefetchBatch:
+    """One session's prefetch tasks for one page, keyed by what they warm."""
+
+    def __init__(self, pool: ThreadPoolExecutor):
+        self._pool = pool
+        self._tasks = {}  # key → PrefetchTask
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def replace(self, tasks: dict):
+        """
+        Prefetch tasks {key: [step, ...]}. Earlier tasks whose key is not in
+        `tasks` are cancelled; those under the same key keep running.
+        """
+        self.cancel(keep=tasks)
+        for key, steps in tasks.items():
+            if key not in self._tasks:
+                task = PrefetchTask(steps)
+                task.future = self._pool.submit(task.run)
+                self._tasks[key] = task
+
+    def cancel(self, keep=()):
+        """Cancel every task except those under the keys in `keep`."""
+        for key in [k for k in self._tasks if k not in keep]:
+            task = self._tasks.pop(key)
+            task.cancelled.set()
+            task.future.cancel()
+
+    def wait(self, key, timeout: float = PREFETCH_WAIT_SECONDS):
+        """
+        Let a drill-down reuse the prefetch of key: wait for it if it is
+        running, drop it if it is still queued (computing it in the script
+        is then faster than waiting for a free worker).
+        """
+        task = self._tasks.pop(key, None)
+        if task is None or task.future.cancel():
+            return
+        wait([task.future], timeout=timeout)
+
+
+@st.cache_resource(show_spinner=False)
+def get_prefetch_pool() -> ThreadPoolExecutor:
+    """The process-wide, bounded prefetch pool."""
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+def session_prefetch(page: str) -> PrefetchBatch:
+    """This session's PrefetchBatch of page; other pages' batches are cancelled."""
+    batches = st.session_state.setdefault("_prefetch_batches", {})
+    for other, batch in batches.items():
+        if other != page:
+            batch.cancel()
+    if page not in batches:
+        batches[page] = PrefetchBatch(get_prefetch_pool())
+    return batches[page]
+
+
+# =========================
+# 2. Candidates
+# =========================
+
+class VisitCounter:
+    """Process-wide drill-down counts per page (the "popular" candidates)."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, page: str, key):
+        with self._lock:
+            self._counts[(page, key)] += 1
+
+    def most_common(self, page: str, n: int) -> list:
+        with self._lock:
+            ranked = [key for (p, key), _ in self._counts.most_common() if p == page]
+        return ranked[:n]
+
+
+@st.cache_resource(show_spinner=False)
+def get_visit_counter() -> VisitCounter:
+    """The process-wide VisitCounter."""
+    return VisitCounter()
+
+
+def record_visit(page: str, key):
+    """Count a drill-down into key, once per session until it changes."""
+    last = st.session_state.setdefault("_prefetch_visits", {})
+    if last.get(page) != key:
+        last[page] = key
+        get_visit_counter().record(page, key)
+
+
+def likely_next(highlighted, top_ranked, page: str, n: int = PREFETCH_METROS) -> list:
+    """
+    Up to n distinct candidates in priority order: the highlighted entry,
+    then the page's most visited, then top_ranked.
+    """
+    candidates = []
+    popular = get_visit_counter().most_common(page, n)
+    for key in [highlighted, *popular, *top_ranked]:
+        if key is not None and key != "" and key not in candidates:
+            candidates.append(key)
+    return candidates[:n]
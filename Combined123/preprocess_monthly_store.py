@@ -0,0 +1,31 @@
+# preprocess_monthly_store.py
+# Offline step: pivot the raw monthly rows into the delta-encoded ZIP × month
+# price store used for month-level drill-down in the ZIP history chart.
+#
+#   python preprocess_monthly_store.py
+import os
+import time
+
+import numpy as np
+
+from config_data import MONTHLY_STORE_PATH, load_monthly_rows
+from monthly import MonthlyStore
+
+print("Loading monthly rows...")
+t0 = time.time()
+rows = load_monthly_rows()
+print(f"  {len(rows):,} rows in {time.time() - t0:.1f}s")
+
+store = MonthlyStore.from_rows(rows)
+store.save(MONTHLY_STORE_PATH)
+
+# Round-trip check: decoded prices match to the dollar
+check = MonthlyStore.load(MONTHLY_STORE_PATH)
+same_gaps = np.array_equal(np.isnan(check.values), np.isnan(store.values))
+max_err = np.nanmax(np.abs(check.values - store.values)) if len(store) else 0.0
+print(
+    f"Built store: {len(store)} ZIPs × {len(store.months)} months, "
+    f"{os.path.getsize(MONTHLY_STORE_PATH) / 1e6:.1f} MB on disk, "
+    f"gaps preserved: {same_gaps}, max error ${max_err:.2f}"
+)
+print(f"  ✓ Saved → {MONTHLY_STORE_PATH}")
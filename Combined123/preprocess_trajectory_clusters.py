@@ -0,0 +1,37 @@
+# preprocess_trajectory_clusters.py
+# Offline step: cluster metro and ZIP price / PTI trajectories and save the
+# centroids. Re-running after new data arrives warm-starts from the saved
+# centroids, so only the added years need to be fitted in.
+#
+#   python preprocess_trajectory_clusters.py
+import time
+
+from config_data import TRAJECTORY_CLUSTERS_PATH
+from clusters import (
+    CLUSTER_LEVELS,
+    N_CLUSTERS,
+    TrajectoryClusters,
+    load_cluster_centroids,
+    save_cluster_centroids,
+)
+from panel import METRICS, get_metric_panel
+
+previous = load_cluster_centroids()
+models = {}
+
+for metric_type in METRICS:
+    for level in CLUSTER_LEVELS:
+        panel = get_metric_panel(level, metric_type)
+        t0 = time.time()
+        model = TrajectoryClusters.fit(
+            panel, N_CLUSTERS[level], previous=previous.get((level, metric_type))
+        )
+        models[(level, metric_type)] = model
+        print(
+            f"{level:>5} · {metric_type}: {len(model)} clusters over "
+            f"{(model.labels > 0).sum()} of {len(panel)} rows, "
+            f"{model.n_iter} iterations in {time.time() - t0:.2f}s"
+        )
+
+save_cluster_centroids(models)
+print(f"  ✓ Saved → {TRAJECTORY_CLUSTERS_PATH}")
@@ -0,0 +1,33 @@
+# preprocess_zip_adjacency.py
+# Offline step: build the queen-contiguity ZIP adjacency graph used by the
+# "Nearby affordable ZIPs" panel and save it as CSR arrays.
+#
+#   python preprocess_zip_adjacency.py [tolerance_m]
+import sys
+import time
+
+from config_data import ZIP_ADJACENCY_PATH
+from geo_utils import load_zcta_shapes, load_equal_area_geometry
+from spatial_index import ZipAdjacencyGraph
+
+tolerance_m = float(sys.argv[1]) if len(sys.argv) > 1 else 50.0
+
+print("Loading ZCTA shapes (this may take ~20–40 seconds)...")
+zcta = load_zcta_shapes()
+geoms = load_equal_area_geometry("zcta")
+
+t0 = time.time()
+graph = ZipAdjacencyGraph.from_polygons(
+    zcta["zip_code_str"].to_numpy(),
+    geoms.to_numpy(),
+    zcta["centroid_lon"].to_numpy(),
+    zcta["centroid_lat"].to_numpy(),
+    tolerance_m=tolerance_m,
+)
+print(
+    f"Built graph: {len(graph)} ZIPs, {len(graph.indices)} directed edges "
+    f"in {time.time() - t0:.1f}s"
+)
+
+graph.save(ZIP_ADJACENCY_PATH)
+print(f"  ✓ Saved → {ZIP_ADJACENCY_PATH}")
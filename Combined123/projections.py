@@ -0,0 +1,149 @@
+# projections.py
+"""
+Forward projections of the metro × year and ZIP × year panels.
+
+Every entity of a panel gets a simple trend model fitted in one batched
+least-squares solve over the panel matrix (missing years get zero weight):
+    - "linear"     : value ≈ a + b·t
+    - "log-linear" : log(value) ≈ a + b·t  (constant growth rate)
+Damping (0 < phi < 1) flattens the slope with the horizon the way a
+damped-trend model does: the h-th projected step adds b·phi^h.
+
+Projections come with approximate 95% prediction bands from each row's
+residual variance.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from panel import get_metric_panel, history_value_col
+
+PROJECTION_MODELS = ["log-linear", "linear"]
+PROJECTION_HORIZON = 5
+DEFAULT_DAMPING = 0.8
+BAND_Z = 1.96
+
+
+# =========================
+# 1. Batched fit
+# =========================
+
+def fit_trend_models(values: np.ndarray, years: np.ndarray, model: str = "log-linear"):
+    """
+    Fit one trend line per row of `values` (n_entities, n_years).
+
+    Returns (coef, resid_var, n_obs, t_mean, t_ss):
+        coef      : (n, 2) intercept and slope on centered years
+        resid_var : (n,) residual variance (NaN with fewer than 3 points)
+        n_obs     : (n,) number of years used
+        t_mean    : (n,) mean of the years used (the centering)
+        t_ss      : (n,) sum of squared centered years
+    """
+    y = np.log(np.where(values > 0, values, np.nan)) if model == "log-linear" else values
+    w = (~np.isnan(y)).astype(float)
+    y0 = np.nan_to_num(y)
+    t = years.astype(float)
+
+    # Center years per row for a well-conditioned 2 × 2 system
+    n_obs = w.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_mean = (w * t).sum(axis=1) / n_obs
+    tc = t[None, :] - t_mean[:, None]
+
+    # Weighted normal equations X'WX · coef = X'Wy, solved for all rows at once
+    xtx = np.empty((len(y), 2, 2))
+    xtx[:, 0, 0] = n_obs
+    xtx[:, 0, 1] = xtx[:, 1, 0] = (w * tc).sum(axis=1)
+    xtx[:, 1, 1] = t_ss = (w * tc**2).sum(axis=1)
+    xty = np.stack([(w * y0).sum(axis=1), (w * tc * y0).sum(axis=1)], axis=1)
+
+    fit_ok = (n_obs >= 2) & (t_ss > 0)
+    coef = np.full((len(y), 2), np.nan)
+    if fit_ok.any():
+        coef[fit_ok] = np.linalg.solve(xtx[fit_ok], xty[fit_ok][..., None])[..., 0]
+
+    fitted = coef[:, [0]] + coef[:, [1]] * tc
+    sse = (w * np.nan_to_num(y0 - fitted) ** 2).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        resid_var = np.where(n_obs > 2, sse / (n_obs - 2), np.nan)
+    return coef, resid_var, n_obs, t_mean, t_ss
+
+
+class Projection:
+    """
+    Projected values of every entity of a panel.
+
+    - keys      : panel keys (same rows as the panel)
+    - row_index : panel row lookup (city, or (city, zip_code_str))
+    - years     : projected years (last panel year + 1 … + horizon)
+    - mean, lower, upper : (n_entities, horizon) matrices
+    """
+
+    def __init__(self, panel, model: str, damping: float = 1.0, horizon: int = PROJECTION_HORIZON):
+        self.keys = panel.keys
+        self.row_index = panel.row_index
+        self.model = model
+
+        last_year = int(panel.years[-1])
+        self.years = np.arange(last_year + 1, last_year + horizon + 1)
+        coef, resid_var, n_obs, t_mean, t_ss = fit_trend_models(panel.values, panel.years, model)
+
+        # Damped horizon: sum of phi^i for i = 1..h (h itself when phi = 1)
+        h = np.arange(1, horizon + 1, dtype=float)
+        if damping < 1.0:
+            h = np.cumsum(damping ** h)
+        t_eff = (last_year - t_mean)[:, None] + h[None, :]
+
+        center = coef[:, [0]] + coef[:, [1]] * t_eff
+        with np.errstate(divide="ignore", invalid="ignore"):
+            se = np.sqrt(resid_var[:, None] * (1 + 1 / n_obs[:, None] + t_eff**2 / t_ss[:, None]))
+        lo, hi = center - BAND_Z * se, center + BAND_Z * se
+
+        if model == "log-linear":
+            center, lo, hi = np.exp(center), np.exp(lo), np.exp(hi)
+        self.mean, self.lower, self.upper = center, lo, hi
+
+    def year_frame(self, year: int) -> pd.DataFrame:
+        """Keys plus value / lower / upper for one projected year."""
+        pos = int(year) - int(self.years[0])
+        out = self.keys.copy()
+        out["value"] = self.mean[:, pos]
+        out["lower"] = self.lower[:, pos]
+        out["upper"] = self.upper[:, pos]
+        return out[out["value"].notna()].reset_index(drop=True)
+
+    def history(self, key, value_col: str) -> pd.DataFrame:
+        """year / value_col / lower / upper rows of one entity (empty if unknown)."""
+        row = self.row_index.get(key)
+        if row is None:
+            return pd.DataFrame(columns=["year", value_col, "lower", "upper"])
+        out = pd.DataFrame(
+            {
+                "year": self.years,
+                value_col: self.mean[row],
+                "lower": self.lower[row],
+                "upper": self.upper[row],
+            }
+        )
+        return out[out[value_col].notna()].reset_index(drop=True)
+
+
+# =========================
+# 2. Cached projections
+# =========================
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_projection(level: str, metric_type: str, model: str = "log-linear", damping: float = 1.0) -> Projection:
+    """Projection of the ("metro" | "zip", metric_type) panel, fitted once per process."""
+    return Projection(get_metric_panel(level, metric_type), model, damping)
+
+
+def get_zip_projection(city: str, zip_code: str, metric_type: str, model: str, damping: float) -> pd.DataFrame:
+    """
+    Projected years of one ZIP, shaped like get_zip_history (year and
+    history_value_col(metric_type)) plus lower / upper band columns.
+    """
+    return get_projection("zip", metric_type, model, damping).history(
+        (city, zip_code), history_value_col(metric_type)
+    )
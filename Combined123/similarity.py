@@ -0,0 +1,98 @@
+# similarity.py
+"""
+Trajectory similarity search over the ZIP × year panels.
+
+Every ZIP's series of a metric (e.g. 2012–2023 median sale price or
+PTI) is gap-filled, z-normalized and scaled by 1/sqrt(n_years), so the
+dot product of two rows is their Pearson correlation: levels and scale
+drop out and only the shape of the trajectory is compared.
+
+The normalized rows form one float32 matrix per metric, built once per
+process. A query is a single matrix-vector product over all ZIPs
+nationwide (exact nearest neighbors) plus an argpartition for the top N,
+which takes a few milliseconds even for tens of thousands of ZIPs.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from panel import fill_year_gaps, get_metric_panel
+
+MIN_TRAJECTORY_YEARS = 5  # fewer observed years → not indexed
+DEFAULT_NEIGHBORS = 10
+
+
+class TrajectoryIndex:
+    """
+    Z-normalized trajectories of the rows of a ZIP panel.
+
+    - keys      : panel keys (city, city_full, zip_code_str)
+    - row_index : panel row lookup, (city, zip_code_str) → row
+    - rows      : panel row of each indexed trajectory
+    - matrix    : (n_indexed, n_years) float32, unit-norm rows
+    - position  : panel row → row of `matrix` (-1 when not indexed)
+    """
+
+    def __init__(self, panel, min_years: int = MIN_TRAJECTORY_YEARS):
+        self.keys = panel.keys
+        self.row_index = panel.row_index
+        self.years = panel.years
+
+        filled = fill_year_gaps(panel.values)
+        n_observed = (~np.isnan(panel.values)).sum(axis=1)
+        mean = filled.mean(axis=1, keepdims=True)
+        std = filled.std(axis=1, keepdims=True)
+
+        # Flat series have no shape to compare
+        usable = (n_observed >= min_years) & (std[:, 0] > 0)
+        self.rows = np.flatnonzero(usable)
+        z = (filled[usable] - mean[usable]) / std[usable]
+        self.matrix = (z / np.sqrt(filled.shape[1])).astype(np.float32)
+
+        self.position = np.full(len(panel.keys), -1, dtype=int)
+        self.position[self.rows] = np.arange(len(self.rows))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def neighbors(self, key, n: int = DEFAULT_NEIGHBORS) -> pd.DataFrame:
+        """
+        The n ZIPs whose trajectories correlate most with `key`'s (key as in
+        YearPanel.row_index), most similar first. Columns: city, city_full,
+        zip_code_str, similarity (Pearson r); empty if key is not indexed.
+        """
+        row = self.row_index.get(key)
+        pos = self.position[row] if row is not None else -1
+        if pos < 0 or len(self.rows) < 2:
+            return pd.DataFrame(columns=list(self.keys.columns) + ["similarity"])
+
+        scores = self.matrix @ self.matrix[pos]
+        scores[pos] = -np.inf
+        n = min(int(n), len(self.rows) - 1)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+
+        out = self.keys.iloc[self.rows[top]].reset_index(drop=True)
+        out["similarity"] = np.clip(scores[top].astype(float), -1.0, 1.0)
+        return out
+
+
+@st.cache_resource(max_entries=8, show_spinner="🔁 Indexing ZIP trajectories...")
+def get_trajectory_index(metric_type: str) -> TrajectoryIndex:
+    """TrajectoryIndex of the ZIP panel of metric_type, built once per process."""
+    return TrajectoryIndex(get_metric_panel("zip", metric_type))
+
+
+def find_similar_zips(
+    city: str, zip_code: str, metric_type: str, year: int, n: int = DEFAULT_NEIGHBORS
+) -> pd.DataFrame:
+    """
+    Nearest trajectories of one ZIP nationwide, plus each match's value
+    in `year` (column "value") for the results table.
+    """
+    panel = get_metric_panel("zip", metric_type)
+    out = get_trajectory_index(metric_type).neighbors((city, zip_code), n)
+    rows = panel.rows_for(out)
+    out["value"] = np.where(rows >= 0, panel.column(panel.values, year)[rows], np.nan)
+    return out
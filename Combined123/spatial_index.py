@@ -0,0 +1,371 @@
+# spatial_index.py
+"""
+Spatial lookup structures used by the map pages.
+
+- PolygonHitIndex: resolve a map click (Plotly location id or point index)
+  to the metro / ZIP polygon that was clicked.
+- ZipAdjacencyGraph: precomputed queen-contiguity graph over ZCTA polygons
+  (CSR arrays) for "nearby ZIPs" searches.
+- ZipCentroidIndex: haversine BallTree over ZIP centroids for radius and
+  k-nearest searches across metro boundaries.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import streamlit as st
+from shapely import STRtree
+from sklearn.neighbors import BallTree
+
+from config_data import ZIP_ADJACENCY_PATH, load_all_data
+
+
+# =========================
+# 1. Polygon hit testing
+# =========================
+
+class PolygonHitIndex:
+    """
+    Click-resolution index over the polygons drawn on a choropleth.
+
+    Built once per set of polygons:
+      - id_to_key : dict mapping the Plotly `locations` id → key (city / ZIP)
+      - keys      : key per trace point, for events that only carry an index
+
+    Choropleth click and lasso events carry a location id or point index,
+    never a lon/lat, so no geometry lookup is needed here.
+    """
+
+    def __init__(self, gdf: gpd.GeoDataFrame, key_col: str, id_col: str = "id"):
+        self.key_col = key_col
+        self.keys = gdf[key_col].astype(str).to_numpy()
+        self.id_to_key = dict(zip(gdf[id_col].astype(str), self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key_for_id(self, location):
+        """Key for a Plotly `location` id, or None."""
+        if location is None:
+            return None
+        return self.id_to_key.get(str(location))
+
+    def key_for_position(self, point_index):
+        """Key for a trace point index, or None."""
+        if point_index is None or not 0 <= int(point_index) < len(self.keys):
+            return None
+        return self.keys[int(point_index)]
+
+
+@st.cache_resource(max_entries=64)
+def get_polygon_hit_index(version: str, _gdf: gpd.GeoDataFrame, key_col: str) -> PolygonHitIndex:
+    """
+    Cached PolygonHitIndex for a set of polygons.
+
+    `version` (map_component.geometry_version of the drawn polygons) is the
+    cache key; the GeoDataFrame itself is not hashed, so the index is
+    rebuilt only when the polygons shown on the map actually change.
+    """
+    return PolygonHitIndex(_gdf, key_col)
+
+
+def build_hit_index(gdf: gpd.GeoDataFrame, key_col: str, version: str) -> PolygonHitIndex:
+    """Hit index of the polygons identified by `version` (their geometry_version)."""
+    return get_polygon_hit_index(version, gdf, key_col)
+
+
+# =========================
+# 2. ZIP adjacency graph
+# =========================
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine_miles(lon1, lat1, lon2, lat2):
+    """Great-circle distance in miles (vectorized over numpy arrays)."""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+class ZipAdjacencyGraph:
+    """
+    Queen-contiguity graph over ZCTA polygons in compressed sparse row form.
+
+    - zips    : ZIP code per row (str)
+    - indptr  : neighbors of row i are indices[indptr[i]:indptr[i + 1]]
+    - indices : neighbor rows
+    - lon/lat : polygon centroids, used for distance ordering
+    """
+
+    def __init__(self, zips, indptr, indices, lon, lat):
+        self.zips = np.asarray(zips).astype(str)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        self.zip_to_row = {z: i for i, z in enumerate(self.zips)}
+
+    def __len__(self):
+        return len(self.zips)
+
+    @classmethod
+    def from_polygons(cls, zips, geoms_equal_area, lon, lat, tolerance_m: float = 50.0):
+        """
+        Build the graph from equal-area (metre) polygons.
+
+        Candidate pairs come from one bulk STRtree query; `tolerance_m`
+        bridges the small slivers the 1:500k generalized shapes leave
+        between polygons that touch in reality.
+        """
+        geoms = np.asarray(geoms_equal_area)
+        tree = STRtree(geoms)
+        if tolerance_m > 0:
+            src, dst = tree.query(geoms, predicate="dwithin", distance=tolerance_m)
+        else:
+            src, dst = tree.query(geoms, predicate="intersects")
+
+        keep = src != dst
+        src, dst = src[keep], dst[keep]
+        # Symmetrize and deduplicate, then sort by source row for CSR
+        edges = np.unique(
+            np.concatenate([np.c_[src, dst], np.c_[dst, src]]), axis=0
+        )
+        indptr = np.zeros(len(geoms) + 1, dtype=np.int64)
+        np.add.at(indptr, edges[:, 0] + 1, 1)
+        indptr = np.cumsum(indptr)
+        return cls(zips, indptr, edges[:, 1], lon, lat)
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            zips=self.zips,
+            indptr=self.indptr,
+            indices=self.indices,
+            lon=self.lon,
+            lat=self.lat,
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["zips"], data["indptr"], data["indices"], data["lon"], data["lat"])
+
+    def _gather_neighbors(self, rows: np.ndarray) -> np.ndarray:
+        """Concatenated neighbor rows of `rows` in one CSR gather."""
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.array([], dtype=self.indices.dtype)
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.indices[offsets + np.arange(total)]
+
+    def neighbors(self, zip_code: str) -> np.ndarray:
+        """ZIP codes sharing a boundary point with zip_code."""
+        row = self.zip_to_row.get(str(zip_code))
+        if row is None:
+            return np.array([], dtype=str)
+        return self.zips[self.indices[self.indptr[row]:self.indptr[row + 1]]]
+
+    def nearby_matching(
+        self,
+        zip_code: str,
+        values: pd.Series,
+        max_value: float,
+        k: int = 5,
+        order: str = "hops",
+        max_hops: int = 8,
+    ) -> pd.DataFrame:
+        """
+        The k ZIPs closest to zip_code whose value is below max_value.
+
+        Breadth-first search over the CSR arrays, one hop ring at a time.
+        - order="hops"     : stop at the first ring that completes k matches,
+                             ties broken by centroid distance
+        - order="distance" : collect matches up to max_hops and return the
+                             k nearest by great-circle distance
+
+        values is a Series of metric values indexed by ZIP code (e.g. PTI for
+        the selected year); ZIPs missing from it never match.
+        """
+        columns = ["zip_code_str", "hops", "distance_mi", "value"]
+        start = self.zip_to_row.get(str(zip_code))
+        if start is None:
+            return pd.DataFrame(columns=columns)
+
+        aligned = values[~values.index.duplicated()].reindex(self.zips).to_numpy(dtype=float)
+        visited = np.zeros(len(self.zips), dtype=bool)
+        visited[start] = True
+        frontier = np.array([start])
+        found_rows, found_hops = [], []
+
+        for hop in range(1, max_hops + 1):
+            ring = np.unique(self._gather_neighbors(frontier))
+            ring = ring[~visited[ring]]
+            if len(ring) == 0:
+                break
+            visited[ring] = True
+
+            match = ring[aligned[ring] < max_value]
+            found_rows.append(match)
+            found_hops.append(np.full(len(match), hop))
+
+            if order == "hops" and sum(len(r) for r in found_rows) >= k:
+                break
+            frontier = ring
+
+        if not found_rows:
+            return pd.DataFrame(columns=columns)
+
+        rows = np.concatenate(found_rows)
+        hops = np.concatenate(found_hops)
+        dist = haversine_miles(
+            self.lon[start], self.lat[start], self.lon[rows], self.lat[rows]
+        )
+        out = pd.DataFrame(
+            {
+                "zip_code_str": self.zips[rows],
+                "hops": hops,
+                "distance_mi": dist.round(1),
+                "value": aligned[rows],
+            }
+        )
+        sort_cols = ["hops", "distance_mi"] if order == "hops" else ["distance_mi"]
+        return out.sort_values(sort_cols).head(k).reset_index(drop=True)
+
+
+@st.cache_resource(show_spinner=False)
+def load_zip_adjacency(path: str = ZIP_ADJACENCY_PATH) -> ZipAdjacencyGraph:
+    """Load the precomputed ZIP adjacency graph (see preprocess_zip_adjacency.py)."""
+    if not os.path.exists(path):
+        raise RuntimeError(
+            f"ZIP adjacency graph not found at '{path}'. "
+            "Run preprocess_zip_adjacency.py to build it."
+        )
+    return ZipAdjacencyGraph.load(path)
+
+
+# =========================
+# 3. ZIP centroid radius search
+# =========================
+
+class ZipCentroidIndex:
+    """
+    Haversine BallTree over ZIP centroids (national coverage).
+
+    - zips   : DataFrame with zip_code_str, city, city_full, lat, lon
+               (one row per ZIP, aligned with the tree)
+    - years  : year per column of the value matrices
+    - price  : ZIP × year mean median_sale_price
+    - income : ZIP × year mean per_capita_income
+    """
+
+    def __init__(self, zips: pd.DataFrame, years=None, price=None, income=None):
+        self.zips = zips.reset_index(drop=True)
+        self.zip_to_row = {z: i for i, z in enumerate(self.zips["zip_code_str"])}
+        coords = np.radians(self.zips[["lat", "lon"]].to_numpy(dtype=float))
+        self.tree = BallTree(coords, metric="haversine")
+
+        self.years = np.asarray(years if years is not None else [], dtype=int)
+        self.year_pos = {int(y): i for i, y in enumerate(self.years)}
+        self.price = price
+        self.income = income
+
+    def __len__(self):
+        return len(self.zips)
+
+    def _result(self, rows, dist_rad) -> pd.DataFrame:
+        out = self.zips.iloc[rows][["zip_code_str", "city", "city_full"]].copy()
+        out["distance_mi"] = (np.asarray(dist_rad) * EARTH_RADIUS_MILES).round(1)
+        out["_row"] = rows
+        return out.reset_index(drop=True)
+
+    def within_radius(self, lon: float, lat: float, miles: float) -> pd.DataFrame:
+        """ZIPs whose centroid is within `miles` of (lon, lat), nearest first."""
+        query = np.radians([[lat, lon]])
+        rows, dist = self.tree.query_radius(
+            query, r=miles / EARTH_RADIUS_MILES, return_distance=True, sort_results=True
+        )
+        return self._result(rows[0], dist[0])
+
+    def nearest(self, lon: float, lat: float, k: int = 10) -> pd.DataFrame:
+        """The k ZIPs with centroids closest to (lon, lat)."""
+        k = min(k, len(self.zips))
+        dist, rows = self.tree.query(np.radians([[lat, lon]]), k=k)
+        return self._result(rows[0], dist[0])
+
+    def centroid_of(self, zip_code: str):
+        """(lon, lat) of a ZIP in the index, or None."""
+        row = self.zip_to_row.get(str(zip_code))
+        if row is None:
+            return None
+        return float(self.zips.at[row, "lon"]), float(self.zips.at[row, "lat"])
+
+    def with_year_values(self, found: pd.DataFrame, year: int) -> pd.DataFrame:
+        """Attach price / income / PTI of `year` to a search result."""
+        col = self.year_pos.get(int(year))
+        found = found.copy()
+        if col is None or self.price is None:
+            found["median_sale_price"] = np.nan
+            found["per_capita_income"] = np.nan
+        else:
+            rows = found["_row"].to_numpy()
+            found["median_sale_price"] = self.price[rows, col]
+            found["per_capita_income"] = self.income[rows, col]
+        found["PTI"] = found["median_sale_price"] / found["per_capita_income"]
+        return found.drop(columns="_row")
+
+
+@st.cache_resource(show_spinner="📍 Indexing ZIP locations...")
+def get_zip_centroid_index() -> ZipCentroidIndex:
+    """
+    Process-wide ZIP centroid index, built once from load_all_data()
+    and shared across sessions.
+    """
+    df_all = load_all_data()
+    df_geo = df_all.dropna(subset=["lat", "lon"])
+    zips = (
+        df_geo.groupby("zip_code_str", as_index=False)
+        .agg(
+            city=("city", "first"),
+            city_full=("city_full", "first"),
+            lat=("lat", "mean"),
+            lon=("lon", "mean"),
+        )
+    )
+    wide = df_geo.pivot_table(
+        index="zip_code_str",
+        columns="year",
+        values=["median_sale_price", "per_capita_income"],
+        aggfunc="mean",
+    ).reindex(zips["zip_code_str"])
+    years = np.array(sorted(df_geo["year"].unique()), dtype=int)
+    price = wide["median_sale_price"].reindex(columns=years).to_numpy(dtype=float)
+    income = wide["per_capita_income"].reindex(columns=years).to_numpy(dtype=float)
+    return ZipCentroidIndex(zips, years, price, income)
+
+
+def search_affordable_within_radius(
+    index: ZipCentroidIndex,
+    lon: float,
+    lat: float,
+    miles: float,
+    year: int,
+    annual_income: float,
+    max_pti: float,
+) -> pd.DataFrame:
+    """
+    ZIPs within `miles` of (lon, lat) with their metric values for `year`.
+
+    A ZIP is flagged affordable when its median sale price is below
+    max_pti × annual_income. ZIPs without data for the year are dropped.
+    """
+    out = index.with_year_values(index.within_radius(lon, lat, miles), year)
+    out = out[out["median_sale_price"].notna()].reset_index(drop=True)
+    out["affordable"] = out["median_sale_price"] < max_pti * annual_income
+    return out
@@ -0,0 +1,7 @@
+# conftest.py
+# The app modules live flat in Combined123/ and are imported by name
+# (streamlit runs from there); make them importable from the tests too.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
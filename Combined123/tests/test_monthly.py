@@ -0,0 +1,73 @@
+# test_monthly.py
+import numpy as np
+import pandas as pd
+
+from monthly import MonthlyStore, decode_deltas, encode_deltas, lttb
+
+
+def _store_with_gaps() -> MonthlyStore:
+    nan = np.nan
+    values = np.array(
+        [
+            [350000, 351200, nan, 349800, 352500, nan],     # gaps inside
+            [nan, nan, 410000, 409500, 412000, 415000],     # leading gap
+            [220000, 221000, 222500, nan, nan, nan],        # trailing gap
+            [nan, nan, nan, nan, nan, nan],                 # no data at all
+        ],
+        dtype=np.float32,
+    )
+    keys = pd.DataFrame(
+        {
+            "city": ["ATL", "ATL", "BOS", "BOS"],
+            "city_full": ["Atlanta Metro Area"] * 2 + ["Boston Metro Area"] * 2,
+            "zip_code_str": ["30301", "30302", "02108", "02109"],
+        }
+    )
+    months = np.arange("2022-10", "2023-04", dtype="datetime64[M]")
+    return MonthlyStore(keys, months, values)
+
+
+def test_delta_encoding_round_trip_keeps_gaps():
+    store = _store_with_gaps()
+    encoded = encode_deltas(store.values.astype(float))
+    decoded = decode_deltas(encoded["first"], encoded["deltas"], encoded["observed"])
+    np.testing.assert_array_equal(np.isnan(decoded), np.isnan(store.values))
+    np.testing.assert_array_equal(decoded, store.values)
+
+
+def test_monthly_store_save_load_round_trip(tmp_path):
+    store = _store_with_gaps()
+    path = str(tmp_path / "monthly.npz")
+    store.save(path)
+    loaded = MonthlyStore.load(path)
+
+    pd.testing.assert_frame_equal(loaded.keys, store.keys)
+    np.testing.assert_array_equal(loaded.months, store.months)
+    np.testing.assert_array_equal(np.isnan(loaded.values), np.isnan(store.values))
+    np.testing.assert_array_equal(loaded.values, store.values)
+    assert loaded.row_index == store.row_index
+
+
+def test_monthly_store_series_drops_missing_months(tmp_path):
+    store = _store_with_gaps()
+    series = store.series(("ATL", "30301"))
+    assert list(series["price"]) == [350000, 351200, 349800, 352500]
+    assert store.series(("BOS", "02109")).empty
+    assert store.series(("XXX", "00000")).empty
+
+
+def test_lttb_keeps_ends_and_spikes():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    y[437] = 25.0
+    keep = lttb(x, y, n_out=100)
+
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 437 in keep
+
+
+def test_lttb_short_series_unchanged():
+    x = np.arange(10, dtype=float)
+    np.testing.assert_array_equal(lttb(x, x, n_out=100), np.arange(10))
@@ -0,0 +1,67 @@
+# test_projections.py
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from projections import Projection, fit_trend_models
+
+
+def _panel(values, years):
+    keys = pd.DataFrame({"city": [f"C{i}" for i in range(len(values))]})
+    return SimpleNamespace(
+        keys=keys,
+        row_index={c: i for i, c in enumerate(keys["city"])},
+        years=np.asarray(years),
+        values=np.asarray(values, dtype=float),
+    )
+
+
+YEARS = np.arange(2015, 2024)
+
+
+def test_linear_series_is_reproduced():
+    line = 200000 + 12500 * (YEARS - 2015)
+    gapped = line.astype(float)
+    gapped[3] = np.nan  # a missing year gets zero weight
+    proj = Projection(_panel([line, gapped], YEARS), "linear", damping=1.0, horizon=3)
+
+    expected = 200000 + 12500 * (np.arange(2024, 2027) - 2015)
+    np.testing.assert_array_equal(proj.years, [2024, 2025, 2026])
+    for row in range(2):
+        np.testing.assert_allclose(proj.mean[row], expected, rtol=1e-9)
+        # No residuals → the band collapses onto the line
+        np.testing.assert_allclose(proj.lower[row], expected, rtol=1e-9)
+        np.testing.assert_allclose(proj.upper[row], expected, rtol=1e-9)
+
+
+def test_constant_growth_is_reproduced_by_log_linear():
+    series = 300000 * 1.05 ** (YEARS - 2015)
+    proj = Projection(_panel([series], YEARS), "log-linear", damping=1.0, horizon=2)
+    np.testing.assert_allclose(
+        proj.mean[0], 300000 * 1.05 ** (np.array([2024, 2025]) - 2015), rtol=1e-9
+    )
+
+
+def test_damping_shrinks_each_projected_step():
+    line = 100.0 + 10.0 * (YEARS - 2015)
+    proj = Projection(_panel([line], YEARS), "linear", damping=0.5, horizon=3)
+    steps = np.diff(np.concatenate([[line[-1]], proj.mean[0]]))
+    np.testing.assert_allclose(steps, [5.0, 2.5, 1.25])
+
+
+def test_rows_without_enough_years_are_not_fitted():
+    values = np.full((2, len(YEARS)), np.nan)
+    values[0, 4] = 150.0
+    coef, resid_var, n_obs, _, _ = fit_trend_models(values, YEARS, "linear")
+    assert np.isnan(coef).all()
+    assert list(n_obs) == [1, 0]
+
+
+@pytest.mark.parametrize("model", ["linear", "log-linear"])
+def test_year_frame_matches_matrix(model):
+    line = 200000 + 12500 * (YEARS - 2015)
+    proj = Projection(_panel([line], YEARS), model, horizon=2)
+    frame = proj.year_frame(2025)
+    assert frame.loc[0, "value"] == pytest.approx(proj.mean[0, 1])
@@ -0,0 +1,145 @@
+# trends.py
+"""
+Multi-year trend statistics over the metro × year and ZIP × year panels.
+
+For a window of years, every entity of a panel gets, in one vectorized
+pass over the panel matrix:
+    - cagr         : compound annual growth rate (%), first to last
+                     observed year in the window
+    - volatility   : standard deviation of year-to-year % changes
+    - max_drawdown : largest peak-to-trough decline (%, ≤ 0)
+    - peak_year    : year of the highest value in the window
+Each statistic also gets a rank column (1 = highest, same convention as
+compute_rankings); metros rank nationally, ZIPs within their metro.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config_data import compute_rankings
+from panel import get_metric_panel
+
+# stat column → display name; all map-able stats are percentages
+TREND_STATS = {
+    "cagr": "CAGR",
+    "volatility": "Volatility",
+    "max_drawdown": "Max drawdown",
+}
+TREND_COLUMNS = list(TREND_STATS) + ["peak_year", "peak_value"]
+
+
+def trend_map_label(stat: str, start_year: int, end_year: int) -> str:
+    """Colorbar / metric label of a trend stat, e.g. "CAGR 2015–2023 (%)"."""
+    return f"{TREND_STATS[stat]} {start_year}–{end_year} (%)"
+
+
+# =========================
+# 1. Vectorized statistics
+# =========================
+
+def compute_trend_stats(values: np.ndarray, years: np.ndarray) -> dict:
+    """
+    Trend statistics of each row of `values` (n_entities, n_years), with
+    NaN marking missing years. Returns column name → array of length n.
+    """
+    n = values.shape[0]
+    valid = ~np.isnan(values)
+    has_any = valid.any(axis=1)
+    rows = np.arange(n)
+
+    # CAGR between the first and last observed years
+    first = valid.argmax(axis=1)
+    last = values.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+    v0, v1 = values[rows, first], values[rows, last]
+    span = (years[last] - years[first]).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = ((v1 / v0) ** (1.0 / span) - 1.0) * 100
+    cagr[~has_any | (span <= 0) | ~(v0 > 0)] = np.nan
+
+    # Year-to-year % changes; volatility needs at least two of them
+    with np.errstate(divide="ignore", invalid="ignore"):
+        changes = (values[:, 1:] / values[:, :-1] - 1.0) * 100
+    n_changes = (~np.isnan(changes)).sum(axis=1)
+    volatility = np.full(n, np.nan)
+    enough = n_changes >= 2
+    if enough.any():
+        volatility[enough] = np.nanstd(changes[enough], axis=1, ddof=1)
+
+    # Drawdown against the running peak (fmax skips missing years)
+    running_peak = np.fmax.accumulate(values, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = (values / running_peak - 1.0) * 100
+    max_drawdown = np.full(n, np.nan)
+    max_drawdown[has_any] = np.nanmin(drawdown[has_any], axis=1)
+
+    # Peak year / value
+    peak_pos = np.where(valid, values, -np.inf).argmax(axis=1)
+    peak_year = np.where(has_any, years[peak_pos], np.nan)
+    peak_value = np.where(has_any, values[rows, peak_pos], np.nan)
+
+    return {
+        "cagr": cagr,
+        "volatility": volatility,
+        "max_drawdown": max_drawdown,
+        "peak_year": peak_year,
+        "peak_value": peak_value,
+    }
+
+
+def _add_rank_columns(table: pd.DataFrame, group_col=None) -> pd.DataFrame:
+    """<stat>_rank for each trend stat (1 = highest), optionally per group."""
+    for stat in TREND_STATS:
+        values = table.groupby(group_col)[stat] if group_col else table[stat]
+        table[f"{stat}_rank"] = values.rank(ascending=False, method="min").astype("Int64")
+    return table
+
+
+# =========================
+# 2. Cached trend tables
+# =========================
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_trend_table(level: str, metric_type: str, start_year: int, end_year: int) -> pd.DataFrame:
+    """
+    Trend statistics of every entity of the ("metro" | "zip", metric_type)
+    panel over [start_year, end_year]. Rows align with the panel's keys, so
+    panel.row_index gives a row position directly.
+
+    Shared across sessions without copying (get_trend_row reads single
+    rows on every ZIP click): callers must not modify the table.
+    """
+    panel = get_metric_panel(level, metric_type)
+    lo = panel.year_pos.get(int(start_year), 0)
+    hi = panel.year_pos.get(int(end_year), len(panel.years) - 1)
+
+    stats = compute_trend_stats(panel.values[:, lo:hi + 1], panel.years[lo:hi + 1])
+    table = panel.keys.copy()
+    for col in TREND_COLUMNS:
+        table[col] = stats[col]
+    table["peak_year"] = table["peak_year"].astype("Int64")
+    return _add_rank_columns(table, group_col="city" if level == "zip" else None)
+
+
+def get_trend_row(level: str, metric_type: str, start_year: int, end_year: int, key):
+    """One entity's trend row (key as in YearPanel.row_index), or None."""
+    row = get_metric_panel(level, metric_type).row_index.get(key)
+    if row is None:
+        return None
+    return get_trend_table(level, metric_type, start_year, end_year).iloc[row]
+
+
+def with_trend_values(
+    df: pd.DataFrame, trends: pd.DataFrame, stat: str, on: list, value_col: str
+) -> pd.DataFrame:
+    """
+    Copy of df with value_col replaced by a trend stat (rows without one
+    dropped) and rank columns recomputed, ready for the choropleths.
+    """
+    out = df.drop(columns=[value_col]).merge(
+        trends[on + [stat]].rename(columns={stat: value_col}), on=on, how="inner"
+    )
+    out = out[out[value_col].notna()].reset_index(drop=True)
+    if out.empty:
+        return out
+    return compute_rankings(out, value_col, on[-1])
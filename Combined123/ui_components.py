@@ -2,6 +2,15 @@
 # Fixing warning message above Exact annual income ($) and cleaning misc captions 
 
 import streamlit as st
+import plotly.graph_objects as go
+
+from mortgage import (
+    DEFAULT_SCENARIO,
+    HISTORICAL_MORTGAGE_RATES,
+    MORTGAGE_AFFORDABLE_PCT,
+    MortgageScenario,
+    monthly_payment,
+)
 
 # New default income values
 PERSONA_DEFAULTS = {
@@ -48,10 +57,13 @@ def get_income_and_persona_logic():
     return final_income, persona
 
 
-def persona_income_slider(final_income, persona):
+def persona_income_slider(final_income, persona, show_slider=True):
     """
     NEW FUNCTION: Renders the Persona selector and the Rough Adjustment Slider.
     (Used in the Map Column)
+
+    show_slider=False leaves the slider out (the D3 page's ZIP map
+    component renders its own, filtering in the browser).
     """
     
     st.markdown("##### Who are you?")
@@ -66,6 +78,9 @@ def persona_income_slider(final_income, persona):
         horizontal=True
     )
     
+    if not show_slider:
+        return
+
     st.markdown("##### Budget settings")
     
     # RENDER SLIDER (Takes full width of the column it's in)
@@ -81,10 +96,60 @@ def persona_income_slider(final_income, persona):
     # st.markdown("---") # Separator
 
 
-def render_manual_input_and_summary(final_income, persona, max_affordable_price):
+def mortgage_settings(key_prefix: str = "mortgage") -> MortgageScenario:
+    """
+    Renders the mortgage assumption inputs and returns the chosen
+    MortgageScenario. key_prefix keeps widget keys unique per page.
+    """
+    col1, col2 = st.columns(2)
+    with col1:
+        down_payment = st.number_input(
+            "Down payment (%)", min_value=0.0, max_value=100.0,
+            value=DEFAULT_SCENARIO.down_payment_pct, step=1.0, key=f"{key_prefix}_down",
+        )
+        tax = st.number_input(
+            "Property tax (%/yr)", min_value=0.0, max_value=5.0,
+            value=DEFAULT_SCENARIO.tax_pct, step=0.1, key=f"{key_prefix}_tax",
+        )
+    with col2:
+        term = st.selectbox("Term (years)", [30, 20, 15], index=0, key=f"{key_prefix}_term")
+        insurance = st.number_input(
+            "Insurance (%/yr)", min_value=0.0, max_value=3.0,
+            value=DEFAULT_SCENARIO.insurance_pct, step=0.05, key=f"{key_prefix}_ins",
+        )
+
+    rate_mode = st.radio(
+        "Interest rate",
+        ["Historical (each year)", "Fixed"],
+        horizontal=True,
+        key=f"{key_prefix}_rate_mode",
+        help="Historical: average 30-year fixed rate of each year (Freddie Mac PMMS).",
+    )
+    rate = None
+    if rate_mode == "Fixed":
+        rate = st.number_input(
+            "Rate (%)", min_value=0.0, max_value=20.0,
+            value=HISTORICAL_MORTGAGE_RATES[max(HISTORICAL_MORTGAGE_RATES)],
+            step=0.25, key=f"{key_prefix}_rate",
+        )
+
+    return MortgageScenario(
+        down_payment_pct=float(down_payment),
+        rate_pct=None if rate is None else float(rate),
+        term_years=int(term),
+        tax_pct=float(tax),
+        insurance_pct=float(insurance),
+    )
+
+
+def render_manual_input_and_summary(final_income, persona, max_affordable_price, scenario=None):
     """
     Renders the Manual Input, Tip, and Affordability Summary Card.
     (Used in the Top Right Profile Column)
+
+    With a MortgageScenario, the card also shows the monthly payment on the
+    max affordable price (at the scenario's rate, or the latest
+    historical rate) and its share of income.
     """
     
     # --- 1. RENDER MANUAL INPUT (Vertical Stack) ---
@@ -107,6 +172,19 @@ def render_manual_input_and_summary(final_income, persona, max_affordable_price)
     st.markdown("---")
     st.markdown("##### Affordability Summary")
 
+    mortgage_line = ""
+    if scenario is not None:
+        rate = scenario.rate_pct
+        if rate is None:
+            rate = HISTORICAL_MORTGAGE_RATES[max(HISTORICAL_MORTGAGE_RATES)]
+        payment = float(monthly_payment(max_affordable_price, rate, scenario))
+        share = payment / (final_income / 12) * 100
+        flag = "✅" if share <= MORTGAGE_AFFORDABLE_PCT else "⚠️"
+        mortgage_line = (
+            f'<p style="margin:0.1rem 0;"><strong>Monthly payment at that price ({rate:g}%):</strong> '
+            f"≈ ${payment:,.0f} · {flag} {share:.0f}% of income</p>"
+        )
+
     st.markdown(
         f"""
         <div style="
@@ -118,10 +196,59 @@ def render_manual_input_and_summary(final_income, persona, max_affordable_price)
             <p style="margin:0.1rem 0;"><strong>Profile:</strong> {persona}</p>
             <p style="margin:0.1rem 0;"><strong>Annual income:</strong> ${int(final_income):,}</p>
             <p style="margin:0.1rem 0;"><strong>Max affordable price using Ratio-to-Income formula:</strong> ≈ ${max_affordable_price:,.0f}</p> 
+            {mortgage_line}
         </div>
         """,
         unsafe_allow_html=True,
     )
+
+
+
+def render_income_required_curve(curve, final_income, metro_label, share_at_income):
+    """
+    Renders the income → affordable-share curve of one metro/year
+    (rows of dataprep.make_income_required_curves), with the user's
+    current income marked. Shows the whole curve without moving the slider.
+    """
+    if curve.empty:
+        st.caption(f"No ZIP-level prices available for {metro_label}.")
+        return
+
+    fig = go.Figure(
+        go.Scatter(
+            x=curve["income_required"],
+            y=curve["affordable_share"],
+            mode="lines",
+            line_shape="hv",
+            line=dict(color="#2ca02c", width=2),
+            customdata=curve["zipcode"].astype(str).str.zfill(5),
+            hovertemplate=(
+                "Income: $%{x:,.0f}<br>"
+                "ZIPs affordable: %{y:.0f}%<br>"
+                "Unlocks ZIP %{customdata}<extra></extra>"
+            ),
+        )
+    )
+    fig.add_vline(x=final_income, line_dash="dash", line_color="gray")
+    fig.add_annotation(
+        x=final_income, y=share_at_income,
+        text=f"You: {share_at_income:.0f}%",
+        showarrow=True, arrowhead=2, ax=40, ay=-30,
+    )
+    fig.update_layout(
+        xaxis_title="Annual income ($)",
+        yaxis_title="% of ZIPs affordable",
+        xaxis_tickformat="$,.0f",
+        yaxis_range=[0, 105],
+        margin=dict(l=20, r=20, t=10, b=40),
+        height=260,
+        showlegend=False,
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(
+        f"At ${int(final_income):,} a year, {share_at_income:.0f}% of ZIP codes in "
+        f"{metro_label} have a price-to-income ratio below the affordability threshold."
+    )
     
     
 income_control_panel = get_income_and_persona_logic
@@ -0,0 +1,108 @@
+# warmup.py
+"""
+Parallel warm-up of the process-wide data at startup.
+
+A fresh process used to load everything in sequence for its first user:
+the housing table, the affordability table, the metro boundaries and
+their matching to metros, and on drill-down the ZIP boundaries. These
+artifacts are independent (or only share the housing table), so
+`start_warmup` submits all of them to a thread pool at once; cold start
+then costs about the slowest artifact instead of their sum.
+
+Streamlit has no server-start hook: the first script run of the process
+(any page) starts the warm-up, later calls return the same Warmup. The
+artifacts are the pages' own cached loaders, so a page that calls one
+while it is still warming waits on that computation (st.cache_* holds
+a per-key compute lock) instead of starting another. Pages only wait on
+what they use (`Warmup.wait_for`); `Warmup.status` reports readiness.
+
+Artifacts:
+    all_data       : load_all_data
+    affordability  : load_affordability_data
+    cbsa_shapes    : load_cbsa_shapes
+    metro_polygons : build_city_cbsa_polygons of the default metro map
+                     (latest year, median sale price)
+    zcta_shapes    : load_zcta_shapes
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from config_data import load_all_data, load_affordability_data
+from geo_utils import build_city_cbsa_polygons, load_cbsa_shapes, load_zcta_shapes
+from panel import PRICE_METRIC, prepare_year_frames
+
+
+def _warm_metro_polygons():
+    """Metro polygons of the map a new session opens on."""
+    latest_year = int(load_all_data()["year"].max())
+    year_frames = prepare_year_frames(latest_year, PRICE_METRIC)
+    if year_frames is None:
+        return
+    # Same frame create_city_choropleth matches (same cache key)
+    df_city = year_frames[1]
+    df_city = df_city[df_city["avg_metric_value"].notna()].copy()
+    if not df_city.empty:
+        build_city_cbsa_polygons(df_city, load_cbsa_shapes(), PRICE_METRIC)
+
+
+WARMUP_ARTIFACTS = {
+    "all_data": load_all_data,
+    "affordability": load_affordability_data,
+    "cbsa_shapes": load_cbsa_shapes,
+    "metro_polygons": _warm_metro_polygons,
+    "zcta_shapes": load_zcta_shapes,
+}
+
+
+class Warmup:
+    """Artifacts loading concurrently, one pool thread each."""
+
+    def __init__(self, artifacts: dict):
+        self.ready_after = {}  # name → seconds from start until it finished
+        self._started = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=len(artifacts), thread_name_prefix="warmup")
+        self._futures = {
+            name: pool.submit(self._load, name, load) for name, load in artifacts.items()
+        }
+        pool.shutdown(wait=False)
+
+    def _load(self, name: str, load):
+        try:
+            load()
+        finally:
+            self.ready_after[name] = time.perf_counter() - self._started
+
+    def status(self) -> dict:
+        """name → "loading", "ready" or "failed"."""
+        return {
+            name: "loading" if not future.done()
+            else "failed" if future.exception() is not None
+            else "ready"
+            for name, future in self._futures.items()
+        }
+
+    def is_ready(self, *names) -> bool:
+        return all(self._futures[name].done() for name in names)
+
+    def wait_for(self, *names, timeout: float = None):
+        """
+        Block until the named artifacts finished loading. Failures are
+        not raised here: the page's own call of the loader retries and
+        reports the error where it is handled today.
+        """
+        wait([self._futures[name] for name in names], timeout=timeout)
+
+    def elapsed(self) -> float:
+        """Seconds since start, or until the last artifact finished."""
+        if self.is_ready(*self._futures):
+            return max(self.ready_after.values(), default=0.0)
+        return time.perf_counter() - self._started
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup() -> Warmup:
+    """The process's Warmup, started by the first call."""
+    return Warmup(WARMUP_ARTIFACTS)
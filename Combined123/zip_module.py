@@ -6,92 +6,127 @@ import numpy as np
 import os
 import json
 import pgeocode
-from dataprep import RATIO_COL, RATIO_COL_ZIP, AFFORDABILITY_CATEGORIES 
-
-
-# Helper function (copied from dataprep.py)
-def classify_affordability_zip(ratio: float) -> str:
-    """Classifies a price-to-income ratio using imported constants."""
-    if pd.isna(ratio): return "N/A"
-    
-    sorted_categories = sorted(AFFORDABILITY_CATEGORIES.items(), 
-                               key=lambda item: item[1][1] if item[1][1] is not None else float('inf'))
-
-    for category, (lower, upper) in sorted_categories:
-        if category == "Affordable":
-            if ratio <= upper: return category
-        elif lower is not None and upper is not None:
-            if lower < ratio <= upper: return category
-        elif lower is not None and upper is not None:
-            if lower < ratio <= upper: return category
-            
-    return "Uncategorized"
-
-
-@st.cache_data(ttl=3600)
-def load_city_zip_data(city_geojson_code: str, df_full: pd.DataFrame, max_pci: float) -> pd.DataFrame:
-    # ------------------------------------------------------------------------
-    # FIX: Added max_pci argument for filtering
-    # ------------------------------------------------------------------------
-    """
-    Filters the pre-loaded full DataFrame (df_full) to a single city 
-    using the GeoJSON code (e.g., ATL) AND filters ZIP codes by max_pci.
-    """
-    # 1. Filter by City (GeoJSON Code)
-    df_city_zip = df_full[df_full["city_geojson_code"] == city_geojson_code].copy()
-
-    # 2. Hard Filter by Income (NEW LOGIC)
-    # Only keep ZIP codes where the per_capita_income is <= user's annual income
-    df_city_zip = df_city_zip[df_city_zip["per_capita_income"] <= max_pci].copy()
-
+from dataprep import load_data, RATIO_COL, RATIO_COL_ZIP, classify_affordability
 
-    # Ensure the required columns exist for subsequent steps
-    required_cols = ["zipcode", "year", "median_sale_price", "per_capita_income", "city_full"]
-    for col in required_cols:
-        if col not in df_city_zip.columns:
-            return pd.DataFrame() 
+MAX_ZIP_RATIO_CLIP = 15.0
 
-    # Ensure zip code columns exist
-    df_city_zip["zip_code_int"] = df_city_zip["zipcode"].astype(str).str.zfill(5)
-    df_city_zip["zip_code_str"] = df_city_zip["zipcode"].astype(str).str.zfill(5)
 
-    return df_city_zip
+def _lookup_zip_coordinates(zip_codes: pd.Series) -> pd.DataFrame:
+    """lat/lon for each 5-digit ZIP string, one pgeocode query per unique ZIP."""
+    unique_zips = pd.Series(zip_codes.unique())
+    nomi = pgeocode.Nominatim("us")
+    geo_df = nomi.query_postal_code(unique_zips.tolist())
+    coords = pd.DataFrame(
+        {"lat": geo_df["latitude"].to_numpy(), "lon": geo_df["longitude"].to_numpy()},
+        index=unique_zips.to_numpy(),
+    )
+    return coords.reindex(zip_codes.to_numpy())
 
 
-@st.cache_data(ttl=3600*24)
-def get_zip_coordinates(df_zip_data: pd.DataFrame) -> pd.DataFrame:
+def _prepare_zip_rows(df_zip_data: pd.DataFrame) -> pd.DataFrame:
     """
-    Enriches ZIP-level data with coordinates and unconditionally calculates the ratio AND rating.
+    One row per (city_geojson_code, year, zipcode) with coordinates, ratio,
+    rating and map color value. HouseTS.csv holds monthly rows; the ZIP's
+    year is the median of its months (as in make_income_required_curves).
     """
-    if df_zip_data.empty:
-        return pd.DataFrame()
-
-    out = df_zip_data.copy()
-    
-    # Use pgeocode for coordinates
-    nomi = pgeocode.Nominatim("us")
-    
-    # Extract list of zip codes
-    zip_list = out["zip_code_str"].tolist()
-    
-    # Query pgeocode for all ZIPs
-    geo_df = nomi.query_postal_code(zip_list)
-    
-    # Add lat/lon back to DataFrame
-    out["lat"] = geo_df["latitude"].values
-    out["lon"] = geo_df["longitude"].values
-
+    out = (
+        df_zip_data.groupby(["city_geojson_code", "year", "zipcode"], as_index=False)
+        .agg(
+            median_sale_price=("median_sale_price", "median"),
+            per_capita_income=("per_capita_income", "median"),
+            city_full=("city_full", "first"),
+        )
+    )
+    out["zip_code_str"] = out["zipcode"].astype(str).str.zfill(5)
+
+    coords = _lookup_zip_coordinates(out["zip_code_str"])
+    out["lat"] = coords["lat"].to_numpy()
+    out["lon"] = coords["lon"].to_numpy()
     out = out.dropna(subset=["lat", "lon"]).copy()
 
     # Calculate ratio using standardized lowercase columns
-    price_col = "median_sale_price"
-    income_col = "per_capita_income"
-    denom = out[income_col].replace(0, np.nan)
-    
-    out[RATIO_COL] = out[price_col] / denom # Generates 'price_to_income_ratio'
-    out["affordability_rating"] = out[RATIO_COL].apply(classify_affordability_zip) # Generates rating
-    
+    denom = out["per_capita_income"].replace(0, np.nan)
+    out[RATIO_COL] = out["median_sale_price"] / denom
+    out["affordability_rating"] = classify_affordability(out[RATIO_COL])
+    out["ratio_for_map"] = out[RATIO_COL].clip(0, MAX_ZIP_RATIO_CLIP)
+
     # Ensure zip_code_int exists for Plotly location lookup
     out["zip_code_int"] = out["zip_code_str"].astype(int)
-    
     return out
+
+
+class IncomeSweepIndex:
+    """
+    ZIP rows (one per ZIP and year) grouped by (city_geojson_code, year),
+    sorted within each group.
+
+    Rows of a group sit in one contiguous block of `frame`, ordered by
+    per_capita_income, so "ZIPs with income at most X" is a prefix of the
+    block found with one searchsorted. Median sale prices of each group are
+    kept in a separately sorted array for "how many ZIPs are below a price"
+    counts. Moving the income slider costs two binary searches instead of a
+    full-table filter.
+    """
+
+    def __init__(self, df_zip_rows: pd.DataFrame):
+        frame = df_zip_rows[
+            df_zip_rows["per_capita_income"].notna() & df_zip_rows["median_sale_price"].notna()
+        ]
+        frame = frame.sort_values(
+            ["city_geojson_code", "year", "per_capita_income"], kind="mergesort"
+        ).reset_index(drop=True)
+        self.frame = frame
+
+        self.income_sorted = frame["per_capita_income"].to_numpy(dtype=float)
+
+        # Group bounds: start/stop rows of each (code, year) block
+        codes = frame["city_geojson_code"].to_numpy()
+        years = frame["year"].to_numpy(dtype=int)
+        new_block = np.ones(len(frame), dtype=bool)
+        new_block[1:] = (codes[1:] != codes[:-1]) | (years[1:] != years[:-1])
+        starts = np.flatnonzero(new_block)
+        stops = np.append(starts[1:], len(frame))
+        self.bounds = {
+            (codes[s], int(years[s])): (int(s), int(e)) for s, e in zip(starts, stops)
+        }
+
+        # Prices sorted within each block (same block bounds)
+        prices = frame["median_sale_price"].to_numpy(dtype=float)
+        self.price_sorted = prices.copy()
+        for start, stop in self.bounds.values():
+            self.price_sorted[start:stop] = np.sort(prices[start:stop])
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _block(self, city_geojson_code: str, year: int):
+        return self.bounds.get((city_geojson_code, int(year)), (0, 0))
+
+    def zips_within_income(self, city_geojson_code: str, year: int, max_pci: float) -> pd.DataFrame:
+        """
+        Rows of one metro/year whose per_capita_income is <= max_pci
+        (the ZIP income filter), already carrying coordinates, ratio,
+        affordability_rating and ratio_for_map.
+        """
+        start, stop = self._block(city_geojson_code, year)
+        cut = start + int(np.searchsorted(self.income_sorted[start:stop], max_pci, side="right"))
+        return self.frame.iloc[start:cut]
+
+    def affordable_count(self, city_geojson_code: str, year: int, max_price: float):
+        """(ZIPs with median_sale_price below max_price, ZIPs in the block)."""
+        start, stop = self._block(city_geojson_code, year)
+        n = int(np.searchsorted(self.price_sorted[start:stop], max_price, side="left"))
+        return n, stop - start
+
+
+@st.cache_resource(show_spinner="🗺️ Indexing ZIP incomes...")
+def get_income_sweep_index() -> IncomeSweepIndex:
+    """
+    Process-wide IncomeSweepIndex over load_data(); coordinates are looked
+    up once here instead of on every slider move.
+    """
+    df = load_data()
+    required_cols = ["city_geojson_code", "zipcode", "year", "median_sale_price", "per_capita_income", "city_full"]
+    if df.empty or any(col not in df.columns for col in required_cols):
+        return IncomeSweepIndex(pd.DataFrame(columns=required_cols))
+    return IncomeSweepIndex(_prepare_zip_rows(df))
@@ -2,6 +2,7 @@
 # Standalone application for Dataset Historical Overview
 import os
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
@@ -131,52 +132,54 @@ def classify_affordability(ratio: float) -> str:
             
     return "Uncategorized"
 
+CATEGORY_ORDER = [
+    "Affordable (<3.0)", 
+    "Moderately Unaffordable (3.1-4.0)", 
+    "Seriously Unaffordable (4.1-5.0)", 
+    "Severely Unaffordable (5.1-9.0)", 
+    "Impossibly Unaffordable (>9.0)"
+]
+
+def make_city_year_table(dataframe):
+    """(year, city) medians and ratio for every year in a single groupby."""
+    city_year = dataframe.groupby(["year", "city_geojson_code"]).agg(
+        median_sale_price=("median_sale_price", "median"),
+        per_capita_income=("per_capita_income", "median"),
+    ).reset_index()
+    city_year[RATIO_COL] = city_year["median_sale_price"] / (city_year["per_capita_income"] * 2.51)
+    return city_year[city_year[RATIO_COL].notna()]
+
 @st.cache_data
 def calculate_median_ratio_history(dataframe):
     """Calculate median price-to-income ratio over time."""
-    years = sorted(dataframe["year"].unique())
-    history_data = []
-    for yr in years:
-        city_data_yr = make_city_view_data(dataframe, annual_income=0, year=yr, budget_pct=30)
-        if not city_data_yr.empty and RATIO_COL in city_data_yr.columns:
-            median_ratio = city_data_yr[RATIO_COL].median()
-            history_data.append({"year": yr, "median_ratio": median_ratio})
-    return pd.DataFrame(history_data)
+    city_year = make_city_year_table(dataframe)
+    return (
+        city_year.groupby("year", as_index=False)[RATIO_COL]
+        .median()
+        .rename(columns={RATIO_COL: "median_ratio"})
+    )
 
 @st.cache_data
 def calculate_category_proportions_history(dataframe):
     """Calculates the % composition of affordability tiers over time."""
-    years = sorted(dataframe["year"].unique())
-    history_data = []
-    
-    def classify_strict(ratio):
-        if ratio < 3.0: return "Affordable (<3.0)"
-        elif ratio <= 4.0: return "Moderately Unaffordable (3.1-4.0)"
-        elif ratio <= 5.0: return "Seriously Unaffordable (4.1-5.0)"
-        elif ratio <= 9.0: return "Severely Unaffordable (5.1-9.0)" 
-        else: return "Impossibly Unaffordable (>9.0)"
-
-    category_order = [
-        "Affordable (<3.0)", 
-        "Moderately Unaffordable (3.1-4.0)", 
-        "Seriously Unaffordable (4.1-5.0)", 
-        "Severely Unaffordable (5.1-9.0)", 
-        "Impossibly Unaffordable (>9.0)"
-    ]
-
-    for yr in years:
-        city_data_yr = make_city_view_data(dataframe, annual_income=0, year=yr, budget_pct=30)
-        if not city_data_yr.empty and RATIO_COL in city_data_yr.columns:
-            city_data_yr["cat"] = city_data_yr[RATIO_COL].apply(classify_strict)
-            counts = city_data_yr["cat"].value_counts(normalize=True) * 100
-            for cat in category_order:
-                history_data.append({
-                    "year": yr,
-                    "category": cat,
-                    "percentage": counts.get(cat, 0.0)
-                })
-
-    return pd.DataFrame(history_data)
+    city_year = make_city_year_table(dataframe)
+
+    # Tiers: <3.0, <=4.0, <=5.0, <=9.0, >9.0 (binned in one vectorized pass)
+    codes = np.where(
+        city_year[RATIO_COL] < 3.0,
+        0,
+        np.searchsorted([4.0, 5.0, 9.0], city_year[RATIO_COL], side="left") + 1,
+    )
+    category = pd.Categorical.from_codes(codes, categories=CATEGORY_ORDER)
+
+    shares = pd.crosstab(city_year["year"], category, normalize="index", dropna=False) * 100
+    return (
+        shares.reindex(columns=CATEGORY_ORDER, fill_value=0.0)
+        .rename_axis(index="year", columns="category")
+        .stack()
+        .rename("percentage")
+        .reset_index()
+    )
 
 
 # ---------- Load data ----------